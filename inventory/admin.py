@@ -1,36 +1,85 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Measurement
+from .models import Measurement, MeasurementDaily, month_buckets
+
+
+class MonthFilter(admin.SimpleListFilter):
+    # filtra por la particion mensual (bucket); las opciones no consultan la tabla
+    title = 'Mes'
+    parameter_name = 'bucket'
+
+    def lookups(self, request, model_admin):
+        today = timezone.localdate()
+        return [(str(bucket), f'{bucket // 100}-{bucket % 100:02d}') for bucket in reversed(month_buckets(today - timedelta(days=365), today))]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(bucket=int(self.value()))
+        return queryset
 
 
 @admin.register(Measurement)
 class MeasurementAdmin(admin.ModelAdmin):
-    list_display = ['id', 'product_info', 'warehouse_info', 'quantity_display', 'measurement_type', 'created_at']
-    list_filter = ['created_at']
-    search_fields = ['product__name', 'warehouse__name']
-    ordering = ['-created_at']
+    list_display = ['id', 'product_info', 'warehouse_info', 'quantity_display', 'measurement_type', 'dateTime']
+    list_filter = [MonthFilter]
+    list_select_related = ['product', 'place']
+    search_fields = ['product__name', 'place__name']
+    ordering = ['-bucket', '-dateTime']  # recorre el índice (bucket, dateTime)
     list_per_page = 30
-    date_hierarchy = 'created_at'
-    
+    show_full_result_count = False
+
+    # solo de insercion: las mediciones se crean al reabastecer y se borran al compactarlas
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # el admin pide este permiso por cada medicion que se borra en cascada (bodega, variable): solo se niega
+        # cuando el borrado sale de la propia admin de mediciones
+        match = getattr(request, 'resolver_match', None)
+        own = f'{self.opts.app_label}_{self.opts.model_name}_'
+        if match is None or not match.url_name or match.url_name.startswith(own):
+            return False
+        return super().has_delete_permission(request, obj)
+
     @admin.display(description='Producto')
     def product_info(self, obj):
-        if hasattr(obj, 'product') and obj.product:
-            return format_html(f'📦 <b>{obj.product.name}</b>')
+        if obj.product:
+            return format_html('📦 <b>{}</b>', obj.product.name)
         return format_html('<span style="color: #6c757d;">-</span>')
-    
+
     @admin.display(description='Bodega')
     def warehouse_info(self, obj):
-        if hasattr(obj, 'warehouse') and obj.warehouse:
-            return format_html(f'📍 {obj.warehouse.name}')
-        return format_html('<span style="color: #6c757d;">-</span>')
-    
-    @admin.display(description='Cantidad', ordering='quantity')
+        return format_html('📍 {}', obj.place.name)
+
+    @admin.display(description='Cantidad', ordering='value')
     def quantity_display(self, obj):
-        if hasattr(obj, 'quantity'):
-            color = '#28a745' if obj.quantity > 0 else '#dc3545'
-            return format_html(f'<span style="color: {color};"><b>{obj.quantity}</b> unidades</span>')
+        if obj.value is not None:
+            color = '#28a745' if obj.value > 0 else '#dc3545'
+            return format_html('<span style="color: {};"><b>{}</b> {}</span>', color, obj.value, obj.unit)
         return format_html('<span style="color: #6c757d;">-</span>')
-    
+
     @admin.display(description='Tipo')
     def measurement_type(self, obj):
         return format_html('<span style="background-color: #E1F5FE; padding: 3px 10px; border-radius: 3px;">Medición</span>')
+
+
+@admin.register(MeasurementDaily)
+class MeasurementDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'product', 'place', 'count', 'total', 'unit', 'min_value', 'max_value']
+    list_filter = [MonthFilter]
+    list_select_related = ['product', 'place']
+    search_fields = ['product__name', 'place__name']
+    ordering = ['-bucket', '-day']
+    list_per_page = 30
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,7 @@
 from django import forms
 from .models import Measurement
 from products.models import Variable
+from orders.routing import zone_choices
 
 class MeasurementForm(forms.ModelForm):
     class Meta:
@@ -23,15 +24,6 @@ class MeasurementForm(forms.ModelForm):
 
 
 class OrderForm(forms.Form):
-    # Zonas de entrega predefinidas con sus coordenadas
-    DELIVERY_ZONES = [
-        ('norte', 'Zona Norte - Usaquén, Chapinero, Suba'),
-        ('centro', 'Zona Centro - Teusaquillo, Santa Fe, Candelaria'),
-        ('sur', 'Zona Sur - Kennedy, Bosa, Tunjuelito'),
-        ('occidente', 'Zona Occidente - Fontibón, Engativá'),
-        ('oriente', 'Zona Oriente - San Cristóbal, Usme'),
-    ]
-    
     variable = forms.ModelChoiceField(
         queryset=Variable.objects.all(), 
         label='Producto',
@@ -43,7 +35,7 @@ class OrderForm(forms.Form):
         help_text='Número de unidades a solicitar'
     )
     delivery_zone = forms.ChoiceField(
-        choices=DELIVERY_ZONES,
+        choices=zone_choices,  # zonas activas (DeliveryZone), se leen al construir el formulario
         label='Zona de Entrega',
         initial='centro',
         help_text='Selecciona la zona donde deseas recibir tu pedido'
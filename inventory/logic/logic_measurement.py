@@ -1,6 +1,17 @@
-from ..models import Measurement
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import Measurement, MeasurementDaily, month_bucket, month_buckets
 from orders.logic import restock_atomic, get_inventory
 
+DEFAULT_RETENTION_DAYS = 90
+GROUPS = {'day': 'day', 'product': 'product__name', 'warehouse': 'place__name'}
+
 def get_measurements():
     # Return latest inventories for UI stock page
     from orders.models import Inventory
@@ -18,4 +29,74 @@ def create_measurement(form):
     # Link measurement to product for auditing and save
     measurement.product_id = inv.product_id
     measurement.save()
-    return ()
\ No newline at end of file
+    return ()
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_default_timezone())
+
+
+def compact_measurements(retention_days=None, today=None):
+    #pasa las mediciones anteriores a hoy - retention_days a MeasurementDaily y las borra, una particion por transaccion
+    #retorna (mediciones compactadas, filas diarias escritas)
+    if retention_days is None:
+        retention_days = getattr(settings, 'INVENTORY_MEASUREMENT_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    cutoff_day = (today or timezone.localdate()) - timedelta(days=retention_days)
+    cutoff = _start_of(cutoff_day)
+    compacted = written = 0
+    for bucket in sorted(set(Measurement.objects.filter(bucket__lte=month_bucket(cutoff_day))
+                             .values_list('bucket', flat=True).order_by())):
+        with transaction.atomic():
+            raw = Measurement.objects.filter(bucket=bucket, dateTime__lt=cutoff)
+            groups = list(raw.annotate(day=TruncDate('dateTime', tzinfo=timezone.get_default_timezone()))
+                          .values('day', 'place_id', 'product_id', 'unit')
+                          .annotate(n=Count('pk'), total=Sum('value'), low=Min('value'), high=Max('value')).order_by())
+            if not groups: continue
+            # un dia ya compactado (p. ej. tras bajar la retencion) se suma a su fila existente
+            existing = {(row.day, row.place_id, row.product_id, row.unit): row
+                        for row in MeasurementDaily.objects.select_for_update().filter(bucket=bucket, day__in={g['day'] for g in groups})}
+            created, updated = [], []
+            for g in groups:
+                row = existing.get((g['day'], g['place_id'], g['product_id'], g['unit']))
+                if row is None:
+                    created.append(MeasurementDaily(bucket=bucket, day=g['day'], place_id=g['place_id'], product_id=g['product_id'],
+                                                    unit=g['unit'], count=g['n'], total=g['total'] or 0, min_value=g['low'], max_value=g['high']))
+                    continue
+                row.count += g['n']
+                row.total += g['total'] or 0
+                row.min_value = min((v for v in (row.min_value, g['low']) if v is not None), default=None)
+                row.max_value = max((v for v in (row.max_value, g['high']) if v is not None), default=None)
+                updated.append(row)
+            MeasurementDaily.objects.bulk_create(created, batch_size=1000)
+            MeasurementDaily.objects.bulk_update(updated, ['count', 'total', 'min_value', 'max_value'], batch_size=1000)
+            deleted, _ = raw.delete()
+            compacted += deleted
+            written += len(groups)
+    return compacted, written
+
+
+def measurement_history(since, until, product=None, warehouse=None, group_by=None):
+    #reabastecimientos de [since, until]: mediciones recientes + agregados diarios, filtrando solo las particiones del rango
+    buckets = month_buckets(since, until)
+    raw = Measurement.objects.filter(bucket__in=buckets, dateTime__gte=_start_of(since), dateTime__lt=_start_of(until + timedelta(days=1)))
+    daily = MeasurementDaily.objects.filter(bucket__in=buckets, day__gte=since, day__lte=until)
+    if product:
+        raw, daily = raw.filter(product__name=product), daily.filter(product__name=product)
+    if warehouse:
+        raw, daily = raw.filter(place__name=warehouse), daily.filter(place__name=warehouse)
+    raw = raw.annotate(day=TruncDate('dateTime', tzinfo=timezone.get_default_timezone()))
+    raw_sums = {'restocks': Count('pk'), 'units': Sum('value')}
+    daily_sums = {'restocks': Sum('count'), 'units': Sum('total')}
+
+    def merge(*rows):
+        return {'restocks': sum(row['restocks'] or 0 for row in rows), 'units': sum(row['units'] or 0 for row in rows)}
+
+    result = {'since': since, 'until': until, 'totals': merge(raw.aggregate(**raw_sums), daily.aggregate(**daily_sums))}
+    if group_by:
+        key = GROUPS[group_by]
+        groups = {}
+        for qs, sums in ((raw, raw_sums), (daily, daily_sums)):
+            for row in qs.values(key).annotate(**sums).order_by():
+                groups[row[key]] = merge(groups.get(row[key], {'restocks': 0, 'units': 0}), row)
+        result['groups'] = [{group_by: key, **groups[key]} for key in sorted(groups, key=lambda k: (k is None, k))]
+    return result
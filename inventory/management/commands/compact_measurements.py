@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from inventory.logic.logic_measurement import compact_measurements
+
+
+class Command(BaseCommand):
+    help = 'Compacta las mediciones de reabastecimiento anteriores a la retención en agregados diarios (MeasurementDaily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Días de mediciones que se conservan completas (por defecto INVENTORY_MEASUREMENT_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        if options['retention_days'] is not None and options['retention_days'] < 0:
+            raise CommandError('--retention-days no puede ser negativo')
+        start = time.perf_counter()
+        compacted, written = compact_measurements(options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Mediciones compactadas: {compacted}  filas diarias: {written}  ({time.perf_counter() - start:.1f} s)'
+        ))
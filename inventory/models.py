@@ -1,17 +1,74 @@
+from datetime import date, datetime
+
 from django.db import models
+from django.utils import timezone
 from orders.models import Warehouse
 from products.models import Variable
 
+
+def month_bucket(value=None) -> int:
+    # particion mensual AAAAMM en la zona horaria del proyecto; acepta datetime o date
+    value = value or timezone.now()
+    if isinstance(value, datetime):
+        value = timezone.localtime(value, timezone.get_default_timezone())
+    return value.year * 100 + value.month
+
+
+def month_buckets(since: date, until: date) -> list:
+    # particiones mensuales que cubren [since, until], ambos incluidos
+    buckets, year, month = [], since.year, since.month
+    while (year, month) <= (until.year, until.month):
+        buckets.append(year * 100 + month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+
 class Measurement(models.Model):
+    # auditoria de reabastecimientos, solo de insercion: una fila por restock particionada por mes (bucket);
+    # las filas mas viejas que INVENTORY_MEASUREMENT_RETENTION_DAYS se compactan en MeasurementDaily
     variable = models.ForeignKey(Variable, on_delete=models.CASCADE, default=None)
     value = models.FloatField(null=True, blank=True, default=None)
     unit = models.CharField(max_length=50)
     dateTime = models.DateTimeField(auto_now_add=True)
+    bucket = models.IntegerField(default=month_bucket, editable=False)  # AAAAMM de dateTime
     place= models.ForeignKey(Warehouse, on_delete=models.CASCADE)
     product = models.ForeignKey('orders.Product', on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket', 'dateTime']),
+            models.Index(fields=['bucket', 'place', 'dateTime']),
+            models.Index(fields=['bucket', 'product', 'dateTime']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Las mediciones son de solo inserción')
+        super().save(*args, **kwargs)
+
     def __str__(self):
 
         product_name = self.product.name if self.product else "N/A"
         return f"{product_name} - {self.value} {self.unit}"
-    
+
+
+class MeasurementDaily(models.Model):
+    # agregado diario de Measurement por bodega, producto y unidad; lo escribe compact_measurements
+    bucket = models.IntegerField()  # AAAAMM de day
+    day = models.DateField()
+    place = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='measurement_days')
+    product = models.ForeignKey('orders.Product', on_delete=models.SET_NULL, null=True, blank=True, related_name='measurement_days')
+    unit = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Mediciones diarias'
+        verbose_name_plural = 'Mediciones diarias'
+        unique_together = [('day', 'place', 'product', 'unit')]
+        indexes = [models.Index(fields=['bucket', 'place', 'day']), models.Index(fields=['bucket', 'product', 'day'])]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}@{self.place_id}: {self.total} {self.unit} ({self.count})"
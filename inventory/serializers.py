@@ -5,5 +5,5 @@ from . import models
 class MeasurementSerializer(serializers.ModelSerializer):
 
     class Meta:
-        fields = ('id', 'variable', 'value', 'unit', 'place', 'time',)
+        fields = ('id', 'variable', 'value', 'unit', 'place', 'dateTime', 'bucket',)
         model = models.Measurement
\ No newline at end of file
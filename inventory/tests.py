@@ -1,3 +1,77 @@
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from orders.logic import restock_bulk
+from orders.models import Product, Warehouse
+from .logic.logic_measurement import compact_measurements, measurement_history
+from .models import Measurement, MeasurementDaily, month_bucket
+
+
+class MeasurementRetentionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        restock_bulk([{"product": "Casco de Seguridad", "warehouse": "Bodega Norte", "units": units} for units in (5, 7, 9)]
+                     + [{"product": "Casco de Seguridad", "warehouse": "Bodega Sur", "units": 4}])
+        cls.product = Product.objects.get(name='Casco de Seguridad')
+        # las mediciones se insertan con la fecha actual; se mueven al pasado como si fueran historicas
+        old = timezone.make_aware(datetime(2025, 3, 14, 10, 30))
+        ids = list(Measurement.objects.order_by('pk').values_list('pk', flat=True))
+        Measurement.objects.filter(pk__in=ids[:3]).update(dateTime=old, bucket=month_bucket(old))
+        Measurement.objects.filter(pk=ids[3]).update(dateTime=old + timedelta(days=1), bucket=month_bucket(old))
+
+    def test_measurements_are_append_only(self):
+        measurement = Measurement.objects.first()
+        measurement.value = 1
+        with self.assertRaises(ValueError):
+            measurement.save()
+
+    def test_compaction_keeps_history_totals(self):
+        before = measurement_history(date(2025, 3, 1), date(2025, 3, 31), group_by='warehouse')
+        self.assertEqual(compact_measurements(retention_days=90, today=date(2025, 7, 1)), (4, 2))
+        self.assertFalse(Measurement.objects.exists())
+        norte = MeasurementDaily.objects.get(place=self.norte)
+        self.assertEqual((norte.bucket, norte.day, norte.count, norte.total, norte.min_value, norte.max_value),
+                         (202503, date(2025, 3, 14), 3, 21, 5, 9))
+        self.assertEqual(norte.product, self.product)
+        after = measurement_history(date(2025, 3, 1), date(2025, 3, 31), group_by='warehouse')
+        self.assertEqual(after, before)
+        self.assertEqual(after['totals'], {'restocks': 4, 'units': 25})
+
+    def test_history_reads_only_the_range_buckets(self):
+        with CaptureQueriesContext(connection) as ctx:
+            history = measurement_history(date(2025, 3, 14), date(2025, 3, 14), product='Casco de Seguridad')
+        self.assertEqual(history['totals'], {'restocks': 3, 'units': 21})
+        for query in ctx.captured_queries:
+            self.assertIn('"bucket" IN (202503)', query['sql'])
+
+
+class MeasurementAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@provesi.co', 'clave-segura-123')
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        restock_bulk([{"product": "Casco de Seguridad", "warehouse": "Bodega Sur", "units": 4}])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_measurements_cannot_be_deleted_from_their_admin(self):
+        measurement = Measurement.objects.get()
+        self.assertEqual(self.client.get(f'/admin/inventory/measurement/{measurement.pk}/delete/').status_code, 403)
+        self.assertTrue(Measurement.objects.exists())
 
-# Create your tests here.
+    def test_deleting_a_warehouse_cascades_to_its_measurements(self):
+        url = f'/admin/orders/warehouse/{self.sur.pk}/delete/'
+        self.assertFalse(self.client.get(url).context['perms_lacking'])
+        self.client.post(url, {'post': 'yes'})
+        self.assertFalse(Warehouse.objects.filter(pk=self.sur.pk).exists())
+        self.assertFalse(Measurement.objects.exists())
@@ -5,6 +5,7 @@ from . import views
 
 urlpatterns = [
     path('stock/', views.measurement_list),
+    path('stock/history/', views.measurement_history_view, name='stockHistory'),
     path('stockcreate/', csrf_exempt(views.measurement_create), name='stockCreate'),
     path('ordercreate/', csrf_exempt(views.measurement_order_create), name='orderCreate'),
 ]
\ No newline at end of file
@@ -1,10 +1,17 @@
+from datetime import timedelta
+
 from django.shortcuts import render
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_http_methods
 from .forms import MeasurementForm, OrderForm
 from django.contrib import messages
 from django.http import HttpResponseRedirect
 from django.urls import reverse
-from .logic.logic_measurement import create_measurement, get_measurements
+from .logic.logic_measurement import GROUPS, create_measurement, get_measurements, measurement_history
 from orders.logic import place_order_atomic
+from orders.routing import router
 from authentication.decorators import operario_required, cliente_required
 
 
@@ -17,6 +24,29 @@ def measurement_list(request):
     return render(request, 'Inventory/measurements.html', context)
 
 
+HISTORY_DEFAULT_DAYS = 30
+
+
+@operario_required
+@require_http_methods(["GET"])
+def measurement_history_view(request):
+    """
+    Reabastecimientos de ?since=&until= (YYYY-MM-DD, incluidos; por defecto los últimos 30 días), product,
+    warehouse y group_by=day|product|warehouse. Sólo lee las particiones mensuales del rango.
+    """
+    try:
+        until = parse_date(request.GET["until"]) if request.GET.get("until") else timezone.localdate()
+        since = parse_date(request.GET["since"]) if request.GET.get("since") else until - timedelta(days=HISTORY_DEFAULT_DAYS - 1)
+        group_by = request.GET.get("group_by")
+        if since is None or until is None or since > until or (group_by and group_by not in GROUPS):
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest('Parametros: since, until (YYYY-MM-DD), product, warehouse, group_by=day|product|warehouse')
+
+    return JsonResponse(measurement_history(since, until, product=request.GET.get("product"),
+                                            warehouse=request.GET.get("warehouse"), group_by=group_by), status=200)
+
+
 @operario_required
 def measurement_create(request):
     if request.method == 'POST':
@@ -39,15 +69,6 @@ def measurement_create(request):
 
 @cliente_required
 def measurement_order_create(request):
-    # Mapa de zonas de entrega a coordenadas (Bogotá)
-    ZONE_COORDINATES = {
-        'norte': (4.710989, -74.072092),      # Usaquén
-        'centro': (4.598889, -74.080833),     # Teusaquillo
-        'sur': (4.570868, -74.297333),        # Kennedy
-        'occidente': (4.680389, -74.146667),  # Fontibón
-        'oriente': (4.567778, -74.086111),    # San Cristóbal
-    }
-    
     if request.method == 'POST':
         form = OrderForm(request.POST)
         if form.is_valid():
@@ -55,8 +76,9 @@ def measurement_order_create(request):
             units = form.cleaned_data['units']
             delivery_zone = form.cleaned_data['delivery_zone']
             
-            # Obtener coordenadas de la zona seleccionada
-            latitude, longitude = ZONE_COORDINATES.get(delivery_zone, (4.598889, -74.080833))
+            # Coordenadas de la zona seleccionada; su ranking de bodegas sale de la tabla de ruteo (ZoneRoute)
+            zone = router.get(delivery_zone)
+            latitude, longitude = (zone.latitude, zone.longitude) if zone else (4.598889, -74.080833)
             
             try:
                 # Intentar crear el pedido con ubicación del usuario
@@ -64,7 +86,8 @@ def measurement_order_create(request):
                     product_name=variable.name,
                     units=units,
                     user_lat=latitude,
-                    user_lon=longitude
+                    user_lon=longitude,
+                    delivery_zone=delivery_zone
                 )
                 
                 if confirmed:
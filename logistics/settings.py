@@ -102,6 +102,28 @@ DATABASES = {
 #     }
 # }
 
+# Caché compartida entre workers (django-redis) cuando REDIS_URL está definida. Los sellos de versión del
+# catálogo, de la tabla de ruteo y del índice de bodegas (orders.catalog, orders.routing, orders.spatial) sólo
+# avisan a los demás procesos si todos leen la misma caché: en producción con varios workers REDIS_URL es
+# obligatoria. Sin ella (desarrollo, pruebas, un solo proceso) se usa LocMemCache y no hace falta django_redis.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient'},
+            'KEY_PREFIX': 'logistics',
+        }
+    }
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Si Redis no responde, las lecturas devuelven el valor por defecto y las escrituras se descartan (y se registran)
+# en vez de lanzar: los sellos de versión leen 0 y las caches locales se recargan desde la base hasta que vuelva
+DJANGO_REDIS_IGNORE_EXCEPTIONS = True
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -146,6 +168,20 @@ STATICFILES_DIRS = (
     os.path.join(PROJECT_ROOT, 'static'),
 )
 
+# Pedidos: con True, /api/auto_order/ encola el pedido y responde 202 (ver process_order_queue)
+ORDERS_ASYNC_INTAKE = False
+
+# Pedidos: las coordenadas de clientes se agrupan por celda geohash (6 ≈ 1.2 km × 0.6 km, 0 desactiva)
+# y el ranking de bodegas de cada celda se cachea en un LRU de ORDERS_GEOHASH_CACHE_SIZE celdas.
+# Con ORDERS_GEOHASH_EXACT se reordenan con la distancia exacta las bodegas empatadas dentro de la celda.
+ORDERS_GEOHASH_PRECISION = 6
+ORDERS_GEOHASH_CACHE_SIZE = 50000
+ORDERS_GEOHASH_EXACT = False
+
+# Inventario: las mediciones de reabastecimiento más viejas que esto se compactan en agregados diarios
+# (ver compact_measurements)
+INVENTORY_MEASUREMENT_RETENTION_DAYS = 90
+
 # Configuración del modelo de usuario personalizado
 AUTH_USER_MODEL = 'authentication.User'
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Supplier, Warehouse, Product, Inventory, Order
+from .models import Supplier, Warehouse, Product, Inventory, Order, OrderAllocation, OrderIntake, Reservation, StockAlert, StockTransfer, DeliveryZone, ZoneRoute
 
 
 @admin.register(Supplier)
@@ -66,9 +66,9 @@ class WarehouseAdmin(admin.ModelAdmin):
     def capacity_info(self, obj):
         return format_html(f'<b>{obj.capacity:,}</b> unidades')
     
-    @admin.display(description='Ocupación')
+    @admin.display(description='Ocupación', ordering='current_stock')
     def stock_level(self, obj):
-        current = obj.get_current_stock()
+        current = obj.current_stock
         percentage = (current / obj.capacity * 100) if obj.capacity > 0 else 0
         color = '#28a745' if percentage < 70 else '#ffc107' if percentage < 90 else '#dc3545'
         return format_html(
@@ -120,9 +120,9 @@ class ProductAdmin(admin.ModelAdmin):
             f'<small style="color: {color};">Margen: {profit:.1f}%</small>'
         )
     
-    @admin.display(description='Stock Total')
+    @admin.display(description='Stock Total', ordering='total_stock')
     def stock_status(self, obj):
-        total = obj.get_total_stock()
+        total = obj.total_stock
         if total == 0:
             color = '#dc3545'
             icon = '⚠️'
@@ -151,6 +151,8 @@ class InventoryAdmin(admin.ModelAdmin):
     
     @admin.display(description='Cantidad Total', ordering='quantity')
     def quantity_display(self, obj):
+        if obj.shard_count:
+            return format_html(f'<b>{obj.get_quantity()}</b> unidades<br><small>{obj.shard_count} fragmentos</small>')
         return format_html(f'<b>{obj.quantity}</b> unidades')
     
     @admin.display(description='Reservado', ordering='reserved_quantity')
@@ -166,6 +168,14 @@ class InventoryAdmin(admin.ModelAdmin):
         return format_html(f'<span style="color: {color};"><b>{available}</b> unidades</span>')
 
 
+class OrderAllocationInline(admin.TabularInline):
+    model = OrderAllocation
+    fields = ['warehouse', 'units', 'created_at']
+    readonly_fields = ['warehouse', 'units', 'created_at']
+    extra = 0
+    can_delete = False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_id', 'customer_info', 'product', 'units', 'status_badge', 'warehouse_info', 'price_display', 'created_at']
@@ -174,7 +184,9 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['id', 'product__name', 'customer__username', 'customer__first_name', 'customer__last_name']
     ordering = ['-created_at']
     list_per_page = 30
+    show_full_result_count = False  # evita un COUNT(*) extra sobre toda la tabla al filtrar
     date_hierarchy = 'created_at'
+    inlines = [OrderAllocationInline]
     
     fieldsets = (
         ('Información del Pedido', {
@@ -241,3 +253,63 @@ class OrderAdmin(admin.ModelAdmin):
     @admin.display(description='Total', ordering='total_price')
     def price_display(self, obj):
         return format_html(f'<b>${obj.total_price:,.0f}</b>')
+
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'inventory', 'units', 'status', 'expires_at', 'order', 'created_at']
+    list_select_related = ['inventory__product', 'inventory__warehouse', 'order']
+    list_filter = ['status']
+    search_fields = ['inventory__product__name', 'inventory__warehouse__name']
+    ordering = ['-created_at']
+    list_per_page = 30
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ['id', 'product', 'kind', 'stock', 'threshold', 'created_at', 'resolved_at']
+    list_select_related = ['product']
+    list_filter = ['kind', ('resolved_at', admin.EmptyFieldListFilter)]
+    search_fields = ['product__name']
+    ordering = ['-created_at']
+    list_per_page = 30
+
+
+class ZoneRouteInline(admin.TabularInline):
+    model = ZoneRoute
+    fields = ['rank', 'warehouse', 'distance_km']
+    readonly_fields = fields
+    ordering = ['rank']
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DeliveryZone)
+class DeliveryZoneAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'latitude', 'longitude', 'is_active', 'sort_order']
+    list_editable = ['is_active', 'sort_order']
+    search_fields = ['code', 'name']
+    inlines = [ZoneRouteInline]
+
+
+@admin.register(StockTransfer)
+class StockTransferAdmin(admin.ModelAdmin):
+    list_display = ['id', 'product', 'from_warehouse', 'to_warehouse', 'units', 'created_at']
+    list_select_related = ['product', 'from_warehouse', 'to_warehouse']
+    list_filter = ['from_warehouse', 'to_warehouse']
+    search_fields = ['product__name']
+    ordering = ['-created_at']
+    list_per_page = 30
+
+
+@admin.register(OrderIntake)
+class OrderIntakeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'product', 'units', 'status', 'attempts', 'created_at', 'processed_at']
+    list_select_related = ['order', 'product']
+    list_filter = ['status']
+    search_fields = ['product__name']
+    ordering = ['-created_at']
+    list_per_page = 30
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class OrdersConfig(AppConfig):
     name = 'orders'
+
+    def ready(self):
+        from . import catalog, rollups, routing, spatial  # noqa: F401 (registra las señales de cachés, rollups y rutas)
@@ -0,0 +1,135 @@
+"""Caché de catálogo por proceso: nombre de producto y de bodega → fila.
+
+Cada worker guarda hasta ``MAX_ENTRIES`` productos y bodegas en un LRU acotado. Los cambios
+se propagan con señales post_save/post_delete, que limpian la caché local e incrementan un
+sello de versión en la caché compartida de Django (Redis, ver ``CACHES``); cada proceso
+compara su versión con el sello a lo sumo una vez por ``VERSION_CHECK_SECONDS``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Product, Warehouse
+
+MAX_ENTRIES = 4096
+VERSION_KEY = 'orders:catalog-version'
+VERSION_CHECK_SECONDS = 1.0
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 4) if total else 0}
+
+
+def _row(instance) -> dict:
+    return {f.attname: getattr(instance, f.attname) for f in instance._meta.concrete_fields}
+
+
+class CatalogCache:
+    def __init__(self, maxsize: int=MAX_ENTRIES):
+        self.products = LRUCache(maxsize)
+        self.warehouses = LRUCache(maxsize)
+        self._version = None
+        self._checked_at = 0.0
+        self.invalidations = 0
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        version = cache.get(VERSION_KEY, 0)
+        if version != self._version:
+            if self._version is not None:
+                self.clear()
+            self._version = version
+
+    def clear(self):
+        self.products.clear()
+        self.warehouses.clear()
+        self.invalidations += 1
+
+    def product(self, name: str) -> Product:
+        #producto por nombre; lo crea si no existe (misma semantica que get_or_create)
+        self._sync()
+        row = self.products.get(name)
+        if row is None:
+            product, _ = Product.objects.get_or_create(name=name)
+            row = _row(product)
+            self.products.put(name, row)
+        return Product(**row)
+
+    def warehouse(self, name: str):
+        #bodega por nombre o None; sólo se guarda (id, lat, lon, activa) de las que existen
+        self._sync()
+        row = self.warehouses.get(name)
+        if row is None:
+            row = Warehouse.objects.filter(name=name).values_list('id', 'latitude', 'longitude', 'is_active').first()
+            if row is None: return None
+            self.warehouses.put(name, row)
+        return row
+
+    def stats(self) -> dict:
+        return {"products": self.products.stats(), "warehouses": self.warehouses.stats(),
+                "version": self._version, "invalidations": self.invalidations}
+
+
+catalog = CatalogCache()
+
+
+def catalog_version() -> int:
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_catalog_version():
+    catalog.clear()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def catalog_changed(sender, **kwargs):
+    catalog.clear()
+    transaction.on_commit(bump_catalog_version, robust=True)
@@ -0,0 +1,128 @@
+"""Soporte del encabezado ``Idempotency-Key`` para los endpoints que crean pedidos.
+
+La primera petición con una clave la reclama insertando una fila (la unicidad la garantiza
+la base de datos); al terminar guarda la respuesta. Los reintentos con la misma clave
+reciben la respuesta guardada sin volver a ejecutar la vista, y un duplicado concurrente
+espera a que la primera petición termine en lugar de competir con ella.
+
+El reclamo es un lease de ``LEASE_SECONDS``: si el worker que tenía la clave murió a mitad
+de la petición, la clave queda en proceso con un ``claimed_at`` viejo y el siguiente reintento
+la retoma en lugar de fallar hasta que expire.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+DEFAULT_TTL = timedelta(hours=24)
+WAIT_TIMEOUT_SECONDS = 5.0  # mismo límite del ASR de creación de pedidos
+LEASE_SECONDS = 10.0  # una clave en proceso por más tiempo es de un worker caído
+POLL_INTERVAL_SECONDS = 0.05
+
+
+def _fingerprint(request) -> str:
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body or b''):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _claim(key: str, fingerprint: str, ttl: timedelta):
+    #retorna el inicio del lease si esta peticion reclamo la clave, None si ya existia
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, claimed_at=now, expires_at=now + ttl)
+        return now
+    except IntegrityError:
+        return None
+
+
+def _stale(record) -> bool:
+    return record.state == IdempotencyKey.IN_PROGRESS and record.claimed_at <= timezone.now() - timedelta(seconds=LEASE_SECONDS)
+
+
+def _take_over(record):
+    #retoma una clave con el lease vencido; el update condicional deja pasar a una sola peticion
+    now = timezone.now()
+    taken = IdempotencyKey.objects.filter(pk=record.pk, state=IdempotencyKey.IN_PROGRESS, claimed_at=record.claimed_at).update(claimed_at=now)
+    return now if taken else None
+
+
+def _wait_for(key: str):
+    #espera a que la peticion que reclamo la clave termine; None si la clave desaparecio
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    while True:
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None or record.state == IdempotencyKey.DONE or _stale(record) or time.monotonic() >= deadline:
+            return record
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def _replay(record):
+    response = HttpResponse(record.response_body, status=record.status_code, content_type=record.content_type or None)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view=None, *, ttl: timedelta=DEFAULT_TTL):
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view_func(request, *args, **kwargs)
+            if len(key) > 255:
+                return JsonResponse({"error": f"{HEADER} no puede superar 255 caracteres"}, status=400)
+
+            fingerprint = _fingerprint(request)
+            while True:
+                claimed_at = _claim(key, fingerprint, ttl)
+                if claimed_at: break
+                record = _wait_for(key)
+                if record is None:
+                    continue  # la primera peticion fallo y libero la clave: se intenta reclamarla de nuevo
+                if record.expires_at <= timezone.now():
+                    IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=timezone.now()).delete()
+                    continue
+                if record.fingerprint != fingerprint:
+                    return JsonResponse({"error": f"{HEADER} ya se usó con otra petición"}, status=422)
+                if record.state == IdempotencyKey.DONE:
+                    return _replay(record)
+                if not _stale(record):
+                    return JsonResponse({"error": "La petición original sigue en proceso"}, status=409)
+                claimed_at = _take_over(record)
+                if claimed_at: break
+
+            # solo el dueño del lease actual guarda o libera la clave
+            mine = IdempotencyKey.objects.filter(key=key, claimed_at=claimed_at)
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                mine.delete()
+                raise
+
+            if response.status_code >= 500 or response.streaming:
+                mine.delete()  # errores del servidor se pueden reintentar
+            else:
+                mine.update(
+                    state=IdempotencyKey.DONE, status_code=response.status_code,
+                    content_type=response.get('Content-Type', ''), response_body=response.content.decode('utf-8'),
+                )
+            return response
+        return wrapper
+
+    return decorator(view) if view is not None else decorator
+
+
+def purge_expired_keys() -> int:
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
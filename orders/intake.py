@@ -0,0 +1,125 @@
+"""Recepción asíncrona de pedidos.
+
+``enqueue_order`` crea el pedido en PENDING y su fila en la cola dentro de una misma
+transacción corta, sin tocar el inventario, y la vista responde 202 de inmediato. Los
+workers (``process_order_queue``) toman lotes de la cola agrupados por producto y los
+asignan con ``allocate_lines``: un solo bloqueo del inventario del producto por lote.
+"""
+from datetime import timedelta
+from typing import List, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .logic import allocate_lines, create_or_get_product, validate_order_line
+from .catalog import catalog
+from .models import Order, OrderIntake
+from .retry import RetryContext, RetryPolicy
+from .rollups import track_orders
+from .spatial import customer_ranking
+
+MAX_ATTEMPTS = 3
+CLAIM_TIMEOUT = timedelta(minutes=2)  # un lote reclamado por un worker caido vuelve a la cola
+
+
+def enqueue_order(product_name: str, units: int, user_lat: float, user_lon: float, main_warehouse_name: Optional[str]=None) -> Order:
+    #valida igual que place_order_atomic antes de aceptar el pedido; allocate_lines lo vuelve a validar al asignarlo
+    if units<=0: raise ValueError("units must be > 0")
+    product = create_or_get_product(product_name)
+    validate_order_line(product, units)
+    with transaction.atomic():
+        order = Order(product=product, units=units, status=Order.PENDING)
+        Order.objects.bulk_create([order])
+        OrderIntake.objects.create(order=order, product=product, units=units, latitude=user_lat,
+                                   longitude=user_lon, main_warehouse_name=main_warehouse_name)
+    return order
+
+
+def claim_batch(batch_size: int, retry_policy: Optional[RetryPolicy]=None) -> List[OrderIntake]:
+    #reclama hasta batch_size pedidos en cola del producto con el pedido mas antiguo; claimed_at identifica el reclamo:
+    #process_batch solo asigna las filas que siguen PROCESSING con ese mismo claimed_at
+    def attempt(ctx: RetryContext):
+        now = timezone.now()
+        OrderIntake.objects.filter(status=OrderIntake.PROCESSING, claimed_at__lt=now - CLAIM_TIMEOUT).update(status=OrderIntake.QUEUED)
+
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        with transaction.atomic():
+            head = (OrderIntake.objects.select_for_update(skip_locked=skip_locked)
+                    .filter(status=OrderIntake.QUEUED).order_by('created_at', 'pk').values_list('product_id', flat=True).first())
+            if head is None: return []
+            intakes = list(OrderIntake.objects.select_for_update(skip_locked=skip_locked)
+                           .select_related('product', 'order')
+                           .filter(status=OrderIntake.QUEUED, product_id=head).order_by('created_at', 'pk')[:batch_size])
+            # sin SKIP LOCKED (SQLite) dos workers pueden leer las mismas filas: el UPDATE solo toma las que siguen QUEUED
+            claimed = (OrderIntake.objects.filter(pk__in=[it.pk for it in intakes], status=OrderIntake.QUEUED)
+                       .update(status=OrderIntake.PROCESSING, claimed_at=now))
+            if claimed < len(intakes):
+                mine = set(OrderIntake.objects.filter(pk__in=[it.pk for it in intakes], status=OrderIntake.PROCESSING, claimed_at=now)
+                           .values_list('pk', flat=True))
+                intakes = [it for it in intakes if it.pk in mine]
+        for it in intakes:
+            it.status, it.claimed_at = OrderIntake.PROCESSING, now
+        return intakes
+
+    return (retry_policy or RetryPolicy()).run(attempt)
+
+
+def _still_claimed(intakes: List[OrderIntake], lock: bool=False) -> set:
+    #ids del lote que siguen reclamados por este worker; uno devuelto a la cola tras CLAIM_TIMEOUT ya no lo esta
+    qs = OrderIntake.objects.select_for_update() if lock else OrderIntake.objects.all()
+    claims = {(it.pk, it.claimed_at) for it in intakes}
+    return {pk for pk, claimed_at in qs.filter(pk__in=[it.pk for it in intakes], status=OrderIntake.PROCESSING)
+            .values_list('pk', 'claimed_at') if (pk, claimed_at) in claims}
+
+
+def process_batch(intakes: List[OrderIntake], retry_policy: Optional[RetryPolicy]=None) -> int:
+    #asigna bodega a un lote de pedidos del mismo producto y los deja CONFIRMED o REJECTED
+    if not intakes: return 0
+    main_ids = {}
+    for name in {it.main_warehouse_name for it in intakes if it.main_warehouse_name}:
+        row = catalog.warehouse(name)
+        if row and row[3]: main_ids[name] = row[0] #bodega principal inactiva: solo se usa el ranking
+    rankings = [customer_ranking(it.latitude, it.longitude) for it in intakes]
+    lines = [(it.product, it.units, main_ids.get(it.main_warehouse_name), ranking) for it, ranking in zip(intakes, rankings)]
+
+    def attempt(ctx: RetryContext):
+        with transaction.atomic():
+            owned = _still_claimed(intakes, lock=True)
+            mine = [(it, line) for it, line in zip(intakes, lines) if it.pk in owned]
+            if not mine: return 0
+            batch = [it for it, _ in mine]
+            assignments = allocate_lines([line for _, line in mine])
+            now = timezone.now()
+            orders = []
+            for it, assigned in zip(batch, assignments):
+                order = it.order
+                order.status = Order.CONFIRMED if assigned else Order.REJECTED
+                order.assigned_warehouse_id = assigned
+                order.confirmed_at = now if assigned else None
+                order.attempts, order.lock_wait_ms = ctx.attempt, ctx.lock_wait_ms
+                order.updated_at = now
+                orders.append(order)
+                it.status, it.processed_at, it.attempts = OrderIntake.DONE, now, it.attempts + 1
+            Order.objects.bulk_update(orders, ['status', 'assigned_warehouse', 'confirmed_at', 'attempts', 'lock_wait_ms', 'updated_at'])
+            track_orders(orders)  # venian de PENDING, que no cuenta
+            OrderIntake.objects.bulk_update(batch, ['status', 'processed_at', 'attempts'])
+            return len(batch)
+
+    try:
+        return (retry_policy or RetryPolicy()).run(attempt)
+    except Exception as e:
+        # el lote vuelve a la cola; tras MAX_ATTEMPTS los pedidos quedan rechazados
+        owned = _still_claimed(intakes)
+        intakes = [it for it in intakes if it.pk in owned]
+        for it in intakes:
+            it.attempts += 1
+            it.error = str(e)[:500]
+            it.status = OrderIntake.FAILED if it.attempts >= MAX_ATTEMPTS else OrderIntake.QUEUED
+        OrderIntake.objects.bulk_update(intakes, ['attempts', 'error', 'status'])
+        failed = [it.order_id for it in intakes if it.status == OrderIntake.FAILED]
+        if failed:
+            with transaction.atomic():
+                Order.objects.filter(pk__in=failed).update(status=Order.REJECTED)
+                track_orders([Order(pk=it.order_id, product_id=it.product_id, units=it.units, status=Order.REJECTED,
+                                    created_at=it.order.created_at) for it in intakes if it.status == OrderIntake.FAILED])
+        raise
@@ -1,15 +1,32 @@
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 from math import radians, cos, sin, asin, sqrt
-from django.db import transaction, DatabaseError
-from django.db.models import F
-from .models import Inventory, Order, Product, Warehouse
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Inventory, InventoryShard, Order, OrderAllocation, Product, Supplier, Warehouse, adjust_stock_totals
+from .catalog import catalog, catalog_version
+from .sharding import StockChanged, decrement_sharded, decrement_stock, increment_stock, with_stock
+from .retry import RetryContext, RetryPolicy
+from .rollups import track_orders
+from .routing import router
+from .spatial import customer_ranking
+
+
+MAX_UNITS_PER_ORDER = 10000
+
+
+def validate_order_line(product: Product, units: int):
+    #limites de un pedido comunes a todos los caminos: sincrono, dividido, por lote y encolado
+    if units<=0: raise ValueError("units must be > 0")
+    if units>MAX_UNITS_PER_ORDER: raise ValidationError({'units': 'La cantidad máxima por pedido es 10,000 unidades'})
+    if not product.is_active: raise ValidationError({'product': f'El producto {product.name} no está activo'})
 
 
 def create_or_get_product(name: str) -> Product:
 
-    product, _ = Product.objects.get_or_create(name=name) #obtiene o crea un producto por nombre
-    
-    return product
+    return catalog.product(name) #obtiene o crea un producto por nombre; en caliente sale de la cache del proceso
 
 def haversine_km(lon1, lat1, lon2, lat2) -> float: #retorna la distancia en km entre dos puntos geograficos
 
@@ -19,82 +36,68 @@ def haversine_km(lon1, lat1, lon2, lat2) -> float: #retorna la distancia en km e
     a=sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlon/2)**2
     return 2*R*asin(sqrt(a)) #retorna la distancia en km
 
-def find_nearest_with_stock(product: Product, units: int, user_lat: float, user_lon: float) -> Optional[Inventory]: #encuentra la bodega mas cercana con stock suficiente para un producto y unidades dadas
+def find_nearest_with_stock(product: Product, units: int, user_lat: float, user_lon: float, ranking: Optional[Sequence[int]]=None) -> Optional[Inventory]: #encuentra la bodega mas cercana con stock suficiente para un producto y unidades dadas
 
-    qs = (Inventory.objects.select_related('warehouse').filter(product=product, quantity__gte=units)) #filtra inventarios con stock suficiente segun el producto y unidades
-    
-    if not qs.exists(): return None
+    stocked = {inv.warehouse_id: inv for inv in with_stock(Inventory.objects.select_related('warehouse').filter(product=product)).filter(available__gte=units)} #inventarios con stock libre suficiente (incluye fragmentos, descuenta reservas), indexados por bodega
     
-    return min(qs, key=lambda inv: haversine_km(user_lat, user_lon, inv.warehouse.latitude, inv.warehouse.longitude)) #retorna el inventario con la bodega mas cercana
+    if not stocked: return None
+
+    if ranking is None: #sin ranking precalculado usa el de la celda geohash del cliente (cacheado por celda)
+        ranking = customer_ranking(user_lat, user_lon)
+
+    for warehouse_id in ranking:
+        if warehouse_id in stocked:
+            return stocked[warehouse_id] #se detiene en la primera con stock
 
+    return None
 
 
-def place_order_atomic(product_name: str, units: int, user_lat: float, user_lon: float, main_warehouse_name: Optional[str]=None, max_retries:int=3) -> Tuple[Order, bool]:
+
+def place_order_atomic(product_name: str, units: int, user_lat: float, user_lon: float, main_warehouse_name: Optional[str]=None, max_retries:int=3, ranking: Optional[Sequence[int]]=None, retry_policy: Optional[RetryPolicy]=None, delivery_zone: Optional[str]=None) -> Tuple[Order, bool]:
     #funcion para realizar un pedido de manera atomica, retorna la orden y un booleano que indica si fue confirmada o rechazada
+    #ranking: ids de bodegas ya ordenados por distancia (p. ej. el de una zona de entrega), evita recalcular distancias
+    #delivery_zone: codigo de DeliveryZone; sin ranking explicito se recorre la tabla de ruteo de la zona
+    #retry_policy: backoff ante errores de bloqueo; por defecto RetryPolicy(max_attempts=max_retries)
     
     if units<=0: raise ValueError("units must be > 0")
     product = create_or_get_product(product_name)
+    validate_order_line(product, units)
+    if ranking is None: ranking = router.ranking(delivery_zone) #lista precalculada en ZoneRoute, sin distancias por pedido
 
-    for attempt in range(1, max_retries+1):
-
-        try:
-
-            with transaction.atomic():
-
-                order = Order.objects.create(product=product, units=units)
+    def attempt(ctx: RetryContext):
 
+        with transaction.atomic():
 
-                # 1) si se especifica bodega principal, intenta ahí
+            inv = None
 
-                if main_warehouse_name:
-                    try:
-                        mw = Warehouse.objects.get(name=main_warehouse_name)
+            # 1) si se especifica bodega principal, intenta ahí
 
-                        inv = (Inventory.objects.select_for_update().get(product=product, warehouse=mw))
+            main = catalog.warehouse(main_warehouse_name) if main_warehouse_name else None
+            if main and main[3]: #una bodega principal inactiva no recibe pedidos, se pasa a la mas cercana
+                inv = Inventory.objects.select_related('warehouse').filter(product=product, warehouse_id=main[0]).first()
+                if inv and not decrement_stock(inv, units): #descuento condicional; si el inventario esta fragmentado no bloquea la fila principal
+                    inv = None
 
-                        if inv.quantity >= units:
+            # 2) alternativa: bodega más cercana con stock
 
-                            Inventory.objects.filter(pk=inv.pk, quantity__gte=units)\
-                                .update(quantity=F('quantity')-units)
-                            
-                            order.status = Order.CONFIRMED
-                            order.assigned_warehouse = mw
-                            order.save(update_fields=['status','assigned_warehouse'])
-                            
-                            return order, True
-                    except (Warehouse.DoesNotExist, Inventory.DoesNotExist):
-                        pass
+            if inv is None:
+                inv = find_nearest_with_stock(product, units, user_lat, user_lon, ranking)
+                if inv and not decrement_stock(inv, units):
+                    inv = None
 
-                # 2) alternativa: bodega más cercana con stock
-                
-                alt = find_nearest_with_stock(product, units, user_lat, user_lon)
+            # 3) la orden se construye en su estado final y se inserta una sola vez:
+            #    sin full_clean, sin releer la orden en save() y sin la señal post_save que vuelve a tocar el inventario
 
-                if alt:
-
-                    alt = Inventory.objects.select_for_update().get(pk=alt.pk)
-                    
-                    if alt.quantity >= units:
-
-                        Inventory.objects.filter(pk=alt.pk, quantity__gte=units)\
-                            .update(quantity=F('quantity')-units)
-                        
-                        order.status = Order.CONFIRMED
-                        order.assigned_warehouse = alt.warehouse
-                        order.save(update_fields=['status','assigned_warehouse'])
-                        
-                        return order, True
-                        
-
-                # 3) sin stock
-                
-                order.status = Order.REJECTED
-                order.save(update_fields=['status'])
-                return order, False
-            
+            confirmed = inv is not None
+            order = Order(product=product, units=units, status=Order.CONFIRMED if confirmed else Order.REJECTED,
+                          assigned_warehouse=inv.warehouse if confirmed else None, delivery_zone=delivery_zone,
+                          confirmed_at=timezone.now() if confirmed else None,
+                          attempts=ctx.attempt, lock_wait_ms=ctx.lock_wait_ms)
+            Order.objects.bulk_create([order])
+            track_orders([order])
+            return order, confirmed
 
-        except DatabaseError:
-            if attempt >= max_retries: raise
-            continue
+    return (retry_policy or RetryPolicy(max_attempts=max_retries)).run(attempt)
 
 
 
@@ -109,18 +112,332 @@ Comportamiento:
 """
 
 
+def place_order_split(product_name: str, units: int, user_lat: float, user_lon: float, max_warehouses:int=3, max_retries:int=3, retry_policy: Optional[RetryPolicy]=None) -> Tuple[Order, bool]:
+    #llena el pedido desde las bodegas mas cercanas, en orden de distancia, hasta cubrir las unidades
+    #cada bodega usada queda registrada como OrderAllocation; se bloquean a lo sumo max_warehouses filas
+
+    if units<=0: raise ValueError("units must be > 0")
+    if max_warehouses<=0: raise ValueError("max_warehouses must be > 0")
+    product = create_or_get_product(product_name)
+    validate_order_line(product, units)
+
+    def attempt(ctx: RetryContext):
+
+        with transaction.atomic():
+
+            # 1) seleccion sin bloqueo: bodegas con stock, de la mas cercana a la mas lejana, hasta cubrir las unidades
+
+            stocked = dict(with_stock(Inventory.objects.filter(product=product, warehouse__isnull=False)).filter(available__gt=0).values_list('warehouse_id', 'available'))
+            chosen, covered = [], 0
+            if stocked:
+                for warehouse_id in customer_ranking(user_lat, user_lon):
+                    if warehouse_id in stocked:
+                        chosen.append(warehouse_id)
+                        covered += stocked[warehouse_id]
+                        if covered >= units or len(chosen) >= max_warehouses: break
+
+            # 2) bloqueo de las filas elegidas en orden de pk y nueva verificacion con las cantidades bloqueadas
+
+            allocations = []
+            if covered >= units:
+                locked = {inv.warehouse_id: inv for inv in with_stock(Inventory.objects.select_for_update()
+                          .filter(product=product, warehouse_id__in=chosen)).order_by('pk')}
+                pending = units
+                for warehouse_id in chosen:
+                    take = min(locked[warehouse_id].available, pending) if warehouse_id in locked else 0
+                    if take > 0:
+                        allocations.append((locked[warehouse_id], take))
+                        pending -= take
+                    if pending == 0: break
+                if pending > 0: allocations = []
+
+            # 3) sin stock suficiente entre las bodegas permitidas
+
+            if not allocations:
+                order = Order(product=product, units=units, status=Order.REJECTED, attempts=ctx.attempt, lock_wait_ms=ctx.lock_wait_ms)
+                Order.objects.bulk_create([order])
+                track_orders([order])
+                return order, False
+
+            for inv, take in allocations:
+                if not decrement_stock(inv, take): raise StockChanged()
+
+            order = Order(product=product, units=units, status=Order.CONFIRMED,
+                          assigned_warehouse_id=allocations[0][0].warehouse_id, confirmed_at=timezone.now(),
+                          attempts=ctx.attempt, lock_wait_ms=ctx.lock_wait_ms)
+            Order.objects.bulk_create([order])
+            track_orders([order])
+            OrderAllocation.objects.bulk_create([
+                OrderAllocation(order=order, warehouse_id=inv.warehouse_id, units=take) for inv, take in allocations
+            ])
+            return order, True
+
+    return (retry_policy or RetryPolicy(max_attempts=max_retries)).run(attempt)
+
+
 def restock_atomic(product_name: str, units: int, warehouse_name:str) -> Inventory: #añade stock a una bodega específica
     if units<=0: raise ValueError("units must be > 0")
     product = create_or_get_product(product_name)
-    wh,_ = Warehouse.objects.get_or_create(name=warehouse_name, defaults={"latitude":0.0,"longitude":0.0})
+    row = catalog.warehouse(warehouse_name)
+    wh_id = row[0] if row else Warehouse.objects.get_or_create(name=warehouse_name, defaults={"latitude":0.0,"longitude":0.0})[0].pk
     with transaction.atomic():
-        inv,_ = Inventory.objects.select_for_update().get_or_create(product=product, warehouse=wh)
-        Inventory.objects.filter(pk=inv.pk).update(quantity=F('quantity')+units)
+        inv,_ = Inventory.objects.select_for_update().get_or_create(product=product, warehouse_id=wh_id)
+        increment_stock(inv, units)
         inv.refresh_from_db()
         return inv
 
+def restock_bulk(lines, max_retries:int=3, retry_policy: Optional[RetryPolicy]=None):
+    #reabastece muchas lineas (producto, bodega, unidades) en una sola transaccion; retorna un resultado por linea
+    #cada linea: {"product": str, "warehouse": str, "units": int}
+    from inventory.models import Measurement
+    from products.models import Variable
+
+    results = [None]*len(lines)
+    totals = {} #(producto, bodega) -> unidades; las lineas repetidas se suman
+    valid = []
+
+    for i, line in enumerate(lines):
+        try:
+            name = str(line["product"]); warehouse = str(line["warehouse"]); units = int(line["units"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[i] = {"line": i, "applied": False, "error": "Linea invalida"}
+            continue
+        if units <= 0:
+            results[i] = {"line": i, "applied": False, "error": "units must be > 0"}
+            continue
+        row = catalog.warehouse(warehouse)
+        if row is None:
+            results[i] = {"line": i, "applied": False, "error": f"La bodega {warehouse} no existe"}
+            continue
+        valid.append((i, name, row[0], units))
+
+    if not valid: return results
+
+    products = {name: create_or_get_product(name) for name in {name for _, name, _, _ in valid}}
+    for _, name, wh_id, units in valid:
+        key = (products[name].pk, wh_id)
+        totals[key] = totals.get(key, 0) + units
+
+    def attempt(ctx: RetryContext):
+
+        with transaction.atomic():
+
+            product_ids = {pid for pid, _ in totals}
+            existing = {
+                (pid, wid): (pk, shards)
+                for pk, pid, wid, shards in Inventory.objects.filter(product_id__in=product_ids, warehouse_id__in={wid for _, wid in totals})
+                                                             .values_list('pk', 'product_id', 'warehouse_id', 'shard_count')
+                if (pid, wid) in totals #el filtro por producto y bodega trae tambien combinaciones que no vienen en el lote
+            }
+
+            # filas que no existen: se crean ya con la cantidad recibida
+            Inventory.objects.bulk_create([
+                Inventory(product_id=pid, warehouse_id=wid, quantity=units)
+                for (pid, wid), units in totals.items() if (pid, wid) not in existing
+            ])
+
+            # filas existentes: un UPDATE con F() por cantidad distinta, nunca leer-modificar-escribir
+            by_units = {}
+            for (pid, wid), (pk, shards) in existing.items():
+                if shards: #increment_stock ajusta tambien los totales
+                    increment_stock(Inventory(pk=pk, product_id=pid, warehouse_id=wid, shard_count=shards), totals[(pid, wid)])
+                else:
+                    by_units.setdefault(totals[(pid, wid)], []).append(pk)
+            for units, pks in by_units.items():
+                Inventory.objects.filter(pk__in=pks).update(quantity=F('quantity')+units, version=F('version')+1)
+            adjust_stock_totals((pid, wid, units) for (pid, wid), units in totals.items() if not existing.get((pid, wid), (0, 0))[1])
+
+            # auditoria: una Measurement por linea, con la Variable puente de cada producto
+            variables = dict(Variable.objects.filter(product_id__in=product_ids).order_by('-pk').values_list('product_id', 'pk'))
+            missing = [Variable(name=product.name[:50], product=product) for product in products.values() if product.pk not in variables]
+            Variable.objects.bulk_create(missing)
+            variables.update((variable.product_id, variable.pk) for variable in missing)
+            Measurement.objects.bulk_create([
+                Measurement(variable_id=variables[products[name].pk], value=units, unit="unidades", place_id=wh_id, product=products[name])
+                for _, name, wh_id, units in valid
+            ])
+
+    (retry_policy or RetryPolicy(max_attempts=max_retries)).run(attempt)
+
+    for i, name, wh_id, units in valid:
+        results[i] = {"line": i, "applied": True}
+    return results
+
 def get_inventory(product_name: str): #obtiene el inventario de un producto específico
     product = create_or_get_product(product_name)
     return Inventory.objects.select_related('product','warehouse').filter(product=product)
 
 
+# consultas de listado: todo lo que serializa cada fila sale de la misma sentencia SQL
+# (totales de stock denormalizados, proveedor por JOIN, conteo de productos anotado)
+def products_for_listing(active=None):
+    qs = Product.objects.select_related('supplier').order_by('name', 'pk')
+    return qs if active is None else qs.filter(is_active=active)
+
+
+def warehouses_for_listing(active=None):
+    qs = Warehouse.objects.order_by('name', 'pk')
+    return qs if active is None else qs.filter(is_active=active)
+
+
+def suppliers_for_listing(active=None):
+    qs = Supplier.objects.annotate(products_count=Count('products')).order_by('name', 'pk')
+    return qs if active is None else qs.filter(is_active=active)
+
+
+def order_history(status=None, product=None, warehouse=None, customer_id=None, after=None):
+    #historial de pedidos del mas reciente al mas antiguo; ``after`` = (created_at, id) del ultimo pedido de la pagina
+    #anterior: la condicion de cursor recorre el indice (filtro, created_at, id) sin OFFSET
+    #created_at admite NULL (filas anteriores a auto_now_add): esas filas no tienen posicion en el orden por fecha
+    #(cada motor ubica los NULL distinto y la comparacion con NULL nunca es verdadera), asi que quedan fuera
+    qs = (Order.objects.select_related('product', 'assigned_warehouse', 'customer')
+          .filter(created_at__isnull=False).order_by('-created_at', '-id'))
+    if status: qs = qs.filter(status=status)
+    if product: qs = qs.filter(product__name=product)
+    if warehouse: qs = qs.filter(assigned_warehouse__name=warehouse)
+    if customer_id is not None: qs = qs.filter(customer_id=customer_id)
+    if after:
+        created_at, pk = after
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    return qs
+
+
+def inventory_etag(product_name: str) -> str:
+    #version del inventario de un producto sin leer sus filas: cada cambio de stock sube Inventory.version
+    #o InventoryShard.version, y el catalogo (nombres de bodegas) tiene su propio sello
+    product = create_or_get_product(product_name)
+    shard_versions = (InventoryShard.objects.filter(inventory=OuterRef('pk')).values('inventory')
+                      .annotate(total=Sum('version')).values('total'))
+    v = (Inventory.objects.filter(product_id=product.pk)
+         .annotate(shard_version=Coalesce(Subquery(shard_versions, output_field=IntegerField()), Value(0)))
+         .aggregate(rows=Count('pk'), last=Max('pk'), version=Sum('version'), shards=Sum('shard_version')))
+    return f"{product.pk}-{catalog_version()}-{v['rows']}-{v['last'] or 0}-{v['version'] or 0}-{v['shards'] or 0}"
+
+
+
+
+def allocate_lines(lines):
+    #asigna bodega a muchas lineas (product, units, main_warehouse_id, ranking) y descuenta el stock en bloque
+    #ranking: ids de bodegas de la mas cercana a la mas lejana
+    #debe llamarse dentro de una transaccion; retorna la bodega asignada por linea o None si no hubo stock
+    #o la linea no pasa validate_order_line (producto inactivo, cantidad fuera de rango)
+
+    product_ids = {product.id for product, _, _, _ in lines}
+
+    # bloqueo en orden determinista (pk) para evitar interbloqueos entre lotes concurrentes
+    stock = {}
+    sharded = set()
+    for pk, product_id, warehouse_id, quantity, shard_count in (with_stock(Inventory.objects.select_for_update()
+            .filter(product_id__in=product_ids, warehouse__isnull=False)).order_by('pk')
+            .values_list('pk', 'product_id', 'warehouse_id', 'available', 'shard_count')):
+        stock[(product_id, warehouse_id)] = [pk, quantity]
+        if shard_count: sharded.add(pk)
+
+    deltas = {}
+    changes = []
+    assignments = []
+
+    for product, units, main_id, ranking in lines:
+        try:
+            validate_order_line(product, units)
+        except (ValueError, ValidationError):
+            assignments.append(None)
+            continue
+        candidates = [main_id] if main_id else []
+        candidates.extend(ranking)
+
+        assigned = None
+        for warehouse_id in candidates:
+            row = stock.get((product.id, warehouse_id))
+            if row and row[1] >= units:
+                row[1] -= units
+                deltas[row[0]] = deltas.get(row[0], 0) + units
+                changes.append((product.id, warehouse_id, -units))
+                assigned = warehouse_id
+                break
+        assignments.append(assigned)
+
+    for pk in sharded.intersection(deltas): #los inventarios fragmentados se descuentan sobre sus fragmentos
+        if not decrement_sharded(pk, deltas.pop(pk)): raise StockChanged()
+    if deltas: #un solo UPDATE para todas las filas de inventario afectadas
+        Inventory.objects.filter(pk__in=deltas).update(
+            quantity=Case(*[When(pk=pk, then=F('quantity')-units) for pk, units in deltas.items()], output_field=IntegerField()),
+            version=F('version')+1,
+        )
+    adjust_stock_totals(changes)
+    return assignments
+
+
+def place_orders_batch(lines, max_retries:int=3, retry_policy: Optional[RetryPolicy]=None):
+    #procesa muchas lineas de pedido en una sola transaccion; retorna un resultado por linea en el mismo orden
+    #cada linea: {"product": str, "units": int, "lat": float, "lon": float, "mainWarehouse"?: str}
+
+    results = [None]*len(lines)
+    valid = []
+
+    for i, line in enumerate(lines):
+        try:
+            name = str(line["product"]); units = int(line["units"])
+            lat = float(line["lat"]); lon = float(line["lon"])
+            main = line.get("mainWarehouse")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            results[i] = {"line": i, "order_id": None, "status": None, "assigned_warehouse": None, "confirmed": False, "error": "Linea invalida"}
+            continue
+        if units <= 0:
+            results[i] = {"line": i, "order_id": None, "status": None, "assigned_warehouse": None, "confirmed": False, "error": "units must be > 0"}
+            continue
+        valid.append((i, name, units, lat, lon, main))
+
+    if not valid: return results
+
+    # productos y bodegas se resuelven una sola vez para todo el lote
+    names = {name for _, name, _, _, _, _ in valid}
+    products = {name: create_or_get_product(name) for name in names}
+    main_ids = {}
+    for main in {main for *_, main in valid if main}:
+        row = catalog.warehouse(main)
+        if row and row[3]: main_ids[main] = row[0] #bodega principal inactiva: solo se usa el ranking
+
+    rankings = [customer_ranking(lat, lon) for _, _, _, lat, lon, _ in valid] #clientes de la misma celda geohash comparten ranking cacheado
+
+    pending = []
+    for (i, name, units, lat, lon, main), ranking in zip(valid, rankings):
+        product = products[name]
+        try:
+            validate_order_line(product, units) #mismos limites que place_order_atomic, linea por linea
+        except ValidationError as e:
+            results[i] = {"line": i, "order_id": None, "status": None, "assigned_warehouse": None, "confirmed": False,
+                          "error": " ".join(message for messages in e.message_dict.values() for message in messages)}
+            continue
+        pending.append((i, (product, units, main_ids.get(main), ranking)))
+
+    if not pending: return results
+
+    def attempt(ctx: RetryContext):
+
+        with transaction.atomic():
+
+            assignments = allocate_lines([line for _, line in pending])
+            now = timezone.now()
+            orders = [
+                Order(product=product, units=units, status=Order.CONFIRMED if assigned else Order.REJECTED,
+                      assigned_warehouse_id=assigned, confirmed_at=now if assigned else None,
+                      attempts=ctx.attempt, lock_wait_ms=ctx.lock_wait_ms)
+                for (_, (product, units, _, _)), assigned in zip(pending, assignments)
+            ]
+            Order.objects.bulk_create(orders)
+            track_orders(orders)
+
+        return orders
+
+    orders = (retry_policy or RetryPolicy(max_attempts=max_retries)).run(attempt)
+
+    assigned_ids = {order.assigned_warehouse_id for order in orders if order.assigned_warehouse_id}
+    warehouse_names = dict(Warehouse.objects.filter(pk__in=assigned_ids).values_list('id', 'name')) if assigned_ids else {}
+
+    for (i, _), order in zip(pending, orders):
+        confirmed = order.status == Order.CONFIRMED
+        results[i] = {"line": i, "order_id": order.id, "status": order.status,
+                      "assigned_warehouse": warehouse_names.get(order.assigned_warehouse_id) if confirmed else None,
+                      "confirmed": confirmed}
+    return results
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.logic import haversine_km
+from orders.spatial import WarehouseIndex
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo escalar de distancias con el ranking vectorizado (NumPy) y el k-d tree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+        parser.add_argument('--points', type=int, default=100, help='Puntos de cliente por tamaño')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        n_points = options['points']
+        self.stdout.write(f'{"bodegas":>10} {"escalar ms/pt":>15} {"numpy ms/pt":>13} {"numpy lote ms/pt":>18} {"kd-tree ms/pt":>15}')
+
+        for size in options['sizes']:
+            # bodegas y clientes aleatorios dentro del rango válido para Colombia
+            rows = [(i, rng.uniform(-4.5, 13.5), rng.uniform(-79, -66)) for i in range(size)]
+            points = [(rng.uniform(-4.5, 13.5), rng.uniform(-79, -66)) for _ in range(n_points)]
+            index = WarehouseIndex(rows)
+
+            start = time.perf_counter()
+            scalar = [min(rows, key=lambda r: haversine_km(lon, lat, r[2], r[1]))[0] for lat, lon in points]
+            t_scalar = time.perf_counter() - start
+
+            start = time.perf_counter()
+            single = [index.rank(lat, lon)[0][0] for lat, lon in points]
+            t_single = time.perf_counter() - start
+
+            # el lote completo se limita en memoria: puntos × bodegas flotantes
+            chunk = max(1, 2_000_000 // max(size, 1))
+            start = time.perf_counter()
+            batched = []
+            for i in range(0, n_points, chunk):
+                batched.extend(row[0][0] for row in index.rank_many(points[i:i + chunk]))
+            t_batch = time.perf_counter() - start
+
+            start = time.perf_counter()
+            kd = [next(index.nearest(lat, lon))[0] for lat, lon in points]
+            t_kd = time.perf_counter() - start
+
+            if not (scalar == single == batched == kd):
+                self.stdout.write(self.style.WARNING(f'   resultados distintos para {size} bodegas'))
+
+            per = 1000 / n_points
+            self.stdout.write(
+                f'{size:>10} {t_scalar * per:>15.3f} {t_single * per:>13.3f} {t_batch * per:>18.3f} {t_kd * per:>15.3f}'
+            )
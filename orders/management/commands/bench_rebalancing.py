@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from orders.rebalancing import DEFAULT_MIN_UNITS, plan_moves, targets
+from orders.spatial import haversine_matrix
+
+
+def greedy_unit_km(available, demand, distances, min_units):
+    #referencia: cada faltante se llena desde los sobrantes en orden de bodega, sin mirar distancias
+    target = targets(available, demand)
+    stock = np.floor(np.clip(available, 0, None)).astype(np.int64)
+    total = 0.0
+    for p in np.flatnonzero(np.clip(target - stock, 0, None).sum(axis=1) >= min_units):
+        surplus = np.clip(stock[p] - target[p], 0, None)
+        for t in np.flatnonzero(target[p] > stock[p]):
+            need = target[p, t] - stock[p, t]
+            for f in np.flatnonzero(surplus):
+                take = min(need, surplus[f])
+                surplus[f] -= take
+                need -= take
+                total += take * distances[f, t]
+                if not need: break
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Mide el plan de rebalanceo entre bodegas (solver de transporte) sobre catálogos sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=['10000x3', '100000x3', '20000x10', '5000x25'],
+                            help='Tamaños PRODUCTOSxBODEGAS')
+        parser.add_argument('--min-units', type=int, default=DEFAULT_MIN_UNITS)
+        parser.add_argument('--compare', action='store_true', help='Compara unidades × km con un reparto ingenuo (lento)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        self.stdout.write(f'{"productos":>10} {"bodegas":>8} {"s":>8} {"traslados":>10} {"unidades":>12} {"u×km":>14} {"ingenuo u×km":>14}')
+
+        for size in options['sizes']:
+            n_products, n_warehouses = (int(part) for part in size.lower().split('x'))
+            shape = (n_products, n_warehouses)
+            # stock repartido sin relación con la demanda, que se concentra en pocas bodegas por producto
+            available = rng.integers(0, 400, shape).astype(np.float32)
+            demand = (rng.poisson(3.0, shape) * (rng.random(shape) < 0.4)).astype(np.float32)
+            lats, lons = rng.uniform(4.45, 4.83, n_warehouses), rng.uniform(-74.22, -74.01, n_warehouses)
+            distances = haversine_matrix(lats, lons, lats, lons)
+
+            start = time.perf_counter()
+            p, f, t, units = plan_moves(available, demand, distances, options['min_units'])
+            elapsed = time.perf_counter() - start
+
+            # el plan debe dejar cada producto rebalanceado exactamente en su objetivo, sin stock negativo
+            after = np.floor(available).astype(np.int64)
+            np.add.at(after, (p, f), -units)
+            np.add.at(after, (p, t), units)
+            moved = np.zeros(n_products, dtype=bool)
+            moved[p] = True
+            if (after < 0).any() or (after[moved] != targets(available, demand)[moved]).any():
+                self.stdout.write(self.style.WARNING(f'   plan inconsistente para {size}'))
+
+            unit_km = float((units * distances[f, t]).sum())
+            greedy = f'{greedy_unit_km(available, demand, distances, options["min_units"]):>14,.0f}' if options['compare'] else f'{"-":>14}'
+            self.stdout.write(
+                f'{n_products:>10,} {n_warehouses:>8} {elapsed:>8.2f} {len(units):>10,} {int(units.sum()):>12,} {unit_km:>14,.0f} {greedy}'
+            )
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, DatabaseError
+
+from orders.models import Inventory, Product, Warehouse
+from orders.sharding import decrement_stock, split_inventory, collapse_shards
+
+
+class Command(BaseCommand):
+    help = 'Mide descuentos por segundo sobre un mismo inventario según el número de fragmentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 2, 4, 8, 16], help='0 = sin fragmentar')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--ops', type=int, default=200, help='Descuentos por hilo')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite bloquea toda la base en cada escritura: los fragmentos no mejoran el throughput aquí'))
+
+        warehouse, _ = Warehouse.objects.get_or_create(name='Bodega Benchmark', defaults={'latitude': 4.6, 'longitude': -74.08})
+        product, _ = Product.objects.get_or_create(name='Producto Benchmark Shards')
+        inv, _ = Inventory.objects.get_or_create(product=product, warehouse=warehouse)
+        threads, ops = options['threads'], options['ops']
+
+        self.stdout.write(f'{"fragmentos":>10} {"ops/s":>10} {"fallidos":>9}')
+        try:
+            for shard_count in options['shards']:
+                collapse_shards(inv.pk)
+                Inventory.objects.filter(pk=inv.pk).update(quantity=threads * ops)
+                if shard_count:
+                    split_inventory(inv.pk, shard_count)
+                inv.refresh_from_db()
+
+                failures = []
+
+                def worker():
+                    failed = 0
+                    try:
+                        for _ in range(ops):
+                            try:
+                                if not decrement_stock(inv, 1): failed += 1
+                            except DatabaseError:
+                                failed += 1
+                    finally:
+                        connection.close()
+                    failures.append(failed)
+
+                pool = [threading.Thread(target=worker) for _ in range(threads)]
+                start = time.perf_counter()
+                for t in pool: t.start()
+                for t in pool: t.join()
+                elapsed = time.perf_counter() - start
+
+                done = threads * ops - sum(failures)
+                self.stdout.write(f'{shard_count:>10} {done / elapsed:>10.0f} {sum(failures):>9}')
+        finally:
+            Inventory.objects.filter(pk=inv.pk).delete()
+            product.delete()
+            warehouse.delete()
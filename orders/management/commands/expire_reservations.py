@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.reservations import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Libera las reservas de stock vencidas; con --interval corre como proceso en segundo plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Segundos entre barridos (0 = una sola vez)')
+        parser.add_argument('--limit', type=int, default=5000, help='Máximo de reservas por barrido')
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True: # se repite mientras el barrido llegue al límite
+                expired = expire_reservations(limit=options['limit'])
+                total += expired
+                if expired < options['limit']: break
+            if total:
+                self.stdout.write(self.style.SUCCESS(f'Reservas expiradas: {total}'))
+            if not options['interval']: break
+            time.sleep(options['interval'])
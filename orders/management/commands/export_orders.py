@@ -0,0 +1,51 @@
+import sys, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from orders.exports import FORMATS, INVENTORY_COLUMNS, ORDER_COLUMNS, inventory_rows, order_rows, render
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Exporta pedidos (o el inventario con --inventory) a CSV/JSONL en streaming, con memoria constante'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='Archivo de salida ("-" para stdout)')
+        parser.add_argument('--format', choices=FORMATS, help='Por defecto según la extensión de --output, si no csv')
+        parser.add_argument('--status', choices=[code for code, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--since', help='Fecha inicial YYYY-MM-DD (incluida)')
+        parser.add_argument('--until', help='Fecha final YYYY-MM-DD (excluida)')
+        parser.add_argument('--inventory', action='store_true', help='Exporta el inventario en lugar de los pedidos')
+
+    def _day(self, value, option):
+        if not value: return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'{option} debe tener formato YYYY-MM-DD')
+        return timezone.make_aware(timezone.datetime.combine(day, timezone.datetime.min.time()))
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format'] or ('jsonl' if output.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        if options['inventory']:
+            rows, columns = inventory_rows(), INVENTORY_COLUMNS
+        else:
+            rows = order_rows(status=options['status'], since=self._day(options['since'], '--since'),
+                              until=self._day(options['until'], '--until'))
+            columns = ORDER_COLUMNS
+
+        out = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+        start = time.perf_counter()
+        lines = 0
+        try:
+            for line in render(fmt, rows, columns):
+                out.write(line)
+                lines += 1
+        finally:
+            if out is not sys.stdout: out.close()
+
+        if out is not sys.stdout:
+            count = lines - 1 if fmt == 'csv' else lines
+            self.stdout.write(self.style.SUCCESS(f'Filas exportadas: {count}  ({time.perf_counter() - start:.1f} s)'))
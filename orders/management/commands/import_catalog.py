@@ -0,0 +1,337 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from orders.catalog import bump_catalog_version
+from orders.models import Product, Supplier, Warehouse
+from orders.routing import rebuild_zone_routes
+from orders.spatial import bump_warehouse_index_version
+from orders.validators import (
+    validate_coordinates, validate_name_format, validate_non_negative, product_name_validator,
+    validate_phone_number, validate_nit, validate_address_format
+)
+
+
+def _text(row, key):
+    value = row.get(key)
+    if value is None: return None
+    value = str(value).strip()
+    return value or None
+
+
+def _decimal(row, key, default='0'):
+    try:
+        return Decimal(str(row.get(key) or default))
+    except InvalidOperation:
+        raise ValidationError(f'{key}: número inválido')
+
+
+def _int(row, key, default):
+    value = row.get(key)
+    if value in (None, ''): return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'{key}: entero inválido')
+
+
+def _bool(row, key, default=True):
+    value = row.get(key)
+    if value in (None, ''): return default
+    return str(value).strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
+
+
+def _check(validator, value, field):
+    try:
+        validator(value)
+    except ValidationError as e:
+        raise ValidationError(f'{field}: {"; ".join(e.messages)}')
+
+
+class ProductImporter:
+    model = Product
+    key = 'name'
+    update_fields = ['description', 'sku', 'supplier', 'unit_price', 'cost_price', 'category',
+                     'min_stock', 'max_stock', 'is_active', 'requires_special_handling']
+
+    def parse(self, row):
+        name = _text(row, 'name')
+        _check(product_name_validator, name or '', 'name')
+        data = {
+            'name': name, 'description': _text(row, 'description'),
+            'sku': (_text(row, 'sku') or '').upper() or None, 'category': _text(row, 'category'),
+            'unit_price': _decimal(row, 'unit_price'), 'cost_price': _decimal(row, 'cost_price'),
+            'min_stock': _int(row, 'min_stock', 0), 'max_stock': _int(row, 'max_stock', 10000),
+            'is_active': _bool(row, 'is_active'), 'requires_special_handling': _bool(row, 'requires_special_handling', False),
+            'supplier_nit': _text(row, 'supplier_nit'),
+        }
+        _check(validate_non_negative, data['unit_price'], 'unit_price')
+        _check(validate_non_negative, data['cost_price'], 'cost_price')
+        if data['unit_price'] and data['cost_price'] and data['unit_price'] < data['cost_price']:
+            raise ValidationError('unit_price: El precio de venta no puede ser menor al precio de costo')
+        if data['min_stock'] < 0 or data['max_stock'] < 0:
+            raise ValidationError('min_stock/max_stock: no pueden ser negativos')
+        if data['min_stock'] and data['max_stock'] and data['min_stock'] > data['max_stock']:
+            raise ValidationError('min_stock: El stock mínimo no puede ser mayor al stock máximo')
+        return data
+
+    def existing(self, rows):
+        # una consulta por lote: coincidencias por nombre o SKU sin distinguir mayúsculas
+        names = {r['name'].lower() for r in rows}
+        skus = {r['sku'].lower() for r in rows if r['sku']}
+        qs = Product.objects.annotate(lname=Lower('name'), lsku=Lower('sku')).filter(Q(lname__in=names) | Q(lsku__in=skus))
+        by_name, by_sku = {}, {}
+        for p in qs:
+            by_name[p.lname] = p
+            if p.lsku: by_sku[p.lsku] = p
+        return by_name, by_sku
+
+    def resolve(self, rows):
+        nits = {r['supplier_nit'] for r in rows if r['supplier_nit']}
+        self.suppliers = {s.nit: s for s in Supplier.objects.filter(nit__in=nits)} if nits else {}
+
+    def build(self, data, current, by_sku):
+        if data['sku'] and data['sku'].lower() in by_sku and by_sku[data['sku'].lower()] is not current:
+            raise ValidationError('sku: Ya existe un producto con este SKU')
+        supplier = None
+        if data['supplier_nit']:
+            supplier = self.suppliers.get(data['supplier_nit'])
+            if supplier is None:
+                raise ValidationError(f'supplier_nit: no existe el proveedor {data["supplier_nit"]}')
+            if not supplier.is_active:
+                raise ValidationError(f'supplier: El proveedor {supplier.name} no está activo')
+        obj = current or Product(name=data['name'])
+        for field in self.update_fields:
+            setattr(obj, field, supplier if field == 'supplier' else data[field])
+        return obj
+
+
+class SupplierImporter:
+    model = Supplier
+    key = 'name'
+    update_fields = ['nit', 'email', 'phone', 'address', 'city', 'contact_person', 'is_active', 'credit_days', 'rating', 'notes']
+
+    def parse(self, row):
+        data = {
+            'name': _text(row, 'name'), 'nit': _text(row, 'nit'), 'email': (_text(row, 'email') or '').lower() or None,
+            'phone': _text(row, 'phone'), 'address': _text(row, 'address'), 'city': _text(row, 'city'),
+            'contact_person': _text(row, 'contact_person'), 'is_active': _bool(row, 'is_active'),
+            'credit_days': _int(row, 'credit_days', 30), 'rating': _decimal(row, 'rating'), 'notes': _text(row, 'notes'),
+        }
+        for field in ('name', 'city', 'contact_person'):
+            _check(validate_name_format, data[field] or '', field)
+        if not data['nit'] or not data['email'] or not data['phone'] or not data['address']:
+            raise ValidationError('nit, email, phone y address son obligatorios')
+        _check(validate_nit, data['nit'], 'nit')
+        _check(validate_phone_number, data['phone'], 'phone')
+        _check(validate_address_format, data['address'], 'address')
+        if data['rating'] < 0 or data['rating'] > 5:
+            raise ValidationError('rating: La calificación debe estar entre 0 y 5')
+        if data['credit_days'] < 0 or data['credit_days'] > 365:
+            raise ValidationError('credit_days: Los días de crédito deben estar entre 0 y 365')
+        return data
+
+    def existing(self, rows):
+        names = {r['name'].lower() for r in rows}
+        nits = {r['nit'] for r in rows}
+        emails = {r['email'] for r in rows}
+        qs = Supplier.objects.annotate(lname=Lower('name'), lemail=Lower('email')).filter(
+            Q(lname__in=names) | Q(nit__in=nits) | Q(lemail__in=emails))
+        by_name, by_other = {}, {}
+        for s in qs:
+            by_name[s.lname] = s
+            by_other[('nit', s.nit)] = s
+            by_other[('email', s.lemail)] = s
+        return by_name, by_other
+
+    def resolve(self, rows):
+        pass
+
+    def build(self, data, current, by_other):
+        for field in ('nit', 'email'):
+            other = by_other.get((field, data[field]))
+            if other is not None and other is not current:
+                raise ValidationError(f'{field}: Ya existe un proveedor con este {field.upper() if field == "nit" else field}')
+        obj = current or Supplier(name=data['name'])
+        for field in self.update_fields:
+            setattr(obj, field, data[field])
+        return obj
+
+
+class WarehouseImporter:
+    model = Warehouse
+    key = 'name'
+    update_fields = ['latitude', 'longitude', 'address', 'phone', 'capacity', 'is_active']
+
+    def parse(self, row):
+        data = {'name': _text(row, 'name'), 'address': _text(row, 'address'), 'phone': _text(row, 'phone'),
+                'capacity': _int(row, 'capacity', 50000), 'is_active': _bool(row, 'is_active')}
+        _check(validate_name_format, data['name'] or '', 'name')
+        try:
+            data['latitude'], data['longitude'] = float(row['latitude']), float(row['longitude'])
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError('latitude/longitude son obligatorias')
+        _check(lambda v: validate_coordinates(*v), (data['latitude'], data['longitude']), 'latitude')
+        _check(validate_address_format, data['address'], 'address')
+        _check(validate_phone_number, data['phone'], 'phone')
+        if data['capacity'] < 0:
+            raise ValidationError('capacity: no puede ser negativa')
+        return data
+
+    def existing(self, rows):
+        names = {r['name'].lower() for r in rows}
+        return {w.lname: w for w in Warehouse.objects.annotate(lname=Lower('name')).filter(lname__in=names)}, {}
+
+    def resolve(self, rows):
+        pass
+
+    def build(self, data, current, _):
+        obj = current or Warehouse(name=data['name'])
+        for field in self.update_fields:
+            setattr(obj, field, data[field])
+        return obj
+
+
+UPDATE_BATCH_SIZE = 100
+
+IMPORTERS = {'products': ProductImporter, 'suppliers': SupplierImporter, 'warehouses': WarehouseImporter}
+
+
+class Command(BaseCommand):
+    help = 'Importa productos, proveedores o bodegas desde CSV/JSONL en lotes, sin full_clean por fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo .csv o .jsonl ("-" para stdin)')
+        parser.add_argument('--type', choices=IMPORTERS, default='products')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Por defecto según la extensión')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--errors', help='Archivo JSONL donde escribir los errores por fila')
+
+    def _rows(self, handle, fmt):
+        if fmt == 'csv':
+            for lineno, row in enumerate(csv.DictReader(handle), start=2):
+                yield lineno, row
+        else:
+            for lineno, line in enumerate(handle, start=1):
+                if not line.strip(): continue
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict): raise ValueError
+                    yield lineno, row
+                except ValueError:
+                    yield lineno, None
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else None)
+        if fmt is None:
+            raise CommandError('No se pudo deducir el formato; use --format csv|jsonl')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size debe ser mayor a cero')
+
+        importer = IMPORTERS[options['type']]()
+        stats = {'read': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        error_out = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+        handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        start = time.perf_counter()
+
+        def report_error(lineno, message):
+            stats['errors'] += 1
+            if error_out:
+                error_out.write(json.dumps({'line': lineno, 'error': message}, ensure_ascii=False) + '\n')
+            elif stats['errors'] <= 20:
+                self.stderr.write(f'   línea {lineno}: {message}')
+
+        try:
+            chunk = []
+            for lineno, row in self._rows(handle, fmt):
+                stats['read'] += 1
+                chunk.append((lineno, row))
+                if len(chunk) >= options['chunk_size']:
+                    self._import_chunk(importer, chunk, stats, report_error)
+                    chunk = []
+            if chunk:
+                self._import_chunk(importer, chunk, stats, report_error)
+        finally:
+            if handle is not sys.stdin: handle.close()
+            if error_out: error_out.close()
+            # las escrituras en bloque no disparan señales: se invalidan las cachés a mano
+            bump_catalog_version()
+            bump_warehouse_index_version()
+            if options['type'] == 'warehouses':
+                rebuild_zone_routes()
+
+        elapsed = time.perf_counter() - start
+        rate = stats['read'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Leídas: {stats["read"]}  creadas: {stats["created"]}  actualizadas: {stats["updated"]}  sin cambios: {stats["unchanged"]}  '
+            f'errores: {stats["errors"]}  ({rate:,.0f} filas/s)'
+        ))
+
+    def _import_chunk(self, importer, chunk, stats, report_error):
+        parsed, seen = [], set()
+        for lineno, row in chunk:
+            if row is None:
+                report_error(lineno, 'JSON inválido')
+                continue
+            try:
+                data = importer.parse(row)
+            except ValidationError as e:
+                report_error(lineno, '; '.join(e.messages))
+                continue
+            key = data[importer.key].lower()
+            if key in seen:
+                report_error(lineno, f'{importer.key} duplicado en el archivo')
+                continue
+            seen.add(key)
+            parsed.append((lineno, data))
+
+        if not parsed: return
+        rows = [data for _, data in parsed]
+        by_key, by_other = importer.existing(rows)
+        importer.resolve(rows)
+
+        to_create, to_update, claimed = [], {}, {}
+        attnames = [importer.model._meta.get_field(f).attname for f in importer.update_fields]
+        unchanged = 0
+        for lineno, data in parsed:
+            current = by_key.get(data[importer.key].lower())
+            before = [getattr(current, f) for f in attnames] if current else None
+            try:
+                obj = importer.build(data, current, by_other)
+            except ValidationError as e:
+                report_error(lineno, '; '.join(e.messages))
+                continue
+            # unicidad dentro del lote para sku / nit / email
+            conflict = next((f for f in ('sku', 'nit', 'email') if getattr(obj, f, None) and claimed.get((f, str(getattr(obj, f)).lower()), obj) is not obj), None)
+            if conflict:
+                report_error(lineno, f'{conflict} duplicado en el archivo')
+                continue
+            for f in ('sku', 'nit', 'email'):
+                if getattr(obj, f, None): claimed[(f, str(getattr(obj, f)).lower())] = obj
+            if current is None:
+                to_create.append(obj)
+            else:
+                changed = tuple(f for f, old, a in zip(importer.update_fields, before, attnames) if getattr(obj, a) != old)
+                if changed:
+                    to_update.setdefault(changed, []).append(obj)
+                else:
+                    unchanged += 1  # reimportar un feed sin cambios no escribe nada
+
+        with transaction.atomic():
+            if to_create:
+                importer.model.objects.bulk_create(to_create)
+            # se agrupan las filas por campos modificados: cada UPDATE lleva un CASE sólo por campo que cambió
+            for fields, objs in to_update.items():
+                importer.model.objects.bulk_update(objs, fields, batch_size=UPDATE_BATCH_SIZE)
+        stats['created'] += len(to_create)
+        stats['updated'] += sum(len(objs) for objs in to_update.values())
+        stats['unchanged'] += unchanged
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import Inventory
+from orders.sharding import split_inventory, rebalance_shards, collapse_shards
+
+
+class Command(BaseCommand):
+    help = 'Fragmenta, rebalancea o colapsa el inventario de un producto en una bodega (contadores fragmentados)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['split', 'rebalance', 'collapse', 'status'])
+        parser.add_argument('--product', required=True, help='Nombre del producto')
+        parser.add_argument('--warehouse', help='Nombre de la bodega (por defecto todas las del producto)')
+        parser.add_argument('--shards', type=int, default=8, help='Número de fragmentos para split')
+
+    def handle(self, *args, **options):
+        qs = Inventory.objects.select_related('product', 'warehouse').filter(product__name=options['product'])
+        if options['warehouse']:
+            qs = qs.filter(warehouse__name=options['warehouse'])
+        inventories = list(qs.order_by('pk'))
+        if not inventories:
+            raise CommandError('No hay inventario para ese producto/bodega')
+
+        action = options['action']
+        for inv in inventories:
+            if action == 'split':
+                inv = split_inventory(inv.pk, options['shards'])
+            elif action == 'rebalance':
+                inv = rebalance_shards(inv.pk)
+            elif action == 'collapse':
+                inv = collapse_shards(inv.pk)
+
+            shards = list(inv.shards.order_by('index').values_list('quantity', flat=True))
+            detail = f' fragmentos={shards}' if shards else ''
+            self.stdout.write(f'   - {inv.product.name} @ {inv.warehouse.name}: {inv.get_quantity()} unidades{detail}')
+
+        self.stdout.write(self.style.SUCCESS(f'{action}: {len(inventories)} inventario(s) procesados'))
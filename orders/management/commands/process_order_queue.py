@@ -0,0 +1,53 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orders.intake import claim_batch, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de pedidos asíncronos en lotes agrupados por producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Hilos que drenan la cola')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--idle-sleep', type=float, default=0.2, help='Espera cuando la cola está vacía')
+        parser.add_argument('--once', action='store_true', help='Drena la cola y termina')
+
+    def handle(self, *args, **options):
+        processed = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    try:
+                        intakes = claim_batch(options['batch_size'])
+                    except Exception as e: #el reclamo ya se reintenta con RetryPolicy; el hilo sigue vivo
+                        self.stderr.write(self.style.ERROR(f'No se pudo reclamar un lote: {e}'))
+                        time.sleep(options['idle_sleep'])
+                        continue
+                    if not intakes:
+                        if options['once']: return
+                        time.sleep(options['idle_sleep'])
+                        continue
+                    try:
+                        done = process_batch(intakes)
+                    except Exception as e:
+                        self.stderr.write(self.style.ERROR(f'Lote de {len(intakes)} pedidos falló: {e}'))
+                        continue
+                    with lock:
+                        processed.append(done)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(options['workers'])]
+        for t in threads: t.start()
+        try:
+            for t in threads: t.join()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Pedidos procesados: {sum(processed)} en {len(processed)} lotes'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Elimina las claves de idempotencia vencidas y sus respuestas guardadas'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Claves eliminadas: {deleted}'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.models import Product, Warehouse
+from orders.rebalancing import DEFAULT_MIN_UNITS, DEFAULT_WINDOW_DAYS, apply_moves, plan_rebalance
+
+
+class Command(BaseCommand):
+    help = 'Propone (y con --apply ejecuta) traslados de stock entre bodegas según la demanda reciente por zona'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=DEFAULT_WINDOW_DAYS, help='Días de demanda a considerar')
+        parser.add_argument('--min-units', type=int, default=DEFAULT_MIN_UNITS,
+                            help='Unidades mínimas a mover por producto para proponer traslados')
+        parser.add_argument('--apply', action='store_true', help='Aplica los traslados en una sola transacción')
+        parser.add_argument('--limit', type=int, default=50, help='Traslados a listar (0 = ninguno)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        plan = plan_rebalance(options['window_days'], options['min_units'])
+        planned = time.perf_counter()
+
+        if options['limit'] and len(plan):
+            shown = list(plan.moves())[:options['limit']]
+            products = dict(Product.objects.filter(pk__in={move[0] for move in shown}).values_list('pk', 'name'))
+            warehouses = dict(Warehouse.objects.values_list('pk', 'name'))
+            for (product_id, source, target, units), km in zip(shown, plan.km.tolist()):
+                self.stdout.write(f'{products[product_id]}: {warehouses[source]} → {warehouses[target]} {units} u ({km:.1f} km)')
+            if len(plan) > len(shown):
+                self.stdout.write(f'... y {len(plan) - len(shown):,} traslados más')
+
+        self.stdout.write(
+            f'{len(plan):,} traslados, {int(plan.units.sum()):,} unidades, {plan.unit_km():,.0f} unidades × km '
+            f'(plan en {planned - start:.2f} s)'
+        )
+        if not options['apply'] or not len(plan):
+            return
+
+        results = apply_moves(plan.moves())
+        applied = sum(1 for r in results if r['applied'])
+        style = self.style.SUCCESS if applied == len(results) else self.style.WARNING
+        self.stdout.write(style(
+            f'{applied:,} traslados aplicados, {len(results) - applied:,} rechazados en {time.perf_counter() - planned:.2f} s'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import DeliveryZone, ZoneRoute
+from orders.routing import rebuild_zone_routes
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla de ruteo zona de entrega → bodegas (p. ej. tras cargar bodegas con bulk_create)'
+
+    def handle(self, *args, **options):
+        rows = rebuild_zone_routes()
+        for zone in DeliveryZone.objects.filter(is_active=True):
+            ranking = ZoneRoute.objects.filter(zone=zone).select_related('warehouse').order_by('rank')[:3]
+            self.stdout.write(f'   {zone.code}: ' + ', '.join(f'{r.warehouse.name} ({r.distance_km:.1f} km)' for r in ranking))
+        self.stdout.write(self.style.SUCCESS(f'{rows} rutas escritas'))
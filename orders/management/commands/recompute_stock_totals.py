@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from orders.models import Inventory, InventoryShard, Product, Warehouse
+
+
+class Command(BaseCommand):
+    help = 'Recalcula Product.total_stock y Warehouse.current_stock desde Inventory y corrige las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo reporta las diferencias')
+
+    def _expected(self, field):
+        totals = {}
+        for pk, total in Inventory.objects.filter(**{f'{field}__isnull': False}).values_list(field).annotate(total=Sum('quantity')).order_by():
+            totals[pk] = total or 0
+        for pk, total in InventoryShard.objects.filter(**{f'inventory__{field}__isnull': False}).values_list(f'inventory__{field}').annotate(total=Sum('quantity')).order_by():
+            totals[pk] = totals.get(pk, 0) + (total or 0)
+        return totals
+
+    def _repair(self, model, column, field, dry_run):
+        with transaction.atomic():
+            # primero se bloquean los totales: un cambio de stock en curso espera y aplica su delta después
+            # (los deltas se escriben al confirmar cada cambio: con pedidos en vuelo, repetir con --dry-run para confirmar)
+            current = list(model.objects.select_for_update().order_by('pk').values_list('pk', column))
+            expected = self._expected(field)
+            drifted = [model(pk=pk, **{column: expected.get(pk, 0)}) for pk, value in current if value != expected.get(pk, 0)]
+            if drifted and not dry_run:
+                model.objects.bulk_update(drifted, [column], batch_size=500)
+        return len(drifted)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        products = self._repair(Product, 'total_stock', 'product', dry_run)
+        warehouses = self._repair(Warehouse, 'current_stock', 'warehouse', dry_run)
+        verb = 'con diferencias' if dry_run else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(f'Productos {verb}: {products}  bodegas {verb}: {warehouses}'))
@@ -0,0 +1,61 @@
+import csv, json, sys, time
+
+from django.core.management.base import BaseCommand, CommandError
+from orders.logic import restock_bulk
+
+
+class Command(BaseCommand):
+    help = 'Reabastece inventario desde un archivo CSV/JSONL (product, warehouse, units) en lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo .csv o .jsonl ("-" para stdin)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Por defecto según la extensión')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Lineas por transacción')
+
+    def _rows(self, handle, fmt):
+        if fmt == 'csv':
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if not line.strip(): continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else None)
+        if fmt is None:
+            raise CommandError('No se pudo deducir el formato; use --format csv|jsonl')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size debe ser mayor a cero')
+
+        read = applied = 0
+        handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        start = time.perf_counter()
+
+        def flush(chunk):
+            nonlocal applied
+            for offset, result in enumerate(restock_bulk(chunk)):
+                if result['applied']:
+                    applied += 1
+                else:
+                    self.stderr.write(f'   linea {read - len(chunk) + offset + 1}: {result["error"]}')
+
+        try:
+            chunk = []
+            for row in self._rows(handle, fmt):
+                read += 1
+                chunk.append(row)
+                if len(chunk) >= options['chunk_size']:
+                    flush(chunk); chunk = []
+            if chunk:
+                flush(chunk)
+        finally:
+            if handle is not sys.stdin: handle.close()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Leídas: {read}  aplicadas: {applied}  rechazadas: {read - applied}  ({read / elapsed if elapsed else 0:,.0f} lineas/s)'
+        ))
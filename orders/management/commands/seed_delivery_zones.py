@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import DeliveryZone
+
+# zonas del formulario de pedidos; el codigo es la llave, las existentes no se modifican
+DEFAULT_ZONES = [
+    {'code': 'norte', 'name': 'Zona Norte - Usaquén, Chapinero, Suba', 'latitude': 4.710989, 'longitude': -74.072092},
+    {'code': 'centro', 'name': 'Zona Centro - Teusaquillo, Santa Fe, Candelaria', 'latitude': 4.598889, 'longitude': -74.080833},
+    {'code': 'sur', 'name': 'Zona Sur - Kennedy, Bosa, Tunjuelito', 'latitude': 4.570868, 'longitude': -74.297333},
+    {'code': 'occidente', 'name': 'Zona Occidente - Fontibón, Engativá', 'latitude': 4.680389, 'longitude': -74.146667},
+    {'code': 'oriente', 'name': 'Zona Oriente - San Cristóbal, Usme', 'latitude': 4.567778, 'longitude': -74.086111},
+]
+
+
+class Command(BaseCommand):
+    help = 'Crea las zonas de entrega por defecto que falten (idempotente; ejecutar tras migrate)'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for order, zone_data in enumerate(DEFAULT_ZONES):
+                # save() de cada zona nueva construye su tabla de ruteo
+                zone, created = DeliveryZone.objects.get_or_create(
+                    code=zone_data['code'], defaults={**zone_data, 'sort_order': order}
+                )
+                self.stdout.write(f'   - {zone.name}: {"creada" if created else "ya existia"}')
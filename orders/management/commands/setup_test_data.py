@@ -1,5 +1,6 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from orders.models import Warehouse, Product, Inventory
+from orders.models import DeliveryZone, Warehouse, Product, Inventory
 from products.models import Variable
 from django.db import transaction
 
@@ -33,6 +34,9 @@ class Command(BaseCommand):
                 self.stdout.write(f'   - {wh.name}: {status}')
                 warehouses.append(wh)
 
+            # 1b. Zonas de entrega del formulario de pedidos; la tabla de ruteo se construye al guardarlas
+            call_command('seed_delivery_zones', stdout=self.stdout)
+
             # 2. Crear Productos (Variables) - Equipos de Protección Personal (EPP)
             self.stdout.write('\n' + self.style.WARNING('2. Creando productos de seguridad...'))
             products_data = [
@@ -126,6 +130,7 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS('Resumen:'))
         self.stdout.write(f'  - Bodegas creadas: {Warehouse.objects.count()}')
+        self.stdout.write(f'  - Zonas de entrega: {DeliveryZone.objects.count()}')
         self.stdout.write(f'  - Productos creados: {Product.objects.count()}')
         self.stdout.write(f'  - Variables creadas: {Variable.objects.count()}')
         self.stdout.write(f'  - Registros de inventario: {Inventory.objects.count()}')
@@ -1,5 +1,8 @@
-from django.db import models
+import threading
+
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from .validators import (
     validate_coordinates, validate_name_format, validate_positive_quantity,
@@ -8,6 +11,102 @@ from .validators import (
 )
 
 
+def _preserving(instance, field: str, kwargs: dict) -> dict:
+    #un save() completo de una instancia ya cargada no debe pisar el total denormalizado con un valor viejo
+    if not instance._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+        kwargs['update_fields'] = [f.name for f in instance._meta.concrete_fields if not f.primary_key and f.name != field]
+    return kwargs
+
+
+# totales confirmados que aun no se escriben: (deltas por producto, deltas por bodega)
+_pending_totals = ({}, {})
+_pending_lock = threading.Lock()
+_flushing = False
+
+
+def adjust_stock_totals(changes):
+    #registra cambios (product_id, warehouse_id, delta) de Product.total_stock y Warehouse.current_stock; se llama en la
+    #misma transaccion que el cambio de Inventory pero se aplican al confirmarla, fuera de sus bloqueos, asi los pedidos
+    #no se encolan detras de la fila del producto o de la bodega (el hot row que evitan los fragmentos de inventario)
+    per_product, per_warehouse = {}, {}
+    for product_id, warehouse_id, delta in changes:
+        per_product[product_id] = per_product.get(product_id, 0) + delta
+        if warehouse_id is not None:
+            per_warehouse[warehouse_id] = per_warehouse.get(warehouse_id, 0) + delta
+    if any(per_product.values()) or any(per_warehouse.values()):
+        #robust: el cambio de inventario ya se confirmo; si escribir los totales falla, Django registra el error y
+        #recompute_stock_totals corrige la diferencia, en vez de propagarlo y que RetryPolicy repita el pedido
+        transaction.on_commit(lambda: _apply_totals(per_product, per_warehouse), robust=True)
+
+
+def _merge(target, deltas):
+    for pk, delta in deltas.items():
+        target[pk] = target.get(pk, 0) + delta
+
+
+def _apply_totals(per_product, per_warehouse):
+    #agrupa los commits concurrentes del proceso: mientras un hilo escribe, los demas solo suman sus deltas y
+    #ese hilo los aplica en la siguiente vuelta, un UPDATE por tabla para todos; si el proceso muere con deltas
+    #pendientes, recompute_stock_totals corrige la diferencia
+    global _flushing
+    with _pending_lock:
+        _merge(_pending_totals[0], per_product)
+        _merge(_pending_totals[1], per_warehouse)
+        if _flushing: return
+        _flushing = True
+    while True:
+        with _pending_lock:
+            products, warehouses = dict(_pending_totals[0]), dict(_pending_totals[1])
+            _pending_totals[0].clear(); _pending_totals[1].clear()
+            if not products and not warehouses:
+                _flushing = False
+                return
+        try:
+            with transaction.atomic():
+                _bump(Product, 'total_stock', products)
+                _bump(Warehouse, 'current_stock', warehouses)
+                _check_thresholds(products)
+        except Exception:
+            with _pending_lock:
+                _merge(_pending_totals[0], products)
+                _merge(_pending_totals[1], warehouses)
+                _flushing = False
+            raise
+
+
+def _check_thresholds(deltas: dict):
+    #compara el total antes y despues del cambio con min_stock/max_stock: solo un cruce de umbral escribe
+    #(abre la alerta) o resuelve la abierta al volver al rango; una alerta abierta por producto y tipo
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas: return
+    opened, resolved = [], []
+    for pk, total, min_stock, max_stock in Product.objects.filter(pk__in=deltas).values_list('pk', 'total_stock', 'min_stock', 'max_stock'):
+        before = total - deltas[pk]
+        if before >= min_stock > total:
+            opened.append(StockAlert(product_id=pk, kind=StockAlert.LOW, threshold=min_stock, stock=total))
+        elif total >= min_stock > before:
+            resolved.append((pk, StockAlert.LOW))
+        if before <= max_stock < total:
+            opened.append(StockAlert(product_id=pk, kind=StockAlert.HIGH, threshold=max_stock, stock=total))
+        elif total <= max_stock < before:
+            resolved.append((pk, StockAlert.HIGH))
+    if opened:
+        StockAlert.objects.bulk_create(opened, ignore_conflicts=True)
+    for pk, kind in resolved:
+        StockAlert.objects.filter(product_id=pk, kind=kind, resolved_at__isnull=True).update(resolved_at=timezone.now())
+
+
+def _bump(model, field: str, deltas: dict):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if len(deltas) == 1:
+        (pk, delta), = deltas.items()
+        model.objects.filter(pk=pk).update(**{field: models.F(field) + delta})
+    elif deltas:
+        model.objects.filter(pk__in=deltas).update(**{field: models.Case(
+            *[models.When(pk=pk, then=models.F(field) + delta) for pk, delta in deltas.items()], output_field=models.IntegerField()
+        )})
+
+
 class Warehouse(models.Model):
     name = models.CharField(max_length=100, unique=True, validators=[validate_name_format])
     latitude = models.FloatField()
@@ -15,6 +114,7 @@ class Warehouse(models.Model):
     address = models.TextField(blank=True, null=True, validators=[validate_address_format])
     phone = models.CharField(max_length=20, blank=True, null=True, validators=[validate_phone_number])
     capacity = models.PositiveIntegerField(default=50000)
+    current_stock = models.IntegerField(default=0, editable=False)  # denormalizado: se ajusta con cada cambio de Inventory
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
@@ -51,13 +151,13 @@ class Warehouse(models.Model):
     def save(self, *args, **kwargs):
         if not kwargs.pop('skip_validation', False):
             self.full_clean()
-        super().save(*args, **kwargs)
+        super().save(*args, **_preserving(self, 'current_stock', kwargs))
     
     def __str__(self):
         return self.name
     
     def get_current_stock(self):
-        return self.inventories.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.current_stock
     
     def get_available_capacity(self):
         return self.capacity - self.get_current_stock()
@@ -134,6 +234,7 @@ class Product(models.Model):
     category = models.CharField(max_length=100, blank=True, null=True)
     min_stock = models.PositiveIntegerField(default=0)
     max_stock = models.PositiveIntegerField(default=10000)
+    total_stock = models.IntegerField(default=0, editable=False)  # denormalizado: se ajusta con cada cambio de Inventory
     is_active = models.BooleanField(default=True)
     requires_special_handling = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
@@ -177,13 +278,13 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not kwargs.pop('skip_validation', False):
             self.full_clean()
-        super().save(*args, **kwargs)
+        super().save(*args, **_preserving(self, 'total_stock', kwargs))
 
     def __str__(self):
         return self.name
     
     def get_total_stock(self):
-        return self.inventories.aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.total_stock
     
     def get_profit_margin(self):
         if self.cost_price and self.cost_price > 0:
@@ -196,6 +297,8 @@ class Inventory(models.Model):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='inventories', null=True, blank=True)
     quantity = models.PositiveIntegerField(default=0)
     reserved_quantity = models.PositiveIntegerField(default=0)
+    shard_count = models.PositiveSmallIntegerField(default=0)  # 0 = sin fragmentar; si no, el stock vive en InventoryShard
+    version = models.PositiveIntegerField(default=0)  # sube con cada cambio de stock; base del ETag de inventario
     updated_at = models.DateTimeField(auto_now=True)
     last_restock_date = models.DateTimeField(null=True, blank=True)
 
@@ -206,7 +309,8 @@ class Inventory(models.Model):
         indexes = [
             models.Index(fields=['product', 'quantity']),
             models.Index(fields=['warehouse']),
-            models.Index(fields=['product', 'warehouse'])
+            models.Index(fields=['product', 'warehouse']),
+            models.Index(fields=['product', 'version'])
         ]
     
     def clean(self):
@@ -231,14 +335,39 @@ class Inventory(models.Model):
     def save(self, *args, **kwargs):
         if not kwargs.pop('skip_validation', False):
             self.full_clean()
+        if self.pk:
+            self.version += 1
+        previous = Inventory.objects.filter(pk=self.pk).values_list('product_id', 'warehouse_id', 'quantity').first() if self.pk else None
         super().save(*args, **kwargs)
+        adjust_stock_totals([(self.product_id, self.warehouse_id, self.quantity)] + ([(previous[0], previous[1], -previous[2])] if previous else []))
     
     def __str__(self):
         wn = self.warehouse.name if self.warehouse else "N/A"
         return f"{self.product.name} @ {wn} — {self.quantity} u"
     
+    def get_quantity(self):
+        if not self.shard_count:
+            return self.quantity
+        return self.quantity + (self.shards.aggregate(total=models.Sum('quantity'))['total'] or 0)
+
     def get_available_quantity(self):
-        return self.quantity - self.reserved_quantity
+        return self.get_quantity() - self.reserved_quantity
+
+
+class InventoryShard(models.Model):
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Fragmento de inventario'
+        verbose_name_plural = 'Fragmentos de inventario'
+        unique_together = [('inventory', 'index')]
+        indexes = [models.Index(fields=['inventory', 'quantity'])]
+
+    def __str__(self):
+        return f"{self.inventory_id}#{self.index} — {self.quantity} u"
 
 
 class Order(models.Model):
@@ -267,16 +396,21 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=1)  # intentos de la transaccion hasta completarse
+    lock_wait_ms = models.PositiveIntegerField(default=0)  # tiempo perdido por contencion de bloqueos
 
     class Meta:
         verbose_name = 'Pedido'
         verbose_name_plural = 'Pedidos'
         ordering = ['-created_at']
+        # (created_at, id) al final: el historial pagina por cursor sobre ese par con o sin filtro
         indexes = [
             models.Index(fields=['product', 'status']),
-            models.Index(fields=['status', 'created_at']),
-            models.Index(fields=['customer']),
-            models.Index(fields=['assigned_warehouse'])
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['product', 'created_at', 'id']),
+            models.Index(fields=['customer', 'created_at', 'id']),
+            models.Index(fields=['assigned_warehouse', 'created_at', 'id'])
         ]
     
     def clean(self):
@@ -330,9 +464,226 @@ class Order(models.Model):
         return f"Pedido #{self.id} - {self.product.name} x{self.units} [{self.get_status_display()}]"
 
 
-from django.db.models.signals import post_save
+class OrderAllocation(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='allocations')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.PROTECT, related_name='allocations')
+    units = models.PositiveIntegerField(validators=[validate_positive_quantity])
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Asignación de pedido'
+        verbose_name_plural = 'Asignaciones de pedido'
+        unique_together = [('order', 'warehouse')]
+        indexes = [models.Index(fields=['warehouse'])]
+
+    def __str__(self):
+        return f"Pedido #{self.order_id} ← {self.warehouse.name}: {self.units} u"
+
+
+class Reservation(models.Model):
+    ACTIVE = 'ACTIVE'
+    COMMITTED = 'COMMITTED'
+    RELEASED = 'RELEASED'
+    EXPIRED = 'EXPIRED'
+
+    STATUS_CHOICES = [
+        (ACTIVE, 'Activa'), (COMMITTED, 'Confirmada'), (RELEASED, 'Liberada'), (EXPIRED, 'Expirada'),
+    ]
+
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='reservations')
+    units = models.PositiveIntegerField(validators=[validate_positive_quantity])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservation')
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Reserva'
+        verbose_name_plural = 'Reservas'
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+
+    def __str__(self):
+        return f"Reserva #{self.id} - {self.units} u [{self.get_status_display()}]"
+
+
+class StockAlert(models.Model):
+    # una fila por cruce de umbral del stock total de un producto; la escribe adjust_stock_totals
+    LOW = 'LOW'
+    HIGH = 'HIGH'
+
+    KIND_CHOICES = [(LOW, 'Bajo el mínimo'), (HIGH, 'Sobre el máximo')]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    threshold = models.PositiveIntegerField()
+    stock = models.IntegerField()  # stock total al momento del cruce
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Alerta de stock'
+        verbose_name_plural = 'Alertas de stock'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind'], condition=models.Q(resolved_at__isnull=True),
+                                    name='unique_open_stock_alert'),
+        ]
+        indexes = [models.Index(fields=['kind', 'resolved_at', 'id'])]
+
+    def __str__(self):
+        return f"{self.product_id} {self.get_kind_display()} ({self.stock}/{self.threshold})"
+
+
+class IdempotencyKey(models.Model):
+    IN_PROGRESS = 'IN_PROGRESS'
+    DONE = 'DONE'
+
+    STATE_CHOICES = [(IN_PROGRESS, 'En proceso'), (DONE, 'Completada')]
+
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=IN_PROGRESS)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    response_body = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(default=timezone.now)  # inicio del lease de la peticion que la procesa
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Clave de idempotencia'
+        verbose_name_plural = 'Claves de idempotencia'
+        indexes = [models.Index(fields=['expires_at'])]
+
+    def __str__(self):
+        return f"{self.key} [{self.get_state_display()}]"
+
+
+class OrderIntake(models.Model):
+    QUEUED = 'QUEUED'
+    PROCESSING = 'PROCESSING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'En cola'), (PROCESSING, 'Procesando'), (DONE, 'Procesado'), (FAILED, 'Fallido'),
+    ]
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='intake')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='intakes')
+    units = models.PositiveIntegerField(validators=[validate_positive_quantity])
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    main_warehouse_name = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Pedido en cola'
+        verbose_name_plural = 'Pedidos en cola'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'product', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Cola #{self.id} → Pedido #{self.order_id} [{self.get_status_display()}]"
+
+
+class DailySales(models.Model):
+    # rollup de pedidos por dia de creacion, producto y bodega asignada (None para los rechazados);
+    # lo mantiene orders.rollups al confirmar, rechazar o cancelar y lo reconstruye backfill_sales_rollups
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='daily_sales', null=True, blank=True)
+    confirmed_orders = models.IntegerField(default=0)
+    confirmed_units = models.IntegerField(default=0)
+    rejected_orders = models.IntegerField(default=0)
+    rejected_units = models.IntegerField(default=0)
+    cancelled_orders = models.IntegerField(default=0)
+    cancelled_units = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Ventas diarias'
+        verbose_name_plural = 'Ventas diarias'
+        unique_together = [('day', 'product', 'warehouse')]
+        indexes = [models.Index(fields=['product', 'day']), models.Index(fields=['warehouse', 'day'])]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}@{self.warehouse_id}: {self.confirmed_units} u"
+
+
+class DeliveryZone(models.Model):
+    # zona de entrega del formulario de pedidos; sus bodegas ordenadas por distancia viven en ZoneRoute
+    code = models.SlugField(max_length=50, unique=True)  # es lo que se guarda en Order.delivery_zone
+    name = models.CharField(max_length=100)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    is_active = models.BooleanField(default=True)
+    sort_order = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Zona de entrega'
+        verbose_name_plural = 'Zonas de entrega'
+        ordering = ['sort_order', 'code']
+
+    def clean(self):
+        if self.latitude is None or self.longitude is None: return
+        try:
+            validate_coordinates(self.latitude, self.longitude)
+        except ValidationError as e:
+            raise ValidationError({'latitude': e.message})
+
+    def __str__(self):
+        return self.name
+
+
+class ZoneRoute(models.Model):
+    # tabla de ruteo: bodegas activas de cada zona de la más cercana (rank 0) a la más lejana;
+    # la reconstruye orders.routing cuando cambia una bodega o una zona
+    zone = models.ForeignKey(DeliveryZone, on_delete=models.CASCADE, related_name='routes')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='zone_routes')
+    rank = models.PositiveSmallIntegerField()
+    distance_km = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Ruta de zona'
+        verbose_name_plural = 'Rutas de zona'
+        ordering = ['zone', 'rank']
+        unique_together = [('zone', 'rank'), ('zone', 'warehouse')]
+
+    def __str__(self):
+        return f"{self.zone_id} #{self.rank} → {self.warehouse_id} ({self.distance_km:.1f} km)"
+
+
+class StockTransfer(models.Model):
+    # traslado de stock entre bodegas aplicado por orders.rebalancing.apply_moves
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='transfers')
+    from_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='transfers_out')
+    to_warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='transfers_in')
+    units = models.PositiveIntegerField(validators=[validate_positive_quantity])
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Traslado de stock'
+        verbose_name_plural = 'Traslados de stock'
+        indexes = [models.Index(fields=['product', 'created_at']), models.Index(fields=['created_at', 'id'])]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.from_warehouse_id} → {self.to_warehouse_id} ({self.units} u)"
+
+
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 
+@receiver(pre_delete, sender=Inventory)
+def discount_deleted_inventory(sender, instance, **kwargs):
+    # pre_delete: los fragmentos todavia existen y cuentan en el total
+    adjust_stock_totals([(instance.product_id, instance.warehouse_id, -instance.get_quantity())])
+
 @receiver(post_save, sender=Order)
 def update_inventory_on_confirm(sender, instance, **kwargs):
     if instance.status == Order.CONFIRMED:
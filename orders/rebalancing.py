@@ -0,0 +1,286 @@
+"""Rebalanceo de stock entre bodegas con un problema de transporte de costo mínimo.
+
+Entradas, todas como matrices NumPy:
+
+* stock libre por producto y bodega (productos × bodegas, el mismo de ``replenishment``);
+* demanda reciente por zona de entrega: los pedidos confirmados y rechazados de la ventana,
+  cada zona atribuida a su bodega más cercana (un pedido sin zona cuenta en su bodega asignada);
+* distancias en km entre bodegas (haversine).
+
+El stock total de cada producto se reparte entre bodegas en proporción a su demanda; lo que
+sobra en unas y falta en otras se cruza con un solver de transporte en proceso que minimiza
+unidades × km. Con una sola bodega de origen o de destino la solución es directa y se calcula
+vectorizada para todos los productos a la vez; el resto pasa por caminos más cortos sucesivos.
+
+``apply_moves`` ejecuta los traslados en una transacción: bloquea las filas de inventario en
+orden de pk, descuenta y suma en un solo UPDATE por lote y registra cada StockTransfer.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+import numpy as np
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+
+from .models import Inventory, InventoryShard, Order, StockTransfer, Warehouse, adjust_stock_totals
+from .replenishment import DEFAULT_WINDOW_DAYS, _fetch, _scatter, load_available
+from .retry import RetryContext, RetryPolicy
+from .sharding import StockChanged, decrement_sharded, with_stock
+from .routing import router
+from .spatial import haversine_matrix
+
+DEFAULT_MIN_UNITS = 10
+EPS = 1e-9
+SOLVER_CELLS = 2_000_000  # celdas de flujo por lote del solver
+
+# estados que cuentan como demanda; los rechazados son justamente la demanda que no se atendió
+DEMAND_STATUSES = [Order.CONFIRMED, Order.IN_TRANSIT, Order.DELIVERED, Order.REJECTED]
+
+
+@dataclass
+class RebalancePlan:
+    product_ids: np.ndarray  # (M,)
+    from_ids: np.ndarray     # (M,) bodega de origen
+    to_ids: np.ndarray       # (M,) bodega de destino
+    units: np.ndarray        # (M,)
+    km: np.ndarray           # (M,) distancia del traslado
+
+    def __len__(self):
+        return len(self.units)
+
+    def moves(self):
+        #tuplas (product_id, from_warehouse_id, to_warehouse_id, units), las que recibe apply_moves
+        return zip(self.product_ids.tolist(), self.from_ids.tolist(), self.to_ids.tolist(), self.units.tolist())
+
+    def unit_km(self) -> float:
+        return float((self.units * self.km).sum())
+
+
+def zone_demand(product_ids: np.ndarray, warehouse_ids: np.ndarray, window_days: int=DEFAULT_WINDOW_DAYS, now=None) -> np.ndarray:
+    """Unidades pedidas en la ventana por producto y bodega (P × W), con cada zona en su bodega más cercana."""
+    since = (now or timezone.now()) - timedelta(days=window_days)
+    nearest = router.nearest()
+    rows = (Order.objects.filter(created_at__gte=since, status__in=DEMAND_STATUSES)
+            .values('product_id', 'delivery_zone', 'assigned_warehouse_id').annotate(total=Sum('units'))
+            .order_by().values_list('product_id', 'delivery_zone', 'assigned_warehouse_id', 'total'))
+    triples = [(product_id, nearest.get(zone, warehouse_id), units) for product_id, zone, warehouse_id, units in rows
+               if nearest.get(zone, warehouse_id) is not None]
+    demand = np.zeros((len(product_ids), len(warehouse_ids)), dtype=np.float32)
+    _scatter(demand, product_ids, warehouse_ids, np.array(triples, dtype=np.int64).reshape(-1, 3), 2, add=True)
+    return demand
+
+
+def distance_matrix(warehouse_ids: np.ndarray) -> np.ndarray:
+    coords = _fetch(Warehouse.objects.filter(pk__in=warehouse_ids.tolist()).order_by('pk'), ['latitude', 'longitude'], dtype=np.float64)
+    return haversine_matrix(coords[:, 0], coords[:, 1], coords[:, 0], coords[:, 1])
+
+
+def targets(available: np.ndarray, demand: np.ndarray) -> np.ndarray:
+    """Stock objetivo entero por producto y bodega: el total del producto repartido según la demanda.
+
+    Redondeo por mayor residuo, así cada fila suma exactamente el stock actual; los productos
+    sin demanda en la ventana se quedan como están.
+    """
+    stock = np.floor(np.clip(available, 0, None)).astype(np.int64)
+    total = stock.sum(axis=1)
+    demand_total = demand.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = np.where(demand_total[:, None] > 0, total[:, None] * (demand / demand_total[:, None]), stock)
+    target = np.floor(raw).astype(np.int64)
+    remainder = total - target.sum(axis=1)
+    ranks = np.empty_like(target)
+    rows = np.arange(len(target))[:, None]
+    ranks[rows, np.argsort(target - raw, axis=1, kind='stable')] = np.arange(target.shape[1])
+    return target + (ranks < remainder[:, None])
+
+
+def solve_transport(supply, demand, cost) -> np.ndarray:
+    """Flujos enteros de costo mínimo para un lote de problemas de transporte.
+
+    ``supply`` es B × S, ``demand`` es B × D y ``cost`` S × D (común) o B × S × D; retorna el
+    flujo B × S × D.
+    Caminos más cortos sucesivos: en cada ronda un Bellman-Ford sobre la red residual (arcos
+    origen→destino sin límite y destino→origen donde ya hay flujo) encuentra, para todos los
+    problemas del lote a la vez, el destino pendiente más barato de alcanzar, y se envía por ese
+    camino lo que permita el cuello de botella. Los problemas resueltos salen del lote. Si la
+    oferta y la demanda no suman igual, se envía el mínimo de ambas.
+    """
+    supply = np.array(supply, dtype=np.int64, ndmin=2)
+    demand = np.array(demand, dtype=np.int64, ndmin=2)
+    cost = np.broadcast_to(np.asarray(cost, dtype=float), (len(supply),) + np.shape(cost)[-2:])
+    S, D = cost.shape[1:]
+    flow = np.zeros((len(supply), S, D), dtype=np.int64)
+    active = np.flatnonzero(supply.any(axis=1) & demand.any(axis=1))
+
+    while len(active):
+        sup, dem, fl, c = supply[active], demand[active], flow[active], cost[active]
+        rows = np.arange(len(active))
+        dist_s = np.where(sup > 0, 0.0, np.inf)
+        pred_s = np.full(sup.shape, -1)
+        dist_d = np.full(dem.shape, np.inf)
+        pred_d = np.zeros(dem.shape, dtype=np.int64)
+        todo = rows  # sólo se relajan los problemas cuyas distancias cambiaron en la pasada anterior
+        for _ in range(S + D):
+            # los predecesores sólo cambian con una mejora estricta: con empates el camino podría cerrarse en ciclo
+            reach = dist_s[todo, :, None] + c[todo]
+            best = reach.argmin(axis=1)
+            value = np.take_along_axis(reach, best[:, None, :], axis=1)[:, 0, :]
+            closer = value < dist_d[todo] - EPS
+            pred_d[todo] = np.where(closer, best, pred_d[todo])
+            dist_d[todo] = np.where(closer, value, dist_d[todo])
+            back = np.where(fl[todo] > 0, dist_d[todo, None, :] - c[todo], np.inf)
+            via = back.argmin(axis=2)
+            value = np.take_along_axis(back, via[:, :, None], axis=2)[:, :, 0]
+            better = value < dist_s[todo] - EPS
+            dist_s[todo] = np.where(better, value, dist_s[todo])
+            pred_s[todo] = np.where(better, via, pred_s[todo])
+            todo = todo[better.any(axis=1)]
+            if not len(todo): break
+
+        # se recorre el camino dos veces: primero el cuello de botella, luego el envío
+        sink = np.where(dem > 0, dist_d, np.inf).argmin(axis=1)
+        amount, root, d, live = dem[rows, sink], np.zeros_like(sink), sink, np.ones(len(rows), dtype=bool)
+        while live.any():
+            s = pred_d[rows, d]
+            root = np.where(live, s, root)
+            nxt = pred_s[rows, s]
+            live &= nxt >= 0
+            amount = np.where(live, np.minimum(amount, fl[rows, s, np.maximum(nxt, 0)]), amount)
+            d = np.where(live, nxt, d)
+        amount = np.minimum(amount, sup[rows, root])
+        d, live = sink, np.ones(len(rows), dtype=bool)
+        while live.any():
+            s = pred_d[rows, d]
+            fl[rows[live], s[live], d[live]] += amount[live]
+            nxt = pred_s[rows, s]
+            live &= nxt >= 0
+            fl[rows[live], s[live], nxt[live]] -= amount[live]
+            d = np.where(live, nxt, d)
+        sup[rows, root] -= amount
+        dem[rows, sink] -= amount
+
+        supply[active], demand[active], flow[active] = sup, dem, fl
+        active = active[sup.any(axis=1) & dem.any(axis=1)]
+    return flow
+
+
+def plan_moves(available: np.ndarray, demand: np.ndarray, distances: np.ndarray, min_units: int=DEFAULT_MIN_UNITS):
+    """Traslados (producto, origen, destino, unidades) como índices de las matrices, ordenados."""
+    target = targets(available, demand)
+    stock = np.floor(np.clip(available, 0, None)).astype(np.int64)
+    surplus = np.clip(stock - target, 0, None)
+    deficit = np.clip(target - stock, 0, None)
+    worth = deficit.sum(axis=1) >= max(min_units, 1)  # oferta y demanda suman igual por producto
+    surplus[~worth] = 0
+    deficit[~worth] = 0
+    n_sources = np.count_nonzero(surplus, axis=1)
+    n_sinks = np.count_nonzero(deficit, axis=1)
+
+    parts = []
+    # un solo origen: cada destino recibe su faltante desde ahí
+    one_source = worth & (n_sources == 1)
+    p, w = np.nonzero(deficit * one_source[:, None])
+    parts.append((p, surplus.argmax(axis=1)[p], w, deficit[p, w]))
+    # un solo destino: cada origen envía su sobrante
+    one_sink = worth & (n_sinks == 1) & ~one_source
+    p, w = np.nonzero(surplus * one_sink[:, None])
+    parts.append((p, w, deficit.argmax(axis=1)[p], surplus[p, w]))
+    # varios de cada lado: un problema de transporte por producto, reducido a sus bodegas con sobrante × con
+    # faltante; se resuelven en lotes de tamaños parecidos, acotados a SOLVER_CELLS celdas de flujo
+    rest = np.flatnonzero(worth & (n_sources > 1) & (n_sinks > 1))
+    rest = rest[np.argsort(n_sources[rest] * n_sinks[rest], kind='stable')]
+    start = 0
+    while start < len(rest):
+        block = max(1, SOLVER_CELLS // int(n_sources[rest[start:]].max() * n_sinks[rest[start:]].max()))
+        batch = rest[start:start + block]
+        start += len(batch)
+        S, D = n_sources[batch].max(), n_sinks[batch].max()
+        sources = np.argsort(surplus[batch] == 0, axis=1, kind='stable')[:, :S]
+        sinks = np.argsort(deficit[batch] == 0, axis=1, kind='stable')[:, :D]
+        flow = solve_transport(np.take_along_axis(surplus[batch], sources, axis=1), np.take_along_axis(deficit[batch], sinks, axis=1),
+                               distances[sources[:, :, None], sinks[:, None, :]])
+        b, i, j = np.nonzero(flow)
+        parts.append((batch[b], sources[b, i], sinks[b, j], flow[b, i, j]))
+    p, f, t, units = (np.concatenate(column).astype(np.int64) for column in zip(*parts))
+    order = np.lexsort((t, f, p))
+    return p[order], f[order], t[order], units[order]
+
+
+def plan_rebalance(window_days: int=DEFAULT_WINDOW_DAYS, min_units: int=DEFAULT_MIN_UNITS) -> RebalancePlan:
+    product_ids = _fetch(Inventory.objects.filter(product__is_active=True, warehouse__isnull=False)
+                         .values('product_id').distinct().order_by('product_id'), ['product_id'])[:, 0]
+    warehouse_ids = _fetch(Warehouse.objects.filter(is_active=True).order_by('pk'), ['pk'])[:, 0]
+    available, _ = load_available(product_ids, warehouse_ids)
+    demand = zone_demand(product_ids, warehouse_ids, window_days)
+    distances = distance_matrix(warehouse_ids)
+    p, f, t, units = plan_moves(available, demand, distances, min_units)
+    return RebalancePlan(product_ids[p], warehouse_ids[f], warehouse_ids[t], units, distances[f, t])
+
+
+def apply_moves(moves, max_retries: int=3, retry_policy: Optional[RetryPolicy]=None):
+    #aplica traslados (product_id, from_warehouse_id, to_warehouse_id, units) en una sola transaccion;
+    #un traslado sin stock libre suficiente en el origen se rechaza y el resto se aplica
+    moves = list(moves)
+    product_ids = {move[0] for move in moves}
+    warehouse_ids = {w for move in moves for w in move[1:3]}
+    wanted = {(p, w) for p, f, t, _ in moves for w in (f, t)}
+
+    def attempt(ctx: RetryContext):
+
+        with transaction.atomic():
+
+            # bloqueo en orden de pk, igual que allocate_lines
+            stock = {}
+            for pk, product_id, warehouse_id, available, shards in (with_stock(Inventory.objects.select_for_update()
+                    .filter(product_id__in=product_ids, warehouse_id__in=warehouse_ids)).order_by('pk')
+                    .values_list('pk', 'product_id', 'warehouse_id', 'available', 'shard_count')):
+                if (product_id, warehouse_id) in wanted:
+                    stock[(product_id, warehouse_id)] = [pk, available, shards]
+
+            results, deltas, transfers = [], {}, []
+            for i, (product_id, source, target, units) in enumerate(moves):
+                row = stock.get((product_id, source))
+                if units <= 0 or source == target:
+                    results.append({"move": i, "applied": False, "error": "Traslado invalido"})
+                    continue
+                if row is None or row[1] < units:
+                    results.append({"move": i, "applied": False, "error": "Stock insuficiente en la bodega de origen"})
+                    continue
+                row[1] -= units
+                if (product_id, target) in stock: stock[(product_id, target)][1] += units
+                deltas[(product_id, source)] = deltas.get((product_id, source), 0) - units
+                deltas[(product_id, target)] = deltas.get((product_id, target), 0) + units
+                transfers.append(StockTransfer(product_id=product_id, from_warehouse_id=source, to_warehouse_id=target, units=units))
+                results.append({"move": i, "applied": True})
+
+            # destinos sin fila de inventario: se crean ya con lo recibido
+            Inventory.objects.bulk_create([
+                Inventory(product_id=p, warehouse_id=w, quantity=delta)
+                for (p, w), delta in deltas.items() if (p, w) not in stock and delta > 0
+            ])
+            by_pk = {}
+            for key, delta in deltas.items():
+                if key not in stock or not delta: continue
+                pk, _, shards = stock[key]
+                if shards and delta < 0: #los inventarios fragmentados se descuentan sobre sus fragmentos
+                    if not decrement_sharded(pk, -delta): raise StockChanged()
+                    continue
+                if shards: #y reciben en el fragmento con menos stock, como increment_stock
+                    shard = InventoryShard.objects.filter(inventory_id=pk).order_by('quantity', 'index').values_list('pk', flat=True).first()
+                    if shard is not None:
+                        InventoryShard.objects.filter(pk=shard).update(quantity=F('quantity')+delta, version=F('version')+1)
+                        continue
+                by_pk[pk] = delta
+            if by_pk: #salidas y entradas de todas las filas sin fragmentar en un solo UPDATE
+                Inventory.objects.filter(pk__in=by_pk).update(
+                    quantity=Case(*[When(pk=pk, then=F('quantity')+delta) for pk, delta in by_pk.items()], output_field=IntegerField()),
+                    version=F('version')+1,
+                )
+            adjust_stock_totals((p, w, delta) for (p, w), delta in deltas.items())
+            StockTransfer.objects.bulk_create(transfers)
+            return results
+
+    return (retry_policy or RetryPolicy(max_attempts=max_retries)).run(attempt)
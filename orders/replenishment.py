@@ -0,0 +1,178 @@
+"""Planificador de reabastecimiento vectorizado sobre todo el catálogo.
+
+Carga el stock disponible, la demanda reciente (desde los rollups DailySales) y los umbrales
+de cada producto en matrices NumPy de productos × bodegas, y calcula todas las cantidades a
+pedir con operaciones de arreglos, sin recorrer objetos del ORM:
+
+* ``min_stock`` / ``max_stock`` del producto se reparten entre bodegas según su parte de la
+  demanda (o del inventario, si el producto no tuvo ventas en la ventana);
+* punto de pedido = demanda diaria × tiempo de entrega + stock de seguridad (``min_stock``);
+* se pide hasta cubrir además el periodo de revisión, sin pasar de ``max_stock``;
+* no se compra más de lo que se vende dentro de los ``credit_days`` del proveedor, salvo lo
+  necesario para reponer el stock de seguridad.
+
+Todas las lecturas de ``load_arrays`` se hacen en una sola transacción con una misma foto de la
+base (``snapshot``): los arreglos de productos, inventario y demanda se cruzan por posición, y un
+pedido o un cambio de catálogo confirmado entre dos consultas los desalinearía.
+
+El resultado son líneas de compra en borrador agrupadas por proveedor; no se guardan.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+
+from django.db import connection, transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DailySales, Inventory, InventoryShard, Product, Supplier, Warehouse
+
+DEFAULT_WINDOW_DAYS = 28
+DEFAULT_LEAD_TIME_DAYS = 7
+DEFAULT_REVIEW_DAYS = 7
+DEFAULT_CREDIT_DAYS = 30  # mismo valor por defecto de Supplier.credit_days
+FETCH_CHUNK = 20000
+
+
+@dataclass
+class CatalogArrays:
+    product_ids: np.ndarray    # (P,) ordenado
+    warehouse_ids: np.ndarray  # (W,) ordenado
+    supplier_ids: np.ndarray   # (P,) -1 = sin proveedor
+    min_stock: np.ndarray      # (P,)
+    max_stock: np.ndarray      # (P,)
+    unit_cost: np.ndarray      # (P,)
+    credit_days: np.ndarray    # (P,)
+    available: np.ndarray      # (P, W) stock menos reservado
+    stocked: np.ndarray        # (P, W) bool: existe la fila de inventario
+    demand: np.ndarray         # (P, W) unidades confirmadas en la ventana
+
+
+def _fetch(qs, fields, dtype=np.int64) -> np.ndarray:
+    #lee values_list por bloques directo a un arreglo, sin lista intermedia de tuplas
+    flat = chain.from_iterable(qs.values_list(*fields).iterator(chunk_size=FETCH_CHUNK))
+    return np.fromiter(flat, dtype=dtype).reshape(-1, len(fields))
+
+
+@contextmanager
+def snapshot():
+    #transacción de solo lectura en la que todas las consultas ven la misma foto; en PostgreSQL READ COMMITTED
+    #toma una foto por sentencia, así que se pide REPEATABLE READ (sólo posible si es la primera sentencia).
+    #SQLite ya lee de una sola foto dentro de la transacción y en MySQL InnoDB REPEATABLE READ es el nivel por defecto
+    outer = connection.in_atomic_block
+    with transaction.atomic():
+        if not outer and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        yield
+
+
+def _positions(ids: np.ndarray, values: np.ndarray):
+    #posicion de cada valor en el arreglo ordenado ids, y máscara de los que existen
+    pos = np.searchsorted(ids, values)
+    pos = np.minimum(pos, max(len(ids) - 1, 0))
+    return pos, (ids[pos] == values) if len(ids) else np.zeros(len(values), dtype=bool)
+
+
+def _scatter(target, product_ids, warehouse_ids, rows, value_col, add=False):
+    if not len(rows): return
+    p, p_ok = _positions(product_ids, rows[:, 0])
+    w, w_ok = _positions(warehouse_ids, rows[:, 1])
+    ok = p_ok & w_ok
+    if add:
+        np.add.at(target, (p[ok], w[ok]), rows[ok, value_col])
+    else:
+        target[p[ok], w[ok]] = rows[ok, value_col]
+
+
+def load_available(product_ids: np.ndarray, warehouse_ids: np.ndarray):
+    """Stock libre (cantidad + fragmentos - reservado) y máscara de filas existentes, ambos P × W."""
+    available = np.zeros((len(product_ids), len(warehouse_ids)), dtype=np.float32)
+    stocked = np.zeros(available.shape, dtype=bool)
+    inventory = _fetch(Inventory.objects.filter(warehouse__isnull=False), ['product_id', 'warehouse_id', 'quantity', 'reserved_quantity'])
+    if len(inventory):
+        inventory[:, 2] -= inventory[:, 3]
+        _scatter(available, product_ids, warehouse_ids, inventory, 2)
+        p, p_ok = _positions(product_ids, inventory[:, 0])
+        w, w_ok = _positions(warehouse_ids, inventory[:, 1])
+        stocked[p[p_ok & w_ok], w[p_ok & w_ok]] = True
+    shards = _fetch(InventoryShard.objects.filter(inventory__warehouse__isnull=False)
+                    .values('inventory__product_id', 'inventory__warehouse_id').annotate(total=Sum('quantity')).order_by(),
+                    ['inventory__product_id', 'inventory__warehouse_id', 'total'])
+    _scatter(available, product_ids, warehouse_ids, shards, 2, add=True)
+    return available, stocked
+
+
+def load_arrays(window_days: int=DEFAULT_WINDOW_DAYS, today=None) -> CatalogArrays:
+    today = today or timezone.localdate()
+    with snapshot():
+        return _load_arrays(window_days, today)
+
+
+def _load_arrays(window_days, today) -> CatalogArrays:
+    # -1 = sin proveedor; el costo es decimal y se lee aparte, en el mismo orden
+    products = _fetch(Product.objects.filter(is_active=True).order_by('pk').annotate(supplier_or_none=Coalesce('supplier_id', Value(-1))),
+                      ['pk', 'min_stock', 'max_stock', 'supplier_or_none'])
+    product_ids = products[:, 0]
+    warehouse_ids = _fetch(Warehouse.objects.filter(is_active=True).order_by('pk'), ['pk'])[:, 0]
+    P, W = len(product_ids), len(warehouse_ids)
+
+    supplier_ids = products[:, 3]
+    cost_rows = _fetch(Product.objects.filter(is_active=True).order_by('pk'), ['cost_price'], dtype=np.float64)
+    unit_cost = cost_rows[:, 0] if len(cost_rows) else np.zeros(0)
+
+    credit = _fetch(Supplier.objects.order_by('pk'), ['pk', 'credit_days'])
+    credit_days = np.full(P, DEFAULT_CREDIT_DAYS, dtype=np.float32)
+    has_supplier = supplier_ids >= 0
+    if len(credit) and has_supplier.any():
+        pos, ok = _positions(credit[:, 0], supplier_ids[has_supplier])
+        credit_days[np.flatnonzero(has_supplier)[ok]] = credit[pos[ok], 1]
+
+    available, stocked = load_available(product_ids, warehouse_ids)
+
+    demand = np.zeros((P, W), dtype=np.float32)
+    sales = _fetch(DailySales.objects.filter(day__gt=today - timedelta(days=window_days), day__lte=today, warehouse__isnull=False)
+                   .values('product_id', 'warehouse_id').annotate(units=Sum('confirmed_units')).order_by(),
+                   ['product_id', 'warehouse_id', 'units'])
+    _scatter(demand, product_ids, warehouse_ids, sales, 2)
+
+    return CatalogArrays(product_ids, warehouse_ids, supplier_ids, products[:, 1].astype(np.float32),
+                         products[:, 2].astype(np.float32), unit_cost, credit_days, available, stocked, demand)
+
+
+def plan_quantities(arrays: CatalogArrays, window_days: int=DEFAULT_WINDOW_DAYS,
+                    lead_time_days: float=DEFAULT_LEAD_TIME_DAYS, review_days: float=DEFAULT_REVIEW_DAYS) -> np.ndarray:
+    """Unidades a pedir por producto y bodega (P × W, enteros); todo en operaciones de arreglos."""
+    rate = arrays.demand / float(window_days)
+    total_rate = rate.sum(axis=1, keepdims=True)
+    stocked = arrays.stocked.astype(np.float32)
+    n_stocked = stocked.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(total_rate > 0, rate / total_rate, np.where(n_stocked > 0, stocked / n_stocked, 0.0))
+
+    safety = arrays.min_stock[:, None] * share
+    ceiling = arrays.max_stock[:, None] * share
+    reorder_point = rate * lead_time_days + safety
+    target = np.minimum(reorder_point + rate * review_days, ceiling)
+    need = np.where(arrays.available < reorder_point, target - arrays.available, 0.0)
+    credit_cap = np.maximum(rate * arrays.credit_days[:, None], safety - arrays.available)
+    return np.ceil(np.clip(np.minimum(need, credit_cap), 0.0, None)).astype(np.int64)
+
+
+def draft_lines(arrays: CatalogArrays, quantities: np.ndarray):
+    """Líneas (supplier_id, product_id, warehouse_id, units, unit_cost) con cantidad > 0, por proveedor."""
+    p, w = np.nonzero(quantities)
+    order = np.lexsort((arrays.warehouse_ids[w], arrays.product_ids[p], arrays.supplier_ids[p]))
+    p, w = p[order], w[order]
+    return zip(arrays.supplier_ids[p].tolist(), arrays.product_ids[p].tolist(), arrays.warehouse_ids[w].tolist(),
+               quantities[p, w].tolist(), arrays.unit_cost[p].tolist())
+
+
+def plan_replenishment(window_days: int=DEFAULT_WINDOW_DAYS, lead_time_days: float=DEFAULT_LEAD_TIME_DAYS,
+                       review_days: float=DEFAULT_REVIEW_DAYS):
+    arrays = load_arrays(window_days)
+    return arrays, plan_quantities(arrays, window_days, lead_time_days, review_days)
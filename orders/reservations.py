@@ -0,0 +1,115 @@
+"""Reserva de stock en dos fases: reservar → confirmar (commit) o liberar.
+
+Reservar es un único UPDATE condicional sobre ``Inventory.reserved_quantity``; la cantidad
+física sólo se descuenta al confirmar, que puede ocurrir en otra petición. Las reservas que
+no se confirman antes de ``expires_at`` las libera en bloque ``expire_reservations``.
+"""
+from datetime import timedelta
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+
+from .logic import create_or_get_product, validate_order_line
+from .catalog import catalog
+from .models import Inventory, Order, Reservation, adjust_stock_totals
+from .rollups import track_orders
+from .sharding import StockChanged, reserve_sharded, with_stock
+from .spatial import customer_ranking
+
+DEFAULT_TTL_SECONDS = 15 * 60
+
+
+class ReservationError(Exception):
+    """La reserva no existe, ya fue cerrada o expiró."""
+
+
+def reserve_stock(product_name: str, units: int, user_lat: float, user_lon: float, main_warehouse_name: Optional[str]=None, ttl_seconds: int=DEFAULT_TTL_SECONDS) -> Optional[Reservation]:
+    #reserva unidades en la bodega principal o en la mas cercana con stock libre; None si ninguna alcanza
+    if units<=0: raise ValueError("units must be > 0")
+    product = create_or_get_product(product_name)
+    validate_order_line(product, units) #mismos limites que place_order_atomic: el commit crea el pedido sin revalidar
+
+    free = {warehouse_id: (pk, shards) for warehouse_id, pk, shards in with_stock(Inventory.objects.filter(product=product, warehouse__isnull=False))
+            .filter(available__gte=units).values_list('warehouse_id', 'pk', 'shard_count')}
+    if not free: return None
+
+    candidates = []
+    if main_warehouse_name:
+        main = catalog.warehouse(main_warehouse_name)
+        if main and main[3] and main[0] in free: candidates.append(main[0])
+    candidates.extend(warehouse_id for warehouse_id in customer_ranking(user_lat, user_lon) if warehouse_id in free)
+
+    for warehouse_id in candidates:
+        pk, shards = free[warehouse_id]
+        with transaction.atomic():
+            # update condicional: si otra peticion tomo el stock libre primero, se prueba la siguiente bodega
+            if shards:
+                reserved = reserve_sharded(pk, units)
+            else:
+                reserved = (Inventory.objects.filter(pk=pk, quantity__gte=F('reserved_quantity')+units)
+                            .update(reserved_quantity=F('reserved_quantity')+units, version=F('version')+1))
+            if reserved:
+                return Reservation.objects.create(inventory_id=pk, units=units,
+                                                  expires_at=timezone.now() + timedelta(seconds=ttl_seconds))
+    return None
+
+
+def _lock_active(reservation_id: int) -> Reservation:
+    try:
+        reservation = Reservation.objects.select_for_update().select_related('inventory').get(pk=reservation_id)
+    except Reservation.DoesNotExist:
+        raise ReservationError('La reserva no existe')
+    if reservation.status != Reservation.ACTIVE:
+        raise ReservationError(f'La reserva está {reservation.get_status_display().lower()}')
+    return reservation
+
+
+def commit_reservation(reservation_id: int) -> Order:
+    #convierte la reserva en un pedido confirmado: las unidades reservadas salen de quantity
+    with transaction.atomic():
+        reservation = _lock_active(reservation_id)
+        if reservation.expires_at <= timezone.now():
+            raise ReservationError('La reserva expiró')
+
+        # lo reservado esta en Inventory.quantity tambien en los inventarios fragmentados (ver orders.sharding)
+        inv, units = reservation.inventory, reservation.units
+        if not Inventory.objects.filter(pk=inv.pk, quantity__gte=units).update(
+                quantity=F('quantity')-units, reserved_quantity=F('reserved_quantity')-units, version=F('version')+1):
+            raise StockChanged()
+        adjust_stock_totals([(inv.product_id, inv.warehouse_id, -units)])
+
+        order = Order(product_id=inv.product_id, units=units, status=Order.CONFIRMED,
+                      assigned_warehouse_id=inv.warehouse_id, confirmed_at=timezone.now())
+        Order.objects.bulk_create([order])
+        track_orders([order])
+        Reservation.objects.filter(pk=reservation.pk).update(status=Reservation.COMMITTED, order=order)
+        return order
+
+
+def release_reservation(reservation_id: int) -> Reservation:
+    with transaction.atomic():
+        reservation = _lock_active(reservation_id)
+        Inventory.objects.filter(pk=reservation.inventory_id).update(reserved_quantity=F('reserved_quantity')-reservation.units, version=F('version')+1)
+        Reservation.objects.filter(pk=reservation.pk).update(status=Reservation.RELEASED)
+        reservation.status = Reservation.RELEASED
+        return reservation
+
+
+def expire_reservations(now=None, limit: int=5000) -> int:
+    #libera en bloque las reservas vencidas: un UPDATE por tabla, sin importar cuantas sean
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(Reservation.objects.select_for_update()
+                       .filter(status=Reservation.ACTIVE, expires_at__lte=now).order_by('pk')
+                       .values_list('pk', flat=True)[:limit])
+        if not expired: return 0
+        per_inventory = (Reservation.objects.filter(pk__in=expired).values('inventory_id')
+                         .annotate(total=Sum('units')).values_list('inventory_id', 'total'))
+        per_inventory = dict(per_inventory)
+        Inventory.objects.filter(pk__in=per_inventory).update(reserved_quantity=Case(
+            *[When(pk=pk, then=F('reserved_quantity')-total) for pk, total in per_inventory.items()], output_field=IntegerField()
+        ), version=F('version')+1)
+        Reservation.objects.filter(pk__in=expired).update(status=Reservation.EXPIRED)
+        return len(expired)
@@ -0,0 +1,134 @@
+"""Política de reintentos para las transacciones de pedidos bajo contención.
+
+Los errores de bloqueo y serialización (``OperationalError``, p. ej. "database is locked" en
+SQLite) y ``StockChanged`` se reintentan con backoff exponencial y jitter completo, sin superar
+un plazo total alineado con el ASR de 5 segundos. Los errores deterministas (``IntegrityError``,
+llaves foráneas inválidas) no se reintentan: fallarían igual en cada intento.
+
+Cada ejecución reporta intentos y tiempo perdido por contención a contadores del proceso: el
+backoff y los intentos fallidos, más el tiempo dentro de ``SELECT ... FOR UPDATE`` del intento
+que tuvo éxito (medido con un ``execute_wrapper`` de la conexión).
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Tuple, Type, TypeVar
+
+from django.db import OperationalError, connection
+
+from .sharding import StockChanged
+
+T = TypeVar('T')
+
+
+@dataclass
+class RetryContext:
+    attempt: int
+    retry_wait_ms: int  # tiempo perdido en intentos fallidos y esperas de backoff antes de este intento
+    lock_ms: float = 0.0  # tiempo dentro de SELECT ... FOR UPDATE en este intento, hasta ahora
+
+    @property
+    def lock_wait_ms(self) -> int:
+        return self.retry_wait_ms + int(self.lock_ms)
+
+
+class _LockTimer:
+    #execute_wrapper que suma al contexto la duración de las sentencias que bloquean filas
+    def __init__(self, ctx: RetryContext):
+        self.ctx = ctx
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.ctx.lock_ms += (time.monotonic() - started) * 1000
+
+
+class RetryStats:
+    """Contadores agregados por proceso; seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = 0
+            self.attempts = 0
+            self.retried = 0
+            self.failed = 0
+            self.lock_wait_ms = 0
+            self.max_lock_wait_ms = 0
+            self.attempts_histogram = {}
+
+    def record(self, attempts: int, lock_wait_ms: int, failed: bool=False):
+        with self._lock:
+            self.operations += 1
+            self.attempts += attempts
+            self.retried += attempts > 1
+            self.failed += failed
+            self.lock_wait_ms += lock_wait_ms
+            self.max_lock_wait_ms = max(self.max_lock_wait_ms, lock_wait_ms)
+            self.attempts_histogram[attempts] = self.attempts_histogram.get(attempts, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            ops = self.operations
+            return {
+                "operations": ops,
+                "attempts": self.attempts,
+                "retried": self.retried,
+                "failed": self.failed,
+                "avg_attempts": round(self.attempts / ops, 3) if ops else 0,
+                "lock_wait_ms_total": self.lock_wait_ms,
+                "lock_wait_ms_avg": round(self.lock_wait_ms / ops, 1) if ops else 0,
+                "lock_wait_ms_max": self.max_lock_wait_ms,
+                "attempts_histogram": {str(k): v for k, v in sorted(self.attempts_histogram.items())},
+            }
+
+
+order_retry_stats = RetryStats()
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int=3, base_delay: float=0.02, max_delay: float=1.0, deadline: float=5.0,
+                 jitter: bool=True, retry_on: Tuple[Type[BaseException], ...]=(OperationalError, StockChanged), stats: RetryStats=order_retry_stats):
+        if max_attempts <= 0: raise ValueError("max_attempts must be > 0")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.retry_on = retry_on
+        self.stats = stats
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def run(self, fn: Callable[[RetryContext], T]) -> T:
+        start = time.monotonic()
+        waited = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            ctx = RetryContext(attempt, int(waited * 1000))
+            try:
+                with connection.execute_wrapper(_LockTimer(ctx)):
+                    result = fn(ctx)
+            except self.retry_on:
+                waited += time.monotonic() - started
+                delay = self.backoff(attempt)
+                if attempt >= self.max_attempts or time.monotonic() - start + delay > self.deadline:
+                    if self.stats: self.stats.record(attempt, int(waited * 1000), failed=True)
+                    raise
+                time.sleep(delay)
+                waited += delay
+                continue
+            if self.stats: self.stats.record(attempt, ctx.lock_wait_ms)
+            return result
@@ -0,0 +1,107 @@
+"""Rollups incrementales de pedidos por día, producto y bodega (tabla DailySales).
+
+Cada escritura de pedidos calcula sus deltas en memoria y los aplica con ``on_commit``:
+fuera de la transacción del pedido, así la fila del día no se bloquea mientras se
+descuenta el stock, y si la transacción se revierte no se cuenta nada. Los hooks son
+``robust``: si el rollup falla el pedido ya está confirmado, el error se registra y no se
+propaga (RetryPolicy repetiría el pedido); ``backfill_sales_rollups`` corrige la diferencia. Un pedido cuenta en
+el día de su ``created_at``; al cambiar de estado se resta del contador anterior y se suma
+al nuevo. ``backfill_sales_rollups`` reconstruye un rango de días desde Order.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import DailySales, Order
+
+# estado del pedido -> prefijo de contadores; PENDING no cuenta todavía
+BUCKETS = {
+    Order.CONFIRMED: 'confirmed', Order.IN_TRANSIT: 'confirmed', Order.DELIVERED: 'confirmed',
+    Order.REJECTED: 'rejected', Order.CANCELLED: 'cancelled',
+}
+
+
+def _add(deltas, day, product_id, warehouse_id, status, units, sign):
+    bucket = BUCKETS.get(status)
+    if bucket is None: return
+    counters = deltas.setdefault((day, product_id, warehouse_id), {})
+    counters[f'{bucket}_orders'] = counters.get(f'{bucket}_orders', 0) + sign
+    counters[f'{bucket}_units'] = counters.get(f'{bucket}_units', 0) + sign * units
+
+
+def apply_deltas(deltas):
+    #un UPDATE con F() por (dia, producto, bodega); si la fila no existe se inserta
+    for (day, product_id, warehouse_id), counters in deltas.items():
+        counters = {field: value for field, value in counters.items() if value}
+        if not counters: continue
+        key = {'day': day, 'product_id': product_id, 'warehouse_id': warehouse_id}
+        increments = {field: F(field) + value for field, value in counters.items()}
+        if DailySales.objects.filter(**key).update(**increments): continue
+        try:
+            with transaction.atomic():
+                DailySales.objects.create(**key, **counters)
+        except IntegrityError: # otro proceso creó la fila primero
+            DailySales.objects.filter(**key).update(**increments)
+
+
+def track_orders(orders, previous=None):
+    #registra pedidos recién escritos; ``previous`` = {order_id: (status, assigned_warehouse_id)} si ya contaban
+    previous = previous or {}
+    deltas = {}
+    for order in orders:
+        day = timezone.localdate(order.created_at)
+        if order.pk in previous:
+            status, warehouse_id = previous[order.pk]
+            _add(deltas, day, order.product_id, warehouse_id, status, order.units, -1)
+        _add(deltas, day, order.product_id, order.assigned_warehouse_id, order.status, order.units, 1)
+    if deltas:
+        transaction.on_commit(lambda: apply_deltas(deltas), robust=True)
+
+
+COUNTERS = ['confirmed_orders', 'confirmed_units', 'rejected_orders', 'rejected_units', 'cancelled_orders', 'cancelled_units']
+GROUPS = {'day': 'day', 'product': 'product__name', 'warehouse': 'warehouse__name'}
+
+
+def _with_rates(row):
+    row = {key: (value or 0) if key in COUNTERS else value for key, value in row.items()}
+    decided = row['confirmed_orders'] + row['rejected_orders']
+    row['rejection_rate'] = round(row['rejected_orders'] / decided, 4) if decided else None
+    return row
+
+
+def sales_stats(since, until, product=None, warehouse=None, group_by=None):
+    #agrega filas del rollup (dias x productos x bodegas del rango), nunca la tabla de pedidos
+    qs = DailySales.objects.filter(day__gte=since, day__lte=until)
+    if product: qs = qs.filter(product__name=product)
+    if warehouse: qs = qs.filter(warehouse__name=warehouse)
+    sums = {field: Sum(field) for field in COUNTERS}
+    result = {'since': since, 'until': until, 'totals': _with_rates(qs.aggregate(**sums))}
+    if group_by:
+        key = GROUPS[group_by]
+        result['groups'] = [_with_rates(row) for row in qs.values(key).annotate(**sums).order_by(key)]
+    return result
+
+
+# pedidos escritos con save()/delete() (admin, cancelaciones): se compara con el estado guardado
+@receiver(pre_save, sender=Order)
+def remember_previous_status(sender, instance, **kwargs):
+    instance._rollup_previous = (Order.objects.filter(pk=instance.pk).values_list('status', 'assigned_warehouse_id').first()
+                                 if instance.pk else None)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous != (instance.status, instance.assigned_warehouse_id):
+        track_orders([instance], {instance.pk: previous} if previous else None)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    deltas = {}
+    _add(deltas, timezone.localdate(instance.created_at), instance.product_id, instance.assigned_warehouse_id,
+         instance.status, instance.units, -1)
+    if deltas:
+        transaction.on_commit(lambda: apply_deltas(deltas), robust=True)
@@ -0,0 +1,149 @@
+"""Tabla de ruteo zona de entrega → bodegas ordenadas por distancia.
+
+Las zonas son datos (DeliveryZone) y su ranking de bodegas se guarda en ZoneRoute: se calcula
+una sola vez con una matriz de distancias zonas × bodegas y se reconstruye en la misma
+transacción en que se guarda o elimina una bodega o una zona, así la tabla nunca queda
+desfasada de las bodegas confirmadas. Cada proceso lee la tabla completa una vez y la guarda
+en memoria; un sello de versión en la caché compartida avisa a los demás workers que deben
+releerla, igual que en ``orders.catalog``.
+"""
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DeliveryZone, Warehouse, ZoneRoute
+from .spatial import haversine_matrix
+
+VERSION_KEY = 'orders:routing-version'
+VERSION_CHECK_SECONDS = 1.0
+
+
+class Zone(NamedTuple):
+    code: str
+    name: str
+    latitude: float
+    longitude: float
+    ranking: List[int]  # ids de bodegas activas, de la más cercana a la más lejana
+
+
+def rebuild_zone_routes(zone_ids=None) -> int:
+    """Recalcula las rutas de todas las zonas (o de ``zone_ids``); retorna las filas escritas."""
+    zones = DeliveryZone.objects.filter(is_active=True).order_by('pk')
+    stale = ZoneRoute.objects.all()
+    if zone_ids is not None:
+        zones, stale = zones.filter(pk__in=zone_ids), stale.filter(zone_id__in=zone_ids)
+    zones = list(zones.values_list('pk', 'latitude', 'longitude'))
+    warehouses = list(Warehouse.objects.filter(is_active=True).order_by('pk').values_list('pk', 'latitude', 'longitude'))
+
+    routes = []
+    if zones and warehouses:
+        zone_pk, zone_lat, zone_lon = zip(*zones)
+        warehouse_pk, warehouse_lat, warehouse_lon = (np.array(column) for column in zip(*warehouses))
+        dist = haversine_matrix(zone_lat, zone_lon, warehouse_lat, warehouse_lon)
+        order = np.argsort(dist, axis=1, kind='stable')
+        routes = [
+            ZoneRoute(zone_id=pk, warehouse_id=int(warehouse_pk[j]), rank=rank, distance_km=float(dist[i, j]))
+            for i, pk in enumerate(zone_pk) for rank, j in enumerate(order[i])
+        ]
+    with transaction.atomic():
+        stale.delete()
+        ZoneRoute.objects.bulk_create(routes)
+    router.clear()
+    transaction.on_commit(bump_routing_version, robust=True)
+    return len(routes)
+
+
+def bump_routing_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    router.clear()
+
+
+class ZoneRouter:
+    """Zonas activas con su ranking de bodegas, leídas de ZoneRoute una vez por versión."""
+
+    def __init__(self):
+        self._zones: Optional[Dict[str, Zone]] = None
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        version = cache.get(VERSION_KEY, 0)
+        if version != self._version:
+            self._version = version
+            self.clear()
+
+    def _load(self) -> Dict[str, Zone]:
+        self._sync()
+        zones = self._zones
+        if zones is None:
+            with self._lock:
+                if self._zones is None:
+                    rankings = {}
+                    for zone_id, warehouse_id in ZoneRoute.objects.order_by('zone_id', 'rank').values_list('zone_id', 'warehouse_id'):
+                        rankings.setdefault(zone_id, []).append(warehouse_id)
+                    self._zones = {
+                        code: Zone(code, name, lat, lon, rankings.get(pk, []))
+                        for pk, code, name, lat, lon in DeliveryZone.objects.filter(is_active=True)
+                                                                    .values_list('pk', 'code', 'name', 'latitude', 'longitude')
+                    }
+                zones = self._zones
+        return zones
+
+    def clear(self):
+        with self._lock:
+            self._zones = None
+
+    def get(self, code: str) -> Optional[Zone]:
+        return self._load().get(code)
+
+    def ranking(self, code: str) -> Optional[List[int]]:
+        zone = self.get(code) if code else None
+        return zone.ranking if zone else None
+
+    def nearest(self) -> Dict[str, int]:
+        #bodega más cercana de cada zona con al menos una bodega
+        return {code: zone.ranking[0] for code, zone in self._load().items() if zone.ranking}
+
+    def choices(self):
+        return [(zone.code, zone.name) for zone in self._load().values()]
+
+
+router = ZoneRouter()
+
+
+def zone_choices():
+    #opciones (codigo, nombre) de las zonas activas; los formularios la evaluan al instanciarse
+    return router.choices()
+
+
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def warehouse_changed(sender, **kwargs):
+    rebuild_zone_routes()
+
+
+@receiver(post_save, sender=DeliveryZone)
+def zone_saved(sender, instance, **kwargs):
+    rebuild_zone_routes([instance.pk])
+
+
+@receiver(post_delete, sender=DeliveryZone)
+def zone_deleted(sender, **kwargs):
+    # las rutas se borran en cascada; sólo hay que avisar a los procesos
+    router.clear()
+    transaction.on_commit(bump_routing_version, robust=True)
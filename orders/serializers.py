@@ -16,7 +16,8 @@ class SupplierSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'products_count']
     
     def get_products_count(self, obj):
-        return obj.products.count()
+        count = getattr(obj, 'products_count', None)  # anotado con Count por suppliers_for_listing
+        return obj.products.count() if count is None else count
     
     def validate(self, data):
         try:
@@ -33,7 +34,6 @@ class SupplierSerializer(serializers.ModelSerializer):
 
 
 class WarehouseSerializer(serializers.ModelSerializer):
-    current_stock = serializers.SerializerMethodField()
     available_capacity = serializers.SerializerMethodField()
     
     class Meta:
@@ -45,9 +45,6 @@ class WarehouseSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'current_stock', 'available_capacity']
     
-    def get_current_stock(self, obj):
-        return obj.get_current_stock()
-    
     def get_available_capacity(self, obj):
         return obj.get_available_capacity()
     
@@ -67,7 +64,6 @@ class WarehouseSerializer(serializers.ModelSerializer):
 
 class ProductSerializer(serializers.ModelSerializer):
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
-    total_stock = serializers.SerializerMethodField()
     profit_margin = serializers.SerializerMethodField()
     
     class Meta:
@@ -80,9 +76,6 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at', 'total_stock', 'profit_margin']
     
-    def get_total_stock(self, obj):
-        return obj.get_total_stock()
-    
     def get_profit_margin(self, obj):
         return round(obj.get_profit_margin(), 2)
     
@@ -143,9 +136,9 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'product', 'product_name', 'units', 'status', 'status_display',
             'assigned_warehouse', 'warehouse_name', 'customer', 'customer_name',
             'delivery_address', 'delivery_zone', 'total_price', 'notes',
-            'created_at', 'updated_at', 'confirmed_at', 'delivered_at'
+            'created_at', 'updated_at', 'confirmed_at', 'delivered_at', 'attempts', 'lock_wait_ms'
         ]
-        read_only_fields = ['created_at', 'updated_at', 'confirmed_at', 'delivered_at']
+        read_only_fields = ['created_at', 'updated_at', 'confirmed_at', 'delivered_at', 'attempts', 'lock_wait_ms']
     
     def validate(self, data):
         try:
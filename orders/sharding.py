@@ -0,0 +1,136 @@
+"""Contadores fragmentados (sharded) para el inventario de productos muy demandados.
+
+Un Inventory con ``shard_count > 0`` reparte su stock en N filas de InventoryShard; cada
+descuento elige un fragmento al azar con stock suficiente, así los pedidos concurrentes del
+mismo producto y bodega bloquean filas distintas en lugar de serializarse sobre una sola.
+La cantidad real es ``Inventory.quantity`` más la suma de los fragmentos.
+
+Las unidades reservadas de un inventario fragmentado no quedan en los fragmentos: al reservar
+salen de ellos y pasan a ``Inventory.quantity`` (que siempre cubre ``reserved_quantity``), así
+el descuento rápido sobre un fragmento nunca vende stock reservado sin bloquear la fila principal.
+"""
+import random
+
+from django.db import transaction, DatabaseError
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Inventory, InventoryShard, adjust_stock_totals
+
+
+class StockChanged(DatabaseError):
+    """El stock leído cambió antes del descuento; la transacción debe reintentarse."""
+
+
+def with_stock(qs):
+    #anota ``stock`` = cantidad de la fila + suma de sus fragmentos, y ``available`` = stock - reservado
+    shard_total = (InventoryShard.objects.filter(inventory=OuterRef('pk')).values('inventory')
+                   .annotate(total=Sum('quantity')).values('total'))
+    return qs.annotate(stock=F('quantity') + Coalesce(Subquery(shard_total, output_field=IntegerField()), Value(0))) \
+             .annotate(available=F('stock') - F('reserved_quantity'))
+
+
+def decrement_sharded(inventory_id: int, units: int) -> bool:
+    shards = list(InventoryShard.objects.filter(inventory_id=inventory_id, quantity__gte=units).values_list('pk', flat=True))
+    random.shuffle(shards)
+    for pk in shards: #update condicional: si otro pedido vació el fragmento se prueba el siguiente
+        if InventoryShard.objects.filter(pk=pk, quantity__gte=units).update(quantity=F('quantity')-units, version=F('version')+1):
+            return True
+
+    # ningún fragmento alcanza por sí solo: se bloquean la fila principal y todos los fragmentos en orden y se
+    # descuenta entre varios; de la fila principal sólo está libre lo que exceda a reserved_quantity
+    with transaction.atomic():
+        quantity, reserved = Inventory.objects.select_for_update().filter(pk=inventory_id).values_list('quantity', 'reserved_quantity').get()
+        locked = list(InventoryShard.objects.select_for_update().filter(inventory_id=inventory_id, quantity__gt=0).order_by('index'))
+        if sum(s.quantity for s in locked) + quantity - reserved < units:
+            return False
+        pending = units
+        for shard in locked:
+            take = min(shard.quantity, pending)
+            InventoryShard.objects.filter(pk=shard.pk).update(quantity=F('quantity')-take, version=F('version')+1)
+            pending -= take
+            if pending == 0: break
+        if pending:
+            Inventory.objects.filter(pk=inventory_id).update(quantity=F('quantity')-pending, version=F('version')+1)
+    return True
+
+
+def reserve_sharded(inventory_id: int, units: int) -> bool:
+    #reserva sobre un inventario fragmentado: las unidades salen de los fragmentos y quedan en la fila principal
+    with transaction.atomic():
+        if not decrement_sharded(inventory_id, units):
+            return False
+        Inventory.objects.filter(pk=inventory_id).update(quantity=F('quantity')+units, reserved_quantity=F('reserved_quantity')+units,
+                                                         version=F('version')+1)
+    return True
+
+
+def decrement_stock(inventory: Inventory, units: int) -> bool:
+    #descuenta unidades de un inventario, fragmentado o no; retorna False si no alcanzó el stock
+    if inventory.shard_count:
+        taken = decrement_sharded(inventory.pk, units)
+    else:
+        taken = Inventory.objects.filter(pk=inventory.pk, quantity__gte=F('reserved_quantity')+units).update(quantity=F('quantity')-units, version=F('version')+1) == 1
+    if taken:
+        adjust_stock_totals([(inventory.product_id, inventory.warehouse_id, -units)])
+    return taken
+
+
+def increment_stock(inventory: Inventory, units: int):
+    adjust_stock_totals([(inventory.product_id, inventory.warehouse_id, units)])
+    if inventory.shard_count: #el reabastecimiento va al fragmento con menos stock
+        shard = InventoryShard.objects.filter(inventory_id=inventory.pk).order_by('quantity', 'index').values_list('pk', flat=True).first()
+        if shard is not None:
+            InventoryShard.objects.filter(pk=shard).update(quantity=F('quantity')+units, version=F('version')+1)
+            return
+    Inventory.objects.filter(pk=inventory.pk).update(quantity=F('quantity')+units, version=F('version')+1)
+
+
+def _spread(total: int, n: int):
+    base, extra = divmod(total, n)
+    return [base + (1 if i < extra else 0) for i in range(n)]
+
+
+def split_inventory(inventory_id: int, shard_count: int) -> Inventory:
+    #fragmenta (o re-fragmenta) un inventario en shard_count filas con el stock repartido por igual
+    if shard_count <= 0: raise ValueError("shard_count must be > 0")
+    with transaction.atomic():
+        inv = Inventory.objects.select_for_update().get(pk=inventory_id)
+        shards = list(InventoryShard.objects.select_for_update().filter(inventory=inv).order_by('index'))
+        total = inv.quantity + sum(s.quantity for s in shards)
+        held = min(inv.reserved_quantity, total) #lo reservado se queda en la fila principal
+        InventoryShard.objects.filter(inventory=inv).delete()
+        InventoryShard.objects.bulk_create([
+            InventoryShard(inventory=inv, index=i, quantity=q) for i, q in enumerate(_spread(total - held, shard_count))
+        ])
+        Inventory.objects.filter(pk=inv.pk).update(quantity=held, shard_count=shard_count, version=F('version')+1)
+        inv.refresh_from_db()
+        return inv
+
+
+def rebalance_shards(inventory_id: int) -> Inventory:
+    #reparte de nuevo el stock entre los fragmentos existentes (los descuentos aleatorios los desbalancean)
+    with transaction.atomic():
+        inv = Inventory.objects.select_for_update().get(pk=inventory_id)
+        if not inv.shard_count: return inv
+        shards = list(InventoryShard.objects.select_for_update().filter(inventory=inv).order_by('index'))
+        total = inv.quantity + sum(s.quantity for s in shards)
+        held = min(inv.reserved_quantity, total)
+        for shard, q in zip(shards, _spread(total - held, len(shards))):
+            shard.quantity = q
+            shard.version += 1
+        InventoryShard.objects.bulk_update(shards, ['quantity', 'version'])
+        Inventory.objects.filter(pk=inv.pk).update(quantity=held, version=F('version')+1)
+        inv.refresh_from_db()
+        return inv
+
+
+def collapse_shards(inventory_id: int) -> Inventory:
+    #vuelve a una sola fila: suma los fragmentos en Inventory.quantity y los elimina
+    with transaction.atomic():
+        inv = Inventory.objects.select_for_update().get(pk=inventory_id)
+        total = sum(InventoryShard.objects.select_for_update().filter(inventory=inv).values_list('quantity', flat=True))
+        InventoryShard.objects.filter(inventory=inv).delete()
+        Inventory.objects.filter(pk=inv.pk).update(quantity=F('quantity')+total, shard_count=0, version=F('version')+1)
+        inv.refresh_from_db()
+        return inv
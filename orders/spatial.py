@@ -0,0 +1,301 @@
+"""Índice espacial en memoria de las bodegas activas.
+
+Las coordenadas se proyectan a vectores sobre la esfera unitaria y se indexan en un
+k-d tree; la distancia euclidiana (cuerda) es monótona con la distancia de gran círculo,
+así que recorrer el árbol por cuerda devuelve las bodegas de la más cercana a la más lejana.
+Para rankear muchos puntos a la vez el índice también guarda las coordenadas en arreglos
+NumPy y calcula todas las distancias en una sola operación vectorizada.
+
+Cada proceso construye el índice una vez y lo reutiliza; al cambiar una bodega se incrementa
+un sello de versión en la caché compartida y los demás workers lo reconstruyen en cuanto ven
+el sello nuevo (lo comparan a lo sumo una vez por ``VERSION_CHECK_SECONDS``).
+
+Las coordenadas de clientes de las APIs se agrupan por celda geohash
+(``ORDERS_GEOHASH_PRECISION``): el ranking de cada celda se calcula una vez desde su centro y
+se guarda en un LRU acotado del índice, que se descarta con él cuando cambia el sello de
+versión de las bodegas, en este proceso y en los demás.
+Con ``ORDERS_GEOHASH_EXACT`` sólo se recalculan, con la distancia exacta al cliente, las
+bodegas cuyo orden puede variar dentro de la celda.
+"""
+import heapq
+import threading
+import time
+from itertools import count
+from math import radians, cos, sin, asin
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import LRUCache
+from .models import Warehouse
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_GEOHASH_PRECISION = 6  # celdas de ~1.2 km × 0.6 km
+DEFAULT_CELL_CACHE_SIZE = 50000
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+VERSION_KEY = 'orders:warehouse-index-version'
+VERSION_CHECK_SECONDS = 1.0
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    phi, lam = radians(lat), radians(lon)
+    return (cos(phi) * cos(lam), cos(phi) * sin(lam), sin(phi))
+
+
+def chord_to_km(chord: float) -> float: #convierte la longitud de la cuerda en distancia de gran círculo
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+
+def geohash_cell(lat: float, lon: float, precision: int) -> Tuple[str, Tuple[float, float, float, float]]:
+    """Geohash del punto y los límites (lat_min, lat_max, lon_min, lon_max) de su celda."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    code = []
+    for _ in range(precision):
+        value = 0
+        for bit in range(5):
+            #los bits pares parten la longitud y los impares la latitud (intercalados desde el primer carácter)
+            if (len(code) * 5 + bit) % 2 == 0:
+                mid = (lon_lo + lon_hi) / 2
+                upper = lon >= mid
+                lon_lo, lon_hi = (mid, lon_hi) if upper else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                upper = lat >= mid
+                lat_lo, lat_hi = (mid, lat_hi) if upper else (lat_lo, mid)
+            value = value * 2 + upper
+        code.append(_BASE32[value])
+    return ''.join(code), (lat_lo, lat_hi, lon_lo, lon_hi)
+
+
+def haversine_matrix(lats, lons, wh_lats, wh_lons) -> np.ndarray:
+    """Distancias en km entre cada punto (filas) y cada bodega (columnas); todo en grados."""
+    lat1 = np.radians(np.asarray(lats, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(wh_lats, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(wh_lons, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class _Node:
+    __slots__ = ('point', 'warehouse_id', 'axis', 'left', 'right', 'lo', 'hi')
+
+    def __init__(self, point, warehouse_id, axis, left, right, lo, hi):
+        self.point = point
+        self.warehouse_id = warehouse_id
+        self.axis = axis
+        self.left = left
+        self.right = right
+        self.lo = lo
+        self.hi = hi
+
+
+def _box_dist2(p, lo, hi) -> float: #distancia² mínima del punto a la caja del subárbol
+    d = 0.0
+    for k in range(3):
+        if p[k] < lo[k]:
+            d += (lo[k] - p[k]) ** 2
+        elif p[k] > hi[k]:
+            d += (p[k] - hi[k]) ** 2
+    return d
+
+
+def _dist2(p, q) -> float:
+    return (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+
+
+class WarehouseIndex:
+    """Bodegas activas en arreglos NumPy, con su k-d tree y el LRU de rankings por celda geohash.
+
+    El árbol sólo lo usa ``nearest``; se construye en su primera llamada, no con el índice.
+    """
+
+    def __init__(self, warehouses: Iterable[Tuple[int, float, float]]):
+        rows = list(warehouses)
+        self._size = len(rows)
+        self._ids = np.array([wid for wid, _, _ in rows], dtype=np.int64)
+        self._lats = np.array([lat for _, lat, _ in rows], dtype=float)
+        self._lons = np.array([lon for _, _, lon in rows], dtype=float)
+        self.cells = LRUCache(getattr(settings, 'ORDERS_GEOHASH_CACHE_SIZE', DEFAULT_CELL_CACHE_SIZE))
+        self._root: Optional[_Node] = None
+        self._tree_lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _tree(self) -> Optional[_Node]:
+        if self._root is None and self._size:
+            with self._tree_lock:
+                if self._root is None:
+                    self._root = self._build([(to_unit_vector(lat, lon), int(wid))
+                                              for wid, lat, lon in zip(self._ids, self._lats, self._lons)], 0)
+        return self._root
+
+    def _build(self, items, depth) -> Optional[_Node]:
+        if not items:
+            return None
+        lo = tuple(min(p[k] for p, _ in items) for k in range(3))
+        hi = tuple(max(p[k] for p, _ in items) for k in range(3))
+        axis = depth % 3
+        items.sort(key=lambda it: it[0][axis])
+        mid = len(items) // 2
+        point, wid = items[mid]
+        return _Node(point, wid, axis,
+                     self._build(items[:mid], depth + 1),
+                     self._build(items[mid + 1:], depth + 1), lo, hi)
+
+    def nearest(self, lat: float, lon: float) -> Iterator[Tuple[int, float]]:
+        """Genera (warehouse_id, km) de la bodega más cercana a la más lejana.
+
+        Búsqueda best-first: sólo se expanden los subárboles cuya caja puede contener
+        algo más cercano que lo ya emitido, así que detenerse en el primer candidato útil
+        cuesta O(log n) en vez de recorrer todas las bodegas.
+        """
+        root = self._tree()
+        if root is None:
+            return
+        p = to_unit_vector(lat, lon)
+        tie = count()
+        heap = [(_box_dist2(p, root.lo, root.hi), next(tie), root, False)]
+        while heap:
+            d2, _, node, is_point = heapq.heappop(heap)
+            if is_point:
+                yield node.warehouse_id, chord_to_km(d2 ** 0.5)
+                continue
+            heapq.heappush(heap, (_dist2(p, node.point), next(tie), node, True))
+            for child in (node.left, node.right):
+                if child is not None:
+                    heapq.heappush(heap, (_box_dist2(p, child.lo, child.hi), next(tie), child, False))
+
+    def rank_many(self, points: Sequence[Tuple[float, float]], candidates: Optional[Iterable[int]] = None) -> List[List[Tuple[int, float]]]:
+        """Para cada (lat, lon) devuelve [(warehouse_id, km), ...] ordenado de cerca a lejos.
+
+        Una sola llamada vectorizada calcula la matriz puntos × bodegas; ``candidates``
+        restringe el ranking a un subconjunto de bodegas.
+        """
+        ids, lats, lons = self._ids, self._lats, self._lons
+        if candidates is not None:
+            mask = np.isin(ids, np.fromiter(candidates, dtype=np.int64))
+            ids, lats, lons = ids[mask], lats[mask], lons[mask]
+        if not len(points) or not len(ids):
+            return [[] for _ in points]
+        pts = np.asarray(points, dtype=float).reshape(-1, 2)
+        dist = haversine_matrix(pts[:, 0], pts[:, 1], lats, lons)
+        order = np.argsort(dist, axis=1, kind='stable')
+        ranked_ids = ids[order]
+        ranked_dist = np.take_along_axis(dist, order, axis=1)
+        return [list(zip(row_ids.tolist(), row_dist.tolist())) for row_ids, row_dist in zip(ranked_ids, ranked_dist)]
+
+    def rank(self, lat: float, lon: float, candidates: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        return self.rank_many([(lat, lon)], candidates)[0]
+
+    def _cell_entry(self, bounds):
+        #ranking desde el centro de la celda; las bodegas cuya distancia al centro difiere de la
+        #siguiente en menos de 2 × radio de la celda forman grupos cuyo orden depende del punto exacto
+        lat_lo, lat_hi, lon_lo, lon_hi = bounds
+        center_lat, center_lon = (lat_lo + lat_hi) / 2, (lon_lo + lon_hi) / 2
+        radius = haversine_matrix([center_lat], [center_lon], [lat_lo, lat_hi], [lon_hi, lon_hi]).max()
+        dist = haversine_matrix([center_lat], [center_lon], self._lats, self._lons)[0]
+        order = np.argsort(dist, kind='stable')
+        ranking = tuple(self._ids[order].tolist())
+        groups = np.concatenate(([0], np.cumsum(np.diff(dist[order]) > 2 * radius)))
+        slots = np.flatnonzero(np.bincount(groups)[groups] > 1)
+        if not len(slots):
+            return ranking, None, None, None
+        return ranking, slots, order[slots], groups[slots]
+
+    def rank_cell(self, lat: float, lon: float, precision: int, exact: bool = False) -> Tuple[int, ...]:
+        """Ids de bodegas de la más cercana a la más lejana para la celda geohash del punto.
+
+        La primera consulta de una celda calcula las distancias desde su centro; las siguientes
+        salen del LRU sin calcular nada. Con ``exact`` se reordenan, con la distancia real al
+        punto, sólo los grupos de bodegas empatadas dentro del radio de la celda.
+        """
+        if not self._size:
+            return ()
+        code, bounds = geohash_cell(lat, lon, precision)
+        entry = self.cells.get((precision, code))
+        if entry is None:
+            entry = self._cell_entry(bounds)
+            self.cells.put((precision, code), entry)
+        ranking, slots, positions, groups = entry
+        if not exact or slots is None:
+            return ranking
+        dist = haversine_matrix([lat], [lon], self._lats[positions], self._lons[positions])[0]
+        exact_ranking = list(ranking)
+        for slot, position in zip(slots.tolist(), positions[np.lexsort((dist, groups))].tolist()):
+            exact_ranking[slot] = int(self._ids[position])
+        return tuple(exact_ranking)
+
+
+_index: Optional[WarehouseIndex] = None
+_index_lock = threading.Lock()
+_index_version = None
+_checked_at = 0.0
+
+
+def _sync_index_version():
+    #descarta el índice local si otro proceso cambió las bodegas desde que se construyó
+    global _index, _index_version, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < VERSION_CHECK_SECONDS:
+        return
+    _checked_at = now
+    version = cache.get(VERSION_KEY, 0)
+    if version != _index_version:
+        with _index_lock:
+            _index, _index_version = None, version
+
+
+def get_warehouse_index() -> WarehouseIndex: #construye el índice de forma perezosa, una vez por versión de las bodegas
+    global _index
+    _sync_index_version()
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                rows = Warehouse.objects.filter(is_active=True).values_list('id', 'latitude', 'longitude')
+                _index = WarehouseIndex(rows)
+            index = _index
+    return index
+
+
+def customer_ranking(lat: float, lon: float) -> Sequence[int]:
+    """Ranking de bodegas para coordenadas de un cliente, agrupadas por celda geohash.
+
+    ``ORDERS_GEOHASH_PRECISION = 0`` desactiva las celdas y rankea el punto exacto.
+    """
+    index = get_warehouse_index()
+    precision = getattr(settings, 'ORDERS_GEOHASH_PRECISION', DEFAULT_GEOHASH_PRECISION)
+    if not precision:
+        return [warehouse_id for warehouse_id, _ in index.rank(lat, lon)]
+    return index.rank_cell(lat, lon, precision, getattr(settings, 'ORDERS_GEOHASH_EXACT', False))
+
+
+def invalidate_warehouse_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def bump_warehouse_index_version():
+    #invalida el índice de este proceso y, con el sello compartido, el de los demás workers
+    invalidate_warehouse_index()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def warehouse_changed(sender, **kwargs):
+    # se invalida ya y otra vez al confirmar, por si otro hilo reconstruyó con datos sin confirmar
+    invalidate_warehouse_index()
+    transaction.on_commit(bump_warehouse_index_version, robust=True)
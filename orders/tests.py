@@ -0,0 +1,955 @@
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import models, rollups
+from .catalog import catalog
+from .logic import place_order_atomic, place_orders_batch, restock_atomic
+from .intake import claim_batch, enqueue_order, process_batch
+from .models import DailySales, DeliveryZone, IdempotencyKey, Inventory, InventoryShard, Order, OrderIntake, Product, Reservation, StockAlert, StockTransfer, Supplier, Warehouse, ZoneRoute
+from .rebalancing import apply_moves, plan_rebalance, solve_transport
+from .routing import router
+from .replenishment import draft_lines, plan_replenishment
+from .reservations import release_reservation, reserve_stock
+from .retry import RetryPolicy
+from .sharding import StockChanged, decrement_stock, split_inventory
+from .spatial import VERSION_KEY as INDEX_VERSION_KEY, geohash_cell, get_warehouse_index, invalidate_warehouse_index
+
+
+class OrderConfirmationQueryBudgetTest(TestCase):
+    # busqueda de bodega + descuento + INSERT de la orden + savepoint/release (catalogo en cache);
+    # los totales de producto y bodega se escriben despues del commit
+    QUERY_BUDGET = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        with cls.captureOnCommitCallbacks(execute=True):  # totales de stock
+            Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+            Inventory.objects.create(product=cls.product, warehouse=cls.sur, quantity=100)
+
+    def setUp(self):
+        # caches calientes, como en un worker que ya atendió pedidos
+        catalog.clear()
+        invalidate_warehouse_index()
+        get_warehouse_index()
+        catalog.product('Casco de Seguridad')
+        catalog.warehouse('Bodega Norte')
+
+    def test_nearest_warehouse_confirmation_within_budget(self):
+        with CaptureQueriesContext(connection) as ctx:
+            order, confirmed = place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29)
+        self.assertTrue(confirmed)
+        self.assertLessEqual(len(ctx), self.QUERY_BUDGET, '\n'.join(q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(order.assigned_warehouse_id, self.sur.id)
+
+    def test_main_warehouse_confirmation_within_budget(self):
+        with CaptureQueriesContext(connection) as ctx:
+            order, confirmed = place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29, main_warehouse_name='Bodega Norte')
+        self.assertTrue(confirmed)
+        self.assertLessEqual(len(ctx), self.QUERY_BUDGET, '\n'.join(q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(order.assigned_warehouse_id, self.norte.id)
+
+    def test_totals_are_written_after_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29)
+                raise RuntimeError
+            place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29)
+            place_order_atomic('Casco de Seguridad', 5, 4.71, -74.07)
+            self.assertEqual(Product.objects.get(pk=self.product.pk).total_stock, 200)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).total_stock, 190)
+        self.assertEqual(Warehouse.objects.get(pk=self.norte.pk).current_stock, 95)
+
+    def test_failed_totals_write_does_not_fail_the_order(self):
+        # el pedido ya se confirmo: un error al escribir los totales se registra y no se propaga (ni se reintenta)
+        self.addCleanup(lambda: [pending.clear() for pending in models._pending_totals])
+        with mock.patch('orders.models._bump', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            order, confirmed = place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29)
+        self.assertTrue(confirmed)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.sur).quantity, 95)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).total_stock, 200)
+
+    def test_confirmation_decrements_stock_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29)
+        order = Order.objects.get()
+        self.assertEqual(order.status, Order.CONFIRMED)
+        self.assertIsNotNone(order.confirmed_at)
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.sur).quantity, 95)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).total_stock, 195)
+        self.assertEqual(Warehouse.objects.get(pk=self.sur.pk).current_stock, 95)
+
+
+class OrderLineValidationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        cls.inactive = Product.objects.create(name='Casco Descontinuado')
+        Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=20000)
+        Inventory.objects.create(product=cls.inactive, warehouse=cls.norte, quantity=100)
+        Product.objects.filter(pk=cls.inactive.pk).update(is_active=False)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        Inventory.objects.create(product=cls.product, warehouse=cls.sur, quantity=100)
+        Warehouse.objects.filter(pk=cls.sur.pk).update(is_active=False)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+
+    def auto_order(self, product, units, **extra):
+        return self.client.post('/api/auto_order/', json.dumps({'product': product, 'units': units, 'lat': 4.71, 'lon': -74.07, **extra}),
+                                content_type='application/json')
+
+    def test_queued_orders_are_validated_on_intake(self):
+        self.assertEqual(self.auto_order('Casco Descontinuado', 5, **{'async': True}).status_code, 400)
+        self.assertEqual(self.auto_order('Casco de Seguridad', 10001, **{'async': True}).status_code, 400)
+        self.assertFalse(OrderIntake.objects.exists())
+
+    def test_queued_order_for_product_deactivated_later_is_rejected(self):
+        order = enqueue_order('Casco de Seguridad', 5, 4.71, -74.07)
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        process_batch(claim_batch(10))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.REJECTED)
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.norte).quantity, 20000)
+
+    def test_batch_rejects_invalid_lines_individually(self):
+        results = place_orders_batch([
+            {'product': 'Casco de Seguridad', 'units': 5, 'lat': 4.71, 'lon': -74.07},
+            {'product': 'Casco Descontinuado', 'units': 5, 'lat': 4.71, 'lon': -74.07},
+            {'product': 'Casco de Seguridad', 'units': 10001, 'lat': 4.71, 'lon': -74.07},
+        ])
+        self.assertEqual([r['confirmed'] for r in results], [True, False, False])
+        self.assertEqual(results[1]['error'], 'El producto Casco Descontinuado no está activo')
+        self.assertEqual(results[2]['error'], 'La cantidad máxima por pedido es 10,000 unidades')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_reservations_are_validated(self):
+        for payload in ({'product': 'Casco Descontinuado', 'units': 5}, {'product': 'Casco de Seguridad', 'units': 20000}):
+            response = self.client.post('/api/reservations/', json.dumps({**payload, 'lat': 4.71, 'lon': -74.07}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, response.content)
+        self.assertFalse(Reservation.objects.exists())
+        # bodega principal inactiva: se reserva en la mas cercana activa
+        reservation = reserve_stock('Casco de Seguridad', 5, 4.57, -74.29, main_warehouse_name='Bodega Sur')
+        self.assertEqual(reservation.inventory.warehouse_id, self.norte.pk)
+
+    def test_inactive_main_warehouse_is_skipped(self):
+        order, confirmed = place_order_atomic('Casco de Seguridad', 5, 4.57, -74.29, main_warehouse_name='Bodega Sur')
+        self.assertEqual(order.assigned_warehouse_id, self.norte.pk)
+        results = place_orders_batch([{'product': 'Casco de Seguridad', 'units': 5, 'lat': 4.57, 'lon': -74.29, 'mainWarehouse': 'Bodega Sur'}])
+        self.assertEqual(results[0]['assigned_warehouse'], 'Bodega Norte')
+        queued = enqueue_order('Casco de Seguridad', 5, 4.57, -74.29, main_warehouse_name='Bodega Sur')
+        process_batch(claim_batch(10))
+        queued.refresh_from_db()
+        self.assertEqual(queued.assigned_warehouse_id, self.norte.pk)
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.sur).quantity, 100)
+
+    def test_valid_batch_lines_are_allocated(self):
+        response = self.client.post('/api/orders/_batch/', json.dumps({'orders': [
+            {'product': 'Casco de Seguridad', 'units': 5, 'lat': 4.71, 'lon': -74.07},
+            {'product': 'Casco Descontinuado', 'units': 5, 'lat': 4.71, 'lon': -74.07},
+            {'product': 'Casco de Seguridad', 'units': 7, 'lat': 4.71, 'lon': -74.07, 'mainWarehouse': 'Bodega Norte'},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual([(r['confirmed'], r['assigned_warehouse']) for r in results],
+                         [(True, 'Bodega Norte'), (False, None), (True, 'Bodega Norte')])
+        orders = Order.objects.filter(pk__in=[results[0]['order_id'], results[2]['order_id']]).order_by('pk')
+        self.assertEqual([(o.status, o.units, o.assigned_warehouse_id) for o in orders],
+                         [(Order.CONFIRMED, 5, self.norte.pk), (Order.CONFIRMED, 7, self.norte.pk)])
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.norte).quantity, 20000 - 12)
+        self.assertEqual(Inventory.objects.get(product=self.inactive, warehouse=self.norte).quantity, 100)
+
+    def test_split_orders_are_validated(self):
+        self.assertEqual(self.auto_order('Casco Descontinuado', 5, allowSplit=True).status_code, 400)
+        self.assertEqual(self.auto_order('Casco de Seguridad', 10001, allowSplit=True).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Inventory.objects.get(product=self.product, warehouse=self.norte).quantity, 20000)
+
+
+class ProductRoutesTest(TestCase):
+
+    def test_product_named_like_a_bulk_route_is_reachable(self):
+        norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        for name in ('batch', 'restock'):
+            product = Product.objects.create(name=name)
+            Inventory.objects.create(product=product, warehouse=norte, quantity=10)
+            self.assertEqual(self.client.get(f'/api/inventory/{name}/').status_code, 200)
+        response = self.client.post('/api/orders/batch/', json.dumps({'units': 1, 'lat': 4.71, 'lon': -74.07}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Order.objects.get().product.name, 'batch')
+
+
+class ShardedStockTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        cls.inventory = Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+        split_inventory(self.inventory.pk, 4)
+
+    def shards(self):
+        return sorted(InventoryShard.objects.filter(inventory=self.inventory).values_list('quantity', flat=True))
+
+    def test_single_shard_covers_the_order(self):
+        order, confirmed = place_order_atomic('Casco de Seguridad', 10, 4.71, -74.07)
+        self.assertTrue(confirmed)
+        self.assertEqual(self.shards(), [15, 25, 25, 25])
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 0)
+
+    def test_order_larger_than_any_shard_locks_and_spreads(self):
+        order, confirmed = place_order_atomic('Casco de Seguridad', 60, 4.71, -74.07)
+        self.assertTrue(confirmed)
+        # ningún fragmento tiene 60: se vacían los primeros en orden de índice
+        self.assertEqual(list(InventoryShard.objects.filter(inventory=self.inventory).order_by('index')
+                              .values_list('quantity', flat=True)), [0, 0, 15, 25])
+
+    def test_out_of_stock_leaves_shards_untouched(self):
+        inventory = Inventory.objects.get(pk=self.inventory.pk)
+        self.assertFalse(decrement_stock(inventory, 101))
+        self.assertEqual(self.shards(), [25, 25, 25, 25])
+        order, confirmed = place_order_atomic('Casco de Seguridad', 100, 4.71, -74.07)
+        self.assertTrue(confirmed)
+        order, confirmed = place_order_atomic('Casco de Seguridad', 1, 4.71, -74.07, main_warehouse_name='Bodega Norte')
+        self.assertFalse(confirmed)
+        self.assertEqual(self.shards(), [0, 0, 0, 0])
+
+    def test_inventory_export_counts_shards(self):
+        # quantity de la fila principal queda en 0 al fragmentar: la exportación suma los fragmentos
+        reserve_stock('Casco de Seguridad', 30, 4.71, -74.07, main_warehouse_name='Bodega Norte')
+        rows = [json.loads(line) for line in self.client.get('/api/export/inventory.jsonl').streaming_content]
+        self.assertEqual([(r['stock'], r['reserved_quantity'], r['available']) for r in rows], [(100, 30, 70)])
+
+
+class ShardedReservationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        cls.inventory = Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+        split_inventory(self.inventory.pk, 4)
+
+    def stock(self):
+        inv = Inventory.objects.get(pk=self.inventory.pk)
+        return inv.quantity, inv.reserved_quantity, sorted(inv.shards.values_list('quantity', flat=True))
+
+    def test_orders_cannot_take_reserved_units(self):
+        reservation = reserve_stock('Casco de Seguridad', 30, 4.71, -74.07)
+        # lo reservado sale de los fragmentos y queda en la fila principal
+        self.assertEqual(self.stock(), (30, 30, [0, 20, 25, 25]))
+        # la bodega principal se descuenta sin pasar por el filtro de stock libre
+        order, confirmed = place_order_atomic('Casco de Seguridad', 70, 4.71, -74.07, main_warehouse_name='Bodega Norte')
+        self.assertTrue(confirmed)
+        order, confirmed = place_order_atomic('Casco de Seguridad', 1, 4.71, -74.07, main_warehouse_name='Bodega Norte')
+        self.assertFalse(confirmed)
+        response = self.client.post(f'/api/reservations/{reservation.pk}/commit/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.stock(), (0, 0, [0, 0, 0, 0]))
+
+    def test_released_units_can_be_sold_again(self):
+        release_reservation(reserve_stock('Casco de Seguridad', 30, 4.71, -74.07).pk)
+        order, confirmed = place_order_atomic('Casco de Seguridad', 100, 4.71, -74.07)
+        self.assertTrue(confirmed)
+        self.assertEqual(self.stock(), (0, 0, [0, 0, 0, 0]))
+
+    def test_commit_without_stock_is_a_conflict(self):
+        reservation = reserve_stock('Casco de Seguridad', 30, 4.71, -74.07)
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=0)
+        response = self.client.post(f'/api/reservations/{reservation.pk}/commit/')
+        self.assertEqual(response.status_code, 409)
+
+
+class RetryPolicyTest(SimpleTestCase):
+
+    def run_failing(self, error):
+        calls = []
+        def attempt(ctx):
+            calls.append(ctx.attempt)
+            raise error
+        with self.assertRaises(type(error)):
+            RetryPolicy(max_attempts=3, base_delay=0, stats=None).run(attempt)
+        return calls
+
+    def test_lock_errors_and_stock_changes_are_retried(self):
+        self.assertEqual(self.run_failing(OperationalError('database is locked')), [1, 2, 3])
+        self.assertEqual(self.run_failing(StockChanged()), [1, 2, 3])
+
+    def test_deterministic_errors_fail_fast(self):
+        self.assertEqual(self.run_failing(IntegrityError('UNIQUE constraint failed')), [1])
+
+
+class OrderIntakeQueueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+
+    def test_requeued_intake_is_allocated_once(self):
+        order = enqueue_order('Casco de Seguridad', 5, 4.71, -74.07)
+        stalled = claim_batch(10)
+        # el primer worker se demora mas que CLAIM_TIMEOUT: el lote vuelve a la cola y lo toma otro
+        OrderIntake.objects.update(claimed_at=timezone.now() - timedelta(minutes=5))
+        retaken = claim_batch(10)
+        self.assertEqual([it.order_id for it in retaken], [order.pk])
+        self.assertEqual(process_batch(stalled), 0)
+        self.assertEqual(process_batch(retaken), 1)
+        self.assertEqual(process_batch(stalled), 0)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.CONFIRMED)
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 95)
+
+    def test_claim_retries_a_locked_database(self):
+        enqueue_order('Casco de Seguridad', 5, 4.71, -74.07)
+        now = mock.Mock(side_effect=[OperationalError('database is locked'), timezone.now()])
+        with mock.patch('orders.intake.timezone', mock.Mock(now=now)):
+            intakes = claim_batch(10, retry_policy=RetryPolicy(base_delay=0, stats=None))
+        self.assertEqual(len(intakes), 1)
+        self.assertEqual(OrderIntake.objects.get().status, OrderIntake.PROCESSING)
+
+
+class StockAlertTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad', min_stock=20, max_stock=200)
+        with cls.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=30)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+
+    def order(self, units):
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order_atomic('Casco de Seguridad', units, 4.71, -74.07)
+
+    def restock(self, units):
+        with self.captureOnCommitCallbacks(execute=True):
+            restock_atomic('Casco de Seguridad', units, 'Bodega Norte')
+
+    def alerts(self, **filters):
+        return list(StockAlert.objects.filter(**filters).order_by('id').values_list('kind', 'threshold', 'stock', 'resolved_at'))
+
+    def test_crossing_min_stock_opens_one_alert(self):
+        self.order(5)
+        self.assertEqual(self.alerts(), [])
+        self.order(10)
+        self.assertEqual(self.alerts(), [(StockAlert.LOW, 20, 15, None)])
+        # seguir bajando dentro del rango bajo no es un cruce
+        self.order(5)
+        self.assertEqual(len(self.alerts()), 1)
+
+    def test_repeated_crossing_does_not_duplicate_the_open_alert(self):
+        self.order(15)
+        # el total se corrige por fuera (recompute_stock_totals) sin pasar por el cruce de vuelta
+        Product.objects.filter(pk=self.product.pk).update(total_stock=25)
+        self.order(10)
+        self.assertEqual(len(self.alerts(resolved_at__isnull=True)), 1)
+
+    def test_restock_resolves_the_alert(self):
+        self.order(15)
+        self.restock(10)
+        [(kind, threshold, stock, resolved_at)] = self.alerts()
+        self.assertIsNotNone(resolved_at)
+        # un nuevo cruce abre otra alerta
+        self.order(10)
+        self.assertEqual(len(self.alerts()), 2)
+        self.assertEqual(len(self.alerts(resolved_at__isnull=True)), 1)
+
+    def test_crossing_max_stock_opens_a_high_alert(self):
+        self.restock(200)
+        self.assertEqual(self.alerts(), [(StockAlert.HIGH, 200, 230, None)])
+
+    def test_low_stock_feed(self):
+        self.order(15)
+        self.restock(10)
+        self.order(10)
+        response = self.client.get('/api/alerts/low-stock/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([(r['product'], r['stock_at_alert'], r['current_stock'], r['resolved_at']) for r in data['results']],
+                         [('Casco de Seguridad', 15, 15, None)])
+        everything = self.client.get('/api/alerts/low-stock/', {'open': 'false'}).json()
+        self.assertEqual(len(everything['results']), 2)
+        after = self.client.get('/api/alerts/low-stock/', {'open': 'false', 'after': everything['next_after']}).json()
+        self.assertEqual((after['results'], after['next_after']), ([], everything['next_after']))
+        self.assertEqual(self.client.get('/api/alerts/low-stock/', {'kind': 'HIGH'}).json()['results'], [])
+        self.assertEqual(self.client.get('/api/alerts/low-stock/', {'kind': 'MEDIUM'}).status_code, 400)
+
+
+class IdempotencyKeyTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+
+    def post(self, key, units=5):
+        return self.client.post('/api/orders/Casco de Seguridad/', json.dumps({'units': units, 'lat': 4.71, 'lon': -74.07}),
+                                content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_completed_key_replays_the_stored_response(self):
+        first = self.post('k1')
+        second = self.post('k1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_another_payload_is_rejected(self):
+        self.post('k1')
+        self.assertEqual(self.post('k1', units=6).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @mock.patch('orders.idempotency.WAIT_TIMEOUT_SECONDS', 0)
+    def test_live_claim_is_a_conflict(self):
+        self.post('k1')
+        IdempotencyKey.objects.filter(key='k1').update(state=IdempotencyKey.IN_PROGRESS)
+        self.assertEqual(self.post('k1').status_code, 409)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_stale_claim_of_a_crashed_worker_is_taken_over(self):
+        self.post('k1')
+        Order.objects.all().delete()
+        # el worker murio antes de guardar la respuesta
+        IdempotencyKey.objects.filter(key='k1').update(state=IdempotencyKey.IN_PROGRESS, response_body='',
+                                                       claimed_at=timezone.now() - timedelta(minutes=1))
+        response = self.post('k1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get(key='k1').state, IdempotencyKey.DONE)
+
+
+class InventoryConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        cls.inventory = Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+        self.url = '/api/inventory/Casco de Seguridad/'
+
+    def test_unchanged_inventory_returns_304_without_payload_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx), 1, '\n'.join(q['sql'] for q in ctx.captured_queries))
+
+    def test_stock_changes_invalidate_etag(self):
+        etags = {self.client.get(self.url)['ETag']}
+        place_order_atomic('Casco de Seguridad', 5, 4.71, -74.07)
+        etags.add(self.client.get(self.url)['ETag'])
+        restock_atomic('Casco de Seguridad', 5, 'Bodega Sur')
+        etags.add(self.client.get(self.url)['ETag'])
+        split_inventory(self.inventory.pk, 4)
+        etags.add(self.client.get(self.url)['ETag'])
+        place_order_atomic('Casco de Seguridad', 5, 4.71, -74.07)
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotIn(etag, etags)
+        self.assertEqual(len(etags), 4)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ListEndpointsQueryCountTest(TestCase):
+    # COUNT + pagina, sin consultas por fila
+    QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        suppliers = Supplier.objects.bulk_create([
+            Supplier(name=f'Proveedor {i}', nit=f'90000000{i}-1', email=f'p{i}@provesi.co', phone='3001234567',
+                     address='Calle 1 # 2-3', city='Bogota', contact_person='Ana Perez')
+            for i in range(3)
+        ])
+        Product.objects.bulk_create([Product(name=f'Producto {i}', supplier=suppliers[i % 3]) for i in range(30)])
+        Warehouse.objects.bulk_create([Warehouse(name=f'Bodega {i}', latitude=4.6, longitude=-74.1) for i in range(30)])
+
+    def assertListQueries(self, url, expected_count):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], expected_count)
+        self.assertEqual(len(ctx), self.QUERIES, '\n'.join(q['sql'] for q in ctx.captured_queries))
+        return response.json()
+
+    def test_products(self):
+        data = self.assertListQueries('/api/products/?page_size=500', 30)
+        self.assertEqual(data['results'][0]['supplier_name'], 'Proveedor 0')
+
+    def test_warehouses(self):
+        self.assertListQueries('/api/warehouses/', 30)
+
+    def test_suppliers(self):
+        data = self.assertListQueries('/api/suppliers/', 3)
+        self.assertEqual([s['products_count'] for s in data['results']], [10, 10, 10])
+
+
+class OrderHistoryCursorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        product = Product.objects.create(name='Casco de Seguridad')
+        # bulk_create: varios pedidos comparten created_at y el desempate lo hace el id
+        Order.objects.bulk_create([
+            Order(product=product, units=1, status=Order.CONFIRMED if i % 2 else Order.REJECTED,
+                  assigned_warehouse=norte if i % 2 else None)
+            for i in range(25)
+        ])
+
+    def walk(self, query):
+        ids, cursor = [], ''
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.client.get(f'/api/orders/?page_size=10&{query}&cursor={cursor}').json()
+            self.assertEqual(len(ctx), 1)
+            ids.extend(row['id'] for row in data['results'])
+            cursor = data['next_cursor']
+            if not cursor: return ids
+
+    def test_pages_cover_every_order_once_newest_first(self):
+        ids = self.walk('')
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_filters(self):
+        self.assertEqual(len(self.walk('status=CONFIRMED')), 12)
+        self.assertEqual(len(self.walk('warehouse=Bodega Norte')), 12)
+        self.assertEqual(len(self.walk('product=Casco de Seguridad&status=REJECTED')), 13)
+
+    def test_orders_without_created_at_do_not_break_pages(self):
+        # suficientes filas sin fecha para que una termine la primera pagina y sea la del cursor
+        legacy = list(Order.objects.order_by('id').values_list('id', flat=True)[:16])
+        Order.objects.filter(pk__in=legacy).update(created_at=None)
+        ids = self.walk('')
+        self.assertEqual(len(ids), 9)
+        self.assertFalse(set(ids) & set(legacy))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/orders/?cursor=nope').status_code, 400)
+
+
+class SalesRollupTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        with cls.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=20)
+
+    def setUp(self):
+        catalog.clear()
+        invalidate_warehouse_index()
+        # dos confirmados y un rechazo; luego se cancela uno de los confirmados
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kept, _ = place_order_atomic('Casco de Seguridad', 5, 4.71, -74.07)
+            cancelled, _ = place_order_atomic('Casco de Seguridad', 4, 4.71, -74.07)
+            place_order_atomic('Casco de Seguridad', 50, 4.71, -74.07)
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled.status = Order.CANCELLED
+            cancelled.save()
+
+    def rollups(self):
+        return {(row.pop('warehouse_id'), row.pop('day')): row
+                for row in DailySales.objects.values('day', 'warehouse_id', *rollups.COUNTERS)}
+
+    def test_confirm_reject_and_cancel_move_counters(self):
+        today = timezone.localdate()
+        self.assertEqual(self.rollups(), {
+            (self.norte.pk, today): {'confirmed_orders': 1, 'confirmed_units': 5, 'rejected_orders': 0, 'rejected_units': 0,
+                                     'cancelled_orders': 1, 'cancelled_units': 4},
+            (None, today): {'confirmed_orders': 0, 'confirmed_units': 0, 'rejected_orders': 1, 'rejected_units': 50,
+                            'cancelled_orders': 0, 'cancelled_units': 0},
+        })
+
+    def test_backfill_matches_incremental_counters(self):
+        incremental = self.rollups()
+        call_command('backfill_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_failed_rollup_write_does_not_fail_the_order(self):
+        with mock.patch('orders.rollups.apply_deltas', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('django', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            order, confirmed = place_order_atomic('Casco de Seguridad', 1, 4.71, -74.07)
+        self.assertTrue(confirmed)
+        self.assertEqual(Order.objects.filter(units=1).count(), 1)
+
+    def test_stats_endpoint(self):
+        response = self.client.get('/api/stats/', {'group_by': 'warehouse'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['totals']['confirmed_units'], data['totals']['rejected_orders'], data['totals']['cancelled_units']), (5, 1, 4))
+        self.assertEqual(data['totals']['rejection_rate'], 0.5)
+        self.assertEqual([(g['warehouse__name'], g['confirmed_orders']) for g in data['groups']], [(None, 0), ('Bodega Norte', 1)])
+        since = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get('/api/stats/', {'since': since}).json()['totals']['confirmed_orders'], 0)
+        self.assertEqual(self.client.get('/api/stats/', {'group_by': 'customer'}).status_code, 400)
+
+
+class ReplenishmentPlanTest(TestCase):
+    # ventana de 28 dias, entrega y revision de 7: demanda 28 en la ventana = 1 unidad diaria
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        cls.supplier = Supplier.objects.create(name='Proveedor Andino', nit='900123456-7', email='ventas@andino.co', phone='3001234567',
+                                           address='Calle 10 # 20-30', city='Bogota', contact_person='Ana Perez', credit_days=5)
+        cls.split = Product.objects.create(name='Casco de Seguridad', min_stock=20, max_stock=100)
+        cls.capped = Product.objects.create(name='Guantes', min_stock=0, max_stock=10)
+        cls.credit = Product.objects.create(name='Botas', min_stock=8, max_stock=1000, supplier=cls.supplier, cost_price=12)
+        cls.unsold = Product.objects.create(name='Gafas', min_stock=30, max_stock=60)
+        with cls.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(product=cls.split, warehouse=cls.norte, quantity=15, reserved_quantity=5)
+            Inventory.objects.create(product=cls.split, warehouse=cls.sur, quantity=30)
+            Inventory.objects.create(product=cls.capped, warehouse=cls.norte, quantity=0)
+            Inventory.objects.create(product=cls.credit, warehouse=cls.norte, quantity=0)
+            Inventory.objects.create(product=cls.unsold, warehouse=cls.norte, quantity=0)
+            Inventory.objects.create(product=cls.unsold, warehouse=cls.sur, quantity=20)
+        today = timezone.localdate()
+        DailySales.objects.bulk_create([
+            DailySales(day=today, product=cls.split, warehouse=cls.norte, confirmed_units=56),
+            DailySales(day=today, product=cls.split, warehouse=cls.sur, confirmed_units=28),
+            DailySales(day=today, product=cls.capped, warehouse=cls.norte, confirmed_units=280),
+            DailySales(day=today, product=cls.credit, warehouse=cls.norte, confirmed_units=28),
+            DailySales(day=today - timedelta(days=40), product=cls.unsold, warehouse=cls.norte, confirmed_units=500),  # fuera de la ventana
+        ])
+
+    def plan(self):
+        arrays, quantities = plan_replenishment(window_days=28, lead_time_days=7, review_days=7)
+        return {(int(arrays.product_ids[p]), int(arrays.warehouse_ids[w])): int(quantities[p, w])
+                        for p in range(len(arrays.product_ids)) for w in range(len(arrays.warehouse_ids))}
+
+    def test_split_by_demand_share(self):
+        # tasa 2/dia en norte y 1/dia en sur: min 20 → seguridad 13.3 y 6.7, tope 66.7 y 33.3
+        # norte (10 libres) < punto de pedido 27.3 → sube hasta 14 + 13.3 + 14 = 41.3; sur (30) ya cubre 13.7
+        plan = self.plan()
+        self.assertEqual((plan[self.split.pk, self.norte.pk], plan[self.split.pk, self.sur.pk]), (32, 0))
+
+    def test_target_is_capped_by_max_stock(self):
+        plan = self.plan()
+        self.assertEqual((plan[self.capped.pk, self.norte.pk], plan[self.capped.pk, self.sur.pk]), (10, 0))
+
+    def test_credit_days_cap_keeps_the_safety_stock(self):
+        # pediria 7 + 8 + 7 = 22, pero en 5 dias de credito solo se venden 5; se repone al menos la seguridad (8)
+        plan = self.plan()
+        self.assertEqual(plan[self.credit.pk, self.norte.pk], 8)
+        arrays, quantities = plan_replenishment(window_days=28, lead_time_days=7, review_days=7)
+        self.assertIn((self.supplier.pk, self.credit.pk, self.norte.pk, 8, 12.0), list(draft_lines(arrays, quantities)))
+
+    def test_product_without_sales_splits_by_stocked_warehouses(self):
+        # sin ventas en la ventana: min 30 → 15 por bodega con inventario; norte vacio, sur con 20 ya cubre
+        plan = self.plan()
+        self.assertEqual((plan[self.unsold.pk, self.norte.pk], plan[self.unsold.pk, self.sur.pk]), (15, 0))
+
+
+class RebalancingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.centro = Warehouse.objects.create(name='Bodega Centro', latitude=4.598889, longitude=-74.080833)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        DeliveryZone.objects.create(code='sur', name='Zona Sur', latitude=4.570868, longitude=-74.297333)
+        DeliveryZone.objects.create(code='centro', name='Zona Centro', latitude=4.598889, longitude=-74.080833)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        with cls.captureOnCommitCallbacks(execute=True):  # totales de stock
+            Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=90)
+            Inventory.objects.create(product=cls.product, warehouse=cls.centro, quantity=30)
+        # la demanda llega de las zonas sur y centro; los rechazos también cuentan
+        Order.objects.bulk_create(
+            [Order(product=cls.product, units=10, status=Order.REJECTED, delivery_zone='sur') for _ in range(4)]
+            + [Order(product=cls.product, units=10, status=Order.CONFIRMED, assigned_warehouse=cls.centro, delivery_zone='centro')
+               for _ in range(2)]
+        )
+
+    def setUp(self):
+        invalidate_warehouse_index()
+        router.clear()
+
+    def test_transport_solution_is_minimum_cost(self):
+        flow = solve_transport([[5, 5]], [[4, 6]], [[1.0, 3.0], [2.0, 8.0]])[0]
+        self.assertEqual(flow.tolist(), [[0, 5], [4, 1]])
+
+    def test_plan_moves_stock_towards_demand(self):
+        plan = plan_rebalance(min_units=1)
+        self.assertEqual(list(plan.moves()), [(self.product.pk, self.norte.pk, self.centro.pk, 10),
+                                              (self.product.pk, self.norte.pk, self.sur.pk, 80)])
+
+    def test_apply_moves_in_one_transaction(self):
+        moves = list(plan_rebalance(min_units=1).moves()) + [(self.product.pk, self.sur.pk, self.norte.pk, 500)]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+            results = apply_moves(moves)
+        self.assertEqual([r['applied'] for r in results], [True, True, False])
+        stock = dict(Inventory.objects.values_list('warehouse_id', 'quantity'))
+        self.assertEqual(stock, {self.norte.pk: 0, self.centro.pk: 40, self.sur.pk: 80})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).total_stock, 120)
+        self.assertEqual(Warehouse.objects.get(pk=self.sur.pk).current_stock, 80)
+        self.assertEqual(StockTransfer.objects.count(), 2)
+        # bloqueo + alta del destino + UPDATE de los existentes + auditoria + savepoint/release;
+        # los totales por producto y por bodega se escriben tras el commit
+        self.assertLessEqual(len(ctx), 6, '\n'.join(q['sql'] for q in ctx.captured_queries))
+        # el mismo plan ya no tiene stock en el origen
+        self.assertFalse(any(result['applied'] for result in apply_moves(moves)))
+        self.assertEqual(Inventory.objects.get(warehouse=self.norte).quantity, 0)
+
+
+class ZoneRoutingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        cls.zone = DeliveryZone.objects.create(code='occidente', name='Zona Occidente', latitude=4.680389, longitude=-74.146667)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+        Inventory.objects.create(product=cls.product, warehouse=cls.sur, quantity=100)
+
+    def setUp(self):
+        router.clear()
+        catalog.clear()
+        catalog.product('Casco de Seguridad')
+
+    def test_routes_follow_warehouse_changes(self):
+        self.assertEqual(router.ranking('occidente'), [self.norte.id, self.sur.id])
+        fontibon = Warehouse.objects.create(name='Bodega Fontibon', latitude=4.68, longitude=-74.14)
+        self.assertEqual(router.ranking('occidente'), [fontibon.id, self.norte.id, self.sur.id])
+        fontibon.is_active = False
+        fontibon.save()
+        self.assertEqual(router.ranking('occidente'), [self.norte.id, self.sur.id])
+        self.assertEqual(ZoneRoute.objects.filter(zone=self.zone).count(), 2)
+
+    def test_bulk_warehouse_import_rebuilds_routes(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write(json.dumps({'name': 'Bodega Fontibon', 'latitude': 4.68, 'longitude': -74.14}) + '\n')
+        self.addCleanup(os.remove, f.name)
+        call_command('import_catalog', f.name, type='warehouses', stdout=io.StringIO())
+        fontibon = Warehouse.objects.get(name='Bodega Fontibon')
+        self.assertEqual(router.ranking('occidente'), [fontibon.id, self.norte.id, self.sur.id])
+
+    def test_order_walks_zone_ranking_without_distances(self):
+        router.ranking('occidente')
+        with CaptureQueriesContext(connection) as ctx:
+            order, confirmed = place_order_atomic('Casco de Seguridad', 5, 0.0, 0.0, delivery_zone='occidente')
+        self.assertTrue(confirmed)
+        self.assertEqual(order.assigned_warehouse_id, self.norte.id)
+        self.assertEqual(order.delivery_zone, 'occidente')
+        self.assertNotIn('zoneroute', ' '.join(q['sql'] for q in ctx.captured_queries).lower())
+
+
+class CatalogImportTest(TestCase):
+    SUPPLIER = {'name': 'Proveedor Andino', 'nit': '900123456-7', 'email': 'ventas@andino.co', 'phone': '3001234567',
+                'address': 'Calle 10 # 20-30', 'city': 'Bogota', 'contact_person': 'Ana Perez'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.andino = Supplier.objects.create(**cls.SUPPLIER)
+        cls.cerrado = Supplier.objects.create(name='Proveedor Cerrado', nit='800123456-1', email='info@cerrado.co', phone='3007654321',
+                                              address='Carrera 7 # 1-2', city='Cali', contact_person='Luis Gomez', is_active=False)
+
+    def write(self, lines, suffix='.jsonl'):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(''.join(lines))
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def jsonl(self, rows):
+        return self.write([(row if isinstance(row, str) else json.dumps(row)) + '\n' for row in rows])
+
+    def run_import(self, path, kind):
+        errors = self.write([], suffix='.errors.jsonl')
+        out = io.StringIO()
+        call_command('import_catalog', path, type=kind, errors=errors, stdout=out)
+        with open(errors, encoding='utf-8') as f:
+            return out.getvalue(), [(e['line'], e['error']) for e in map(json.loads, f)]
+
+    def test_supplier_errors_and_duplicates_in_the_file(self):
+        out, errors = self.run_import(self.jsonl([
+            {**self.SUPPLIER, 'name': 'Proveedor Nuevo', 'nit': '901000000-1', 'email': 'nuevo@andino.co'},
+            {**self.SUPPLIER, 'name': 'Proveedor Malo', 'nit': '123'},
+            '{no es json',
+            {**self.SUPPLIER, 'name': 'proveedor nuevo', 'nit': '901000000-2', 'email': 'otro@andino.co'},
+            {**self.SUPPLIER, 'name': 'Proveedor Gemelo', 'nit': '901000000-1', 'email': 'gemelo@andino.co'},
+            {**self.SUPPLIER, 'name': 'Proveedor Copia', 'nit': '901000000-3', 'email': 'NUEVO@andino.co'},
+            {**self.SUPPLIER, 'name': 'Proveedor Robado', 'nit': '800123456-1', 'email': 'robado@andino.co'},
+        ]), 'suppliers')
+        self.assertEqual(errors, [
+            (2, 'nit: NIT inválido. Formato: 123456789-0'),
+            (3, 'JSON inválido'),
+            (4, 'name duplicado en el archivo'),
+            (5, 'nit duplicado en el archivo'),
+            (6, 'email duplicado en el archivo'),
+            (7, 'nit: Ya existe un proveedor con este NIT'),
+        ])
+        self.assertIn('creadas: 1  actualizadas: 0  sin cambios: 0  errores: 6', out)
+        self.assertTrue(Supplier.objects.filter(name='Proveedor Nuevo', credit_days=30).exists())
+
+    def test_product_rows_with_errors_and_supplier_checks(self):
+        Product.objects.create(name='Casco de Seguridad', sku='CAS-001')
+        path = self.write([
+            'name,sku,unit_price,cost_price,supplier_nit\n',
+            'Guantes de Nitrilo,GUA-001,10.50,8,900123456-7\n',
+            'Botas,,abc,,\n',
+            'Gafas,GAF-001,5,9,\n',
+            'guantes de nitrilo,GUA-002,1,1,\n',
+            'Tapabocas,gua-001,1,1,\n',
+            'Arnes,CAS-001,1,1,\n',
+            'Careta,CAR-001,1,1,999999999-9\n',
+            'Chaleco,CHA-001,1,1,800123456-1\n',
+        ], suffix='.csv')
+        out, errors = self.run_import(path, 'products')
+        self.assertEqual(errors, [
+            (3, 'unit_price: número inválido'),
+            (4, 'unit_price: El precio de venta no puede ser menor al precio de costo'),
+            (5, 'name duplicado en el archivo'),
+            (6, 'sku duplicado en el archivo'),
+            (7, 'sku: Ya existe un producto con este SKU'),
+            (8, 'supplier_nit: no existe el proveedor 999999999-9'),
+            (9, 'supplier: El proveedor Proveedor Cerrado no está activo'),
+        ])
+        self.assertIn('creadas: 1  actualizadas: 0', out)
+        self.assertEqual(Product.objects.get(name='Guantes de Nitrilo').supplier_id, self.andino.pk)
+
+    def test_updates_write_only_changed_fields(self):
+        rows = [{'name': 'Casco de Seguridad', 'sku': 'CAS-001', 'unit_price': '20', 'category': 'Cabeza'},
+                {'name': 'Guantes', 'sku': 'GUA-001', 'unit_price': '10', 'category': 'Manos'}]
+        self.run_import(self.jsonl(rows), 'products')
+        rows[0]['unit_price'] = '25'
+        rows[1]['category'] = 'Proteccion'
+        with CaptureQueriesContext(connection) as ctx:
+            out, errors = self.run_import(self.jsonl(rows), 'products')
+        self.assertIn('creadas: 0  actualizadas: 2  sin cambios: 0', out)
+        updates = sorted(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "orders_product"'))
+        self.assertEqual(len(updates), 2)
+        self.assertEqual([('"unit_price"' in sql, '"category"' in sql, '"description"' in sql) for sql in updates],
+                         [(False, True, False), (True, False, False)])
+        self.assertEqual(Product.objects.get(name='Casco de Seguridad').unit_price, 25)
+
+    def test_reimporting_an_unchanged_file_writes_nothing(self):
+        suppliers = self.jsonl([self.SUPPLIER, {**self.SUPPLIER, 'name': 'Proveedor Sur', 'nit': '901000000-9', 'email': 'sur@andino.co'}])
+        products = self.jsonl([{'name': 'Casco de Seguridad', 'sku': 'cas-001', 'unit_price': '20.5', 'supplier_nit': '900123456-7'}])
+        self.run_import(suppliers, 'suppliers')
+        self.run_import(products, 'products')
+        for path, kind in ((suppliers, 'suppliers'), (products, 'products')):
+            with CaptureQueriesContext(connection) as ctx:
+                out, errors = self.run_import(path, kind)
+            self.assertIn('creadas: 0  actualizadas: 0', out)
+            self.assertEqual(errors, [])
+            self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(('UPDATE "orders_supplier"', 'UPDATE "orders_product"', 'INSERT'))])
+        self.assertIn('sin cambios: 1', out)
+
+
+class WarehouseIndexVersionTest(TestCase):
+
+    def test_index_rebuilt_when_another_worker_bumps_the_stamp(self):
+        norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        invalidate_warehouse_index()
+        with mock.patch('orders.spatial.VERSION_CHECK_SECONDS', 0):
+            index = get_warehouse_index()
+            self.assertIs(get_warehouse_index(), index)
+            # otro worker desactivó la bodega: aquí sólo llega el sello compartido
+            Warehouse.objects.filter(pk=norte.pk).update(is_active=False)
+            cache.set(INDEX_VERSION_KEY, cache.get(INDEX_VERSION_KEY, 0) + 1, None)
+            self.assertIsNot(get_warehouse_index(), index)
+            self.assertEqual(len(get_warehouse_index()), 0)
+
+@override_settings(ORDERS_GEOHASH_PRECISION=6, ORDERS_GEOHASH_EXACT=False)
+class GeohashRankingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Warehouse.objects.create(name='Bodega Norte', latitude=4.710989, longitude=-74.072092)
+        cls.sur = Warehouse.objects.create(name='Bodega Sur', latitude=4.570868, longitude=-74.297333)
+        cls.product = Product.objects.create(name='Casco de Seguridad')
+        Inventory.objects.create(product=cls.product, warehouse=cls.norte, quantity=100)
+        Inventory.objects.create(product=cls.product, warehouse=cls.sur, quantity=100)
+
+    def setUp(self):
+        invalidate_warehouse_index()
+        catalog.clear()
+        catalog.product('Casco de Seguridad')
+
+    def test_repeat_orders_in_cell_skip_distances(self):
+        place_order_atomic('Casco de Seguridad', 1, 4.5712, -74.2968)
+        with mock.patch('orders.spatial.haversine_matrix', side_effect=AssertionError('distancias recalculadas')):
+            order, confirmed = place_order_atomic('Casco de Seguridad', 1, 4.5715, -74.2971)
+        self.assertTrue(confirmed)
+        self.assertEqual(order.assigned_warehouse_id, self.sur.id)
+        self.assertEqual(get_warehouse_index().cells.stats()['hits'], 1)
+
+    def test_warehouse_change_drops_cell_cache(self):
+        self.assertEqual(get_warehouse_index().rank_cell(4.68, -74.14, 6), (self.norte.id, self.sur.id))
+        fontibon = Warehouse.objects.create(name='Bodega Fontibon', latitude=4.68, longitude=-74.14)
+        self.assertEqual(get_warehouse_index().rank_cell(4.68, -74.14, 6), (fontibon.id, self.norte.id, self.sur.id))
+
+    def test_shared_stamp_drops_cell_cache_of_other_workers(self):
+        with mock.patch('orders.spatial.VERSION_CHECK_SECONDS', 0):
+            index = get_warehouse_index()
+            self.assertEqual(index.rank_cell(4.68, -74.14, 6), (self.norte.id, self.sur.id))
+            Warehouse.objects.filter(pk=self.norte.pk).update(is_active=False)
+            cache.set(INDEX_VERSION_KEY, cache.get(INDEX_VERSION_KEY, 0) + 1, None)
+            self.assertEqual(get_warehouse_index().rank_cell(4.68, -74.14, 6), (self.sur.id,))
+        self.assertIsNone(index._root)  # el ranking por celda no construye el k-d tree
+
+    def test_exact_mode_matches_point_ranking_at_cell_boundaries(self):
+        rng = np.random.default_rng(7)
+        Warehouse.objects.bulk_create([Warehouse(name=f'Bodega {i}', latitude=lat, longitude=lon)
+                                       for i, (lat, lon) in enumerate(zip(rng.uniform(4.5, 4.8, 40), rng.uniform(-74.25, -74.0, 40)))])
+        invalidate_warehouse_index()
+        index = get_warehouse_index()
+        code, (lat_lo, lat_hi, lon_lo, lon_hi) = geohash_cell(4.65, -74.1, 4)
+        corners = [(lat, lon) for lat in (lat_lo + 1e-9, lat_hi - 1e-9) for lon in (lon_lo + 1e-9, lon_hi - 1e-9)]
+        for lat, lon in corners + list(zip(rng.uniform(lat_lo, lat_hi, 20), rng.uniform(lon_lo, lon_hi, 20))):
+            self.assertEqual(list(index.rank_cell(lat, lon, 4, exact=True)), [wid for wid, _ in index.rank(lat, lon)])
+        self.assertEqual(index.cells.stats()['size'], 1)
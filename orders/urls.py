@@ -2,9 +2,33 @@ from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 from . import views
 
+# las operaciones en bloque llevan prefijo "_": los nombres de producto no admiten ese caracter
+# (product_name_validator), así que nunca tapan a un producto en las rutas por nombre
 urlpatterns = [
+    path('inventory/_restock/', views.inventory_restock_bulk, name='inventory_restock_bulk'),
     path('inventory/<str:product_name>/', views.inventory_detail, name='inventory_detail'),
     path('inventory/<str:product_name>/restock/', csrf_exempt(views.inventory_restock), name='inventory_restock'),
+    path('products/', views.product_list, name='product_list'),
+    path('warehouses/', views.warehouse_list, name='warehouse_list'),
+    path('suppliers/', views.supplier_list, name='supplier_list'),
+    path('orders/', views.order_list, name='order_list'),
+    path('orders/_batch/', views.place_orders_batch_view, name='place_orders_batch'),
+    path('orders/<int:order_id>/status/', views.order_status, name='order_status'),
     path('orders/<str:product_name>/', csrf_exempt(views.place_order), name='place_order'),
     path("auto_order/", csrf_exempt(views.create_order_view), name="auto_order"),
+    path('reservations/', views.create_reservation, name='create_reservation'),
+    path('reservations/<int:reservation_id>/commit/', views.commit_reservation_view, name='commit_reservation'),
+    path('reservations/<int:reservation_id>/release/', views.release_reservation_view, name='release_reservation'),
+    path('export/orders.csv', views.export_orders, {'fmt': 'csv'}, name='export_orders_csv'),
+    path('export/orders.jsonl', views.export_orders, {'fmt': 'jsonl'}, name='export_orders_jsonl'),
+    path('export/inventory.csv', views.export_inventory, {'fmt': 'csv'}, name='export_inventory_csv'),
+    path('export/inventory.jsonl', views.export_inventory, {'fmt': 'jsonl'}, name='export_inventory_jsonl'),
+    path('replenishment/', views.replenishment_plan, name='replenishment_plan'),
+    path('rebalancing/', views.rebalancing_plan, name='rebalancing_plan'),
+    path('rebalancing/apply/', views.rebalancing_apply, name='rebalancing_apply'),
+    path('alerts/low-stock/', views.low_stock_alerts, name='low_stock_alerts'),
+    path('stats/', views.sales_stats_view, name='sales_stats'),
+    path('stats/retries/', views.retry_stats, name='retry_stats'),
+    path('stats/catalog/', views.catalog_stats, name='catalog_stats'),
+    path('stats/geo/', views.geo_stats, name='geo_stats'),
 ]
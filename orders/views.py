@@ -1,15 +1,41 @@
 # orders/views.py
-import json, time
-from django.http import JsonResponse, HttpResponseBadRequest
-from django.views.decorators.http import require_http_methods
+import base64, json, time
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from .logic import get_inventory, restock_atomic, place_order_atomic
-from .serializers import InventorySerializer, OrderSerializer
+from .logic import get_inventory, inventory_etag, order_history, products_for_listing, warehouses_for_listing, suppliers_for_listing, restock_atomic, restock_bulk, place_order_atomic, place_order_split, place_orders_batch
+from .catalog import catalog
+from .exports import INVENTORY_COLUMNS, ORDER_COLUMNS, inventory_rows, order_rows, render
+from .idempotency import idempotent
+from .intake import enqueue_order
+from .models import Order, Product, StockAlert, Supplier, Warehouse
+from .rebalancing import DEFAULT_MIN_UNITS, DEFAULT_WINDOW_DAYS as REBALANCE_WINDOW_DAYS, apply_moves, plan_rebalance
+from .retry import order_retry_stats
+from .replenishment import DEFAULT_LEAD_TIME_DAYS, DEFAULT_REVIEW_DAYS, DEFAULT_WINDOW_DAYS, draft_lines, plan_replenishment
+from .rollups import GROUPS, sales_stats
+from .reservations import ReservationError, reserve_stock, commit_reservation, release_reservation, DEFAULT_TTL_SECONDS
+from .serializers import InventorySerializer, OrderSerializer, ProductSerializer, SupplierSerializer, WarehouseSerializer
+from .sharding import StockChanged
+from .spatial import DEFAULT_GEOHASH_PRECISION, get_warehouse_index
+
+
+def allocations_payload(order):
+    return [
+        {"warehouse": name, "units": units}
+        for name, units in order.allocations.order_by('pk').values_list('warehouse__name', 'units')
+    ]
 
 
 @require_http_methods(["GET"])
+@condition(etag_func=lambda request, product_name: inventory_etag(product_name))
 def inventory_detail(request, product_name: str):
+    # con If-None-Match vigente responde 304 solo con la consulta de version, sin serializar
 
     qs = get_inventory(product_name)
 
@@ -33,7 +59,43 @@ def inventory_restock(request, product_name: str):
     return JsonResponse(InventorySerializer(inv).data, status=200)
 
 
+MAX_RESTOCK_LINES = 5000
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def inventory_restock_bulk(request):
+    """
+    Reabastece muchas lineas (producto, bodega, unidades) en una sola peticion y transaccion.
+    Las lineas repetidas se suman y cada fila de inventario recibe un solo UPDATE.
+    """
+
+    start_time = time.time()
+
+    try:
+        payload = json.loads(request.body.decode("utf-8")) if request.body else {}
+        lines = payload["lines"]
+        if not isinstance(lines, list) or not lines or len(lines) > MAX_RESTOCK_LINES:
+            raise ValueError
+    except (KeyError, ValueError, TypeError, json.JSONDecodeError):
+        return HttpResponseBadRequest(
+            f'Payload: {{"lines": [{{"product":str,"warehouse":str,"units":int}}, ...]}} (máximo {MAX_RESTOCK_LINES} lineas)'
+        )
+
+    results = restock_bulk(lines)
+    applied = sum(1 for r in results if r["applied"])
+
+    return JsonResponse({
+        "results": results,
+        "applied": applied,
+        "rejected": len(results) - applied,
+        "execution_time_seconds": round(time.time() - start_time, 3),
+    }, status=200)
+
+
 @require_http_methods(["POST"])
+@idempotent
 def place_order(request, product_name: str):
 
     try:
@@ -41,17 +103,29 @@ def place_order(request, product_name: str):
         units = int(payload.get("units", 0))
         user_lat = float(payload["lat"]); user_lon = float(payload["lon"])
         main_warehouse_name = payload.get("mainWarehouse")
+        allow_split = bool(payload.get("allowSplit", False))
     except (KeyError, ValueError, json.JSONDecodeError):
-        return HttpResponseBadRequest('Payload: {"units":int,"lat":float,"lon":float,"mainWarehouse"?:str}')
-    order, confirmed = place_order_atomic(product_name, units, user_lat, user_lon, main_warehouse_name)
+        return HttpResponseBadRequest('Payload: {"units":int,"lat":float,"lon":float,"mainWarehouse"?:str,"allowSplit"?:bool}')
+
+    try:
+        if allow_split:
+            order, confirmed = place_order_split(product_name, units, user_lat, user_lon)
+        else:
+            order, confirmed = place_order_atomic(product_name, units, user_lat, user_lon, main_warehouse_name)
+    except ValidationError as e:
+        return JsonResponse({"error": e.message_dict}, status=400)
 
     data = OrderSerializer(order).data
+    response = {"order": data, "confirmed": confirmed}
+    if allow_split:
+        response["allocations"] = allocations_payload(order)
     
-    return JsonResponse({"order": data, "confirmed": confirmed}, status=200 if confirmed else 409)
+    return JsonResponse(response, status=200 if confirmed else 409)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent
 def create_order_view(request):
     """
     Crea una orden automática verificando disponibilidad en todas las bodegas.
@@ -68,28 +142,523 @@ def create_order_view(request):
         user_lat = float(payload["lat"])
         user_lon = float(payload["lon"])
         main_warehouse_name = payload.get("mainWarehouse")
+        allow_split = bool(payload.get("allowSplit", False))
+        run_async = bool(payload.get("async", getattr(settings, "ORDERS_ASYNC_INTAKE", False)))
+        if units <= 0:
+            raise ValueError
     except (KeyError, ValueError, json.JSONDecodeError):
         return HttpResponseBadRequest(
-            'Payload inválido. Ejemplo: {"product": "Monitor LED 24\"", "units": 5, "lat": 4.6, "lon": -74.08, "mainWarehouse": "Bodega Sur"}'
+            'Payload inválido. Ejemplo: {"product": "Monitor LED 24\"", "units": 5, "lat": 4.6, "lon": -74.08, "mainWarehouse": "Bodega Sur", "allowSplit": false, "async": false}'
         )
 
-    order, confirmed = place_order_atomic(
-        product_name=product_name,
-        units=units,
-        user_lat=user_lat,
-        user_lon=user_lon,
-        main_warehouse_name=main_warehouse_name
-    )
+    if run_async and not allow_split:
+        # Modo asíncrono: el pedido queda en cola y un worker le asigna bodega
+        try:
+            order = enqueue_order(product_name, units, user_lat, user_lon, main_warehouse_name)
+        except ValidationError as e:
+            return JsonResponse({"error": e.message_dict}, status=400)
+        return JsonResponse({
+            "order_id": order.id,
+            "status": order.status,
+            "status_url": f"/api/orders/{order.id}/status/",
+            "execution_time_seconds": round(time.time() - start_time, 3),
+        }, status=202)
+
+    try:
+        if allow_split:
+            # Llena el pedido desde varias bodegas cercanas si ninguna tiene todo el stock
+            order, confirmed = place_order_split(
+                product_name=product_name,
+                units=units,
+                user_lat=user_lat,
+                user_lon=user_lon
+            )
+        else:
+            order, confirmed = place_order_atomic(
+                product_name=product_name,
+                units=units,
+                user_lat=user_lat,
+                user_lon=user_lon,
+                main_warehouse_name=main_warehouse_name
+            )
+    except ValidationError as e:
+        return JsonResponse({"error": e.message_dict}, status=400)
 
     elapsed = round(time.time() - start_time, 3)
 
-    return JsonResponse({
+    response = {
         "order_id": order.id,
         "product": order.product.name,
         "units": order.units,
         "status": order.status,
         "assigned_warehouse": order.assigned_warehouse.name if order.assigned_warehouse else None,
         "confirmed": confirmed,
+        "attempts": order.attempts,
+        "lock_wait_ms": order.lock_wait_ms,
         "execution_time_seconds": elapsed,
         "meets_performance_ASR": elapsed <= 5.0
-    }, status=200 if confirmed else 409)
+    }
+    if allow_split:
+        response["allocations"] = allocations_payload(order)
+
+    return JsonResponse(response, status=200 if confirmed else 409)
+
+
+MAX_BATCH_LINES = 1000
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def place_orders_batch_view(request):
+    """
+    Recibe muchas lineas de pedido en una sola peticion y las procesa en una transaccion.
+    Responde un resultado por linea (confirmada o rechazada) en el mismo orden del payload.
+    """
+
+    start_time = time.time()
+
+    try:
+        payload = json.loads(request.body.decode("utf-8")) if request.body else {}
+        lines = payload["orders"]
+        if not isinstance(lines, list) or not lines or len(lines) > MAX_BATCH_LINES:
+            raise ValueError
+    except (KeyError, ValueError, TypeError, json.JSONDecodeError):
+        return HttpResponseBadRequest(
+            f'Payload: {{"orders": [{{"product":str,"units":int,"lat":float,"lon":float,"mainWarehouse"?:str}}, ...]}} (máximo {MAX_BATCH_LINES} lineas)'
+        )
+
+    results = place_orders_batch(lines)
+    confirmed = sum(1 for r in results if r["confirmed"])
+
+    return JsonResponse({
+        "results": results,
+        "confirmed": confirmed,
+        "rejected": len(results) - confirmed,
+        "execution_time_seconds": round(time.time() - start_time, 3),
+    }, status=200)
+
+
+def reservation_payload(reservation):
+    return {
+        "reservation_id": reservation.id,
+        "units": reservation.units,
+        "status": reservation.status,
+        "expires_at": reservation.expires_at.isoformat(),
+    }
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def create_reservation(request):
+    """
+    Reserva stock sin descontarlo: la bodega principal o la más cercana con stock libre.
+    El pedido se crea después con /commit/; si no se confirma a tiempo la reserva expira.
+    """
+
+    try:
+        payload = json.loads(request.body.decode("utf-8")) if request.body else {}
+        product_name = payload["product"]
+        units = int(payload["units"])
+        user_lat = float(payload["lat"]); user_lon = float(payload["lon"])
+        main_warehouse_name = payload.get("mainWarehouse")
+        ttl = int(payload.get("ttl", DEFAULT_TTL_SECONDS))
+        if units <= 0 or ttl <= 0:
+            raise ValueError
+    except (KeyError, ValueError, json.JSONDecodeError):
+        return HttpResponseBadRequest('Payload: {"product":str,"units":int,"lat":float,"lon":float,"mainWarehouse"?:str,"ttl"?:int}')
+
+    try:
+        reservation = reserve_stock(product_name, units, user_lat, user_lon, main_warehouse_name, ttl)
+    except ValidationError as e:
+        return JsonResponse({"error": e.message_dict}, status=400)
+    if reservation is None:
+        return JsonResponse({"reserved": False}, status=409)
+
+    data = reservation_payload(reservation)
+    data["reserved"] = True
+    data["warehouse"] = reservation.inventory.warehouse.name
+    return JsonResponse(data, status=201)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def commit_reservation_view(request, reservation_id: int):
+
+    try:
+        order = commit_reservation(reservation_id)
+    except ReservationError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+    except StockChanged:
+        return JsonResponse({"error": "El stock reservado ya no está disponible"}, status=409)
+
+    return JsonResponse({"order": OrderSerializer(order).data, "confirmed": True}, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def release_reservation_view(request, reservation_id: int):
+
+    try:
+        reservation = release_reservation(reservation_id)
+    except ReservationError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+
+    return JsonResponse(reservation_payload(reservation), status=200)
+
+
+@require_http_methods(["GET"])
+def retry_stats(request):
+    """Intentos y espera por bloqueos acumulados por este proceso en las transacciones de pedidos."""
+    return JsonResponse(order_retry_stats.snapshot(), status=200)
+
+
+@require_http_methods(["GET"])
+def order_status(request, order_id: int):
+    row = (Order.objects.filter(pk=order_id)
+           .values('id', 'status', 'units', 'product__name', 'assigned_warehouse__name', 'intake__status', 'intake__error')
+           .first())
+    if row is None:
+        return JsonResponse({"error": "El pedido no existe"}, status=404)
+
+    return JsonResponse({
+        "order_id": row["id"],
+        "product": row["product__name"],
+        "units": row["units"],
+        "status": row["status"],
+        "assigned_warehouse": row["assigned_warehouse__name"],
+        "queue_status": row["intake__status"],
+        "error": row["intake__error"],
+        "done": row["status"] != Order.PENDING,
+    }, status=200)
+
+
+STATS_DEFAULT_DAYS = 30
+
+
+@require_http_methods(["GET"])
+def sales_stats_view(request):
+    """
+    Ventas desde los rollups diarios: ?since=&until= (YYYY-MM-DD, incluidos; por defecto los últimos 30 días),
+    product, warehouse y group_by=day|product|warehouse. No toca la tabla de pedidos.
+    """
+
+    try:
+        until = parse_date(request.GET["until"]) if request.GET.get("until") else timezone.localdate()
+        since = parse_date(request.GET["since"]) if request.GET.get("since") else until - timedelta(days=STATS_DEFAULT_DAYS - 1)
+        group_by = request.GET.get("group_by")
+        if since is None or until is None or (group_by and group_by not in GROUPS):
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest('Parametros: since, until (YYYY-MM-DD), product, warehouse, group_by=day|product|warehouse')
+
+    return JsonResponse(sales_stats(since, until, product=request.GET.get("product"),
+                                    warehouse=request.GET.get("warehouse"), group_by=group_by), status=200)
+
+
+@require_http_methods(["GET"])
+def catalog_stats(request):
+    """Aciertos y fallos de la caché de catálogo de este proceso."""
+    return JsonResponse(catalog.stats(), status=200)
+
+
+@require_http_methods(["GET"])
+def geo_stats(request):
+    """Caché de rankings por celda geohash del índice de bodegas vigente en este proceso."""
+    index = get_warehouse_index()
+    return JsonResponse({**index.cells.stats(), "warehouses": len(index),
+                         "precision": getattr(settings, 'ORDERS_GEOHASH_PRECISION', DEFAULT_GEOHASH_PRECISION),
+                         "exact": getattr(settings, 'ORDERS_GEOHASH_EXACT', False)}, status=200)
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def paginated_response(request, list_queryset, serializer_class):
+    # ?active=true|false&page=N&page_size=M; siempre 2 consultas (COUNT + pagina) sin importar el tamaño
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+        page_size = min(max(int(request.GET.get("page_size", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        active = {"true": True, "false": False, None: None}[request.GET.get("active")]
+    except (ValueError, KeyError):
+        return HttpResponseBadRequest(f'Parametros: page:int, page_size:int (maximo {MAX_PAGE_SIZE}), active:true|false')
+
+    queryset = list_queryset(active)
+    count = queryset.count()
+    rows = queryset[(page - 1) * page_size: page * page_size]
+    return JsonResponse({
+        "count": count,
+        "page": page,
+        "page_size": page_size,
+        "results": serializer_class(rows, many=True).data,
+    }, status=200)
+
+
+@require_http_methods(["GET"])
+def product_list(request):
+    return paginated_response(request, products_for_listing, ProductSerializer)
+
+
+@require_http_methods(["GET"])
+def warehouse_list(request):
+    return paginated_response(request, warehouses_for_listing, WarehouseSerializer)
+
+
+@require_http_methods(["GET"])
+def supplier_list(request):
+    return paginated_response(request, suppliers_for_listing, SupplierSerializer)
+
+
+def encode_cursor(order) -> str:
+    raw = json.dumps([order.created_at.isoformat(), order.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    created_at, pk = json.loads(raw)
+    created_at = parse_datetime(created_at)
+    if created_at is None or not isinstance(pk, int):
+        raise ValueError
+    return created_at, pk
+
+
+@require_http_methods(["GET"])
+def order_list(request):
+    """
+    Historial de pedidos, del más reciente al más antiguo, con paginación por cursor:
+    ?status=&product=&warehouse=&customer=&page_size=&cursor=<next_cursor de la página anterior>.
+    Cada página cuesta lo mismo sin importar qué tan atrás esté.
+    """
+
+    try:
+        page_size = min(max(int(request.GET.get("page_size", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        status = request.GET.get("status")
+        if status and status not in dict(Order.STATUS_CHOICES):
+            raise ValueError
+        customer = request.GET.get("customer")
+        customer = int(customer) if customer else None
+        cursor = request.GET.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError, json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponseBadRequest(
+            f'Parametros: status, product, warehouse, customer:int, page_size:int (maximo {MAX_PAGE_SIZE}), cursor'
+        )
+
+    rows = list(order_history(status=status, product=request.GET.get("product"), warehouse=request.GET.get("warehouse"),
+                              customer_id=customer, after=after)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    return JsonResponse({
+        "results": OrderSerializer(rows, many=True).data,
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+    }, status=200)
+
+
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson; charset=utf-8"}
+
+
+def parse_moment(value: str):
+    # acepta fecha (YYYY-MM-DD, desde medianoche) o fecha y hora ISO
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None: raise ValueError
+        moment = timezone.datetime.combine(day, timezone.datetime.min.time())
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def streaming_export(rows, columns, fmt: str, filename: str):
+    response = StreamingHttpResponse(render(fmt, rows, columns), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+@require_http_methods(["GET"])
+def export_orders(request, fmt: str):
+    """
+    Exporta pedidos en streaming (?status=&since=&until=, until exclusivo) sin cargar la tabla en memoria.
+    """
+
+    try:
+        status = request.GET.get("status")
+        if status and status not in dict(Order.STATUS_CHOICES):
+            raise ValueError
+        since = parse_moment(request.GET["since"]) if request.GET.get("since") else None
+        until = parse_moment(request.GET["until"]) if request.GET.get("until") else None
+    except ValueError:
+        return HttpResponseBadRequest('Parametros: status, since y until (YYYY-MM-DD o fecha ISO)')
+
+    return streaming_export(order_rows(status=status, since=since, until=until), ORDER_COLUMNS, fmt, "orders")
+
+
+@require_http_methods(["GET"])
+def export_inventory(request, fmt: str):
+    return streaming_export(inventory_rows(), INVENTORY_COLUMNS, fmt, "inventory")
+
+
+@require_http_methods(["GET"])
+def low_stock_alerts(request):
+    """
+    Feed de alertas de stock escritas al cruzar min_stock/max_stock, de la más antigua a la más nueva:
+    ?kind=LOW|HIGH (por defecto LOW), ?open=false para incluir las resueltas, ?after=<id> para seguir leyendo.
+    """
+
+    try:
+        kind = request.GET.get("kind", StockAlert.LOW)
+        if kind not in dict(StockAlert.KIND_CHOICES):
+            raise ValueError
+        after = int(request.GET.get("after", 0))
+        page_size = min(max(int(request.GET.get("page_size", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        only_open = request.GET.get("open", "true") != "false"
+    except ValueError:
+        return HttpResponseBadRequest(f'Parametros: kind=LOW|HIGH, open=true|false, after:int, page_size:int (maximo {MAX_PAGE_SIZE})')
+
+    alerts = StockAlert.objects.filter(kind=kind, id__gt=after)
+    if only_open:
+        alerts = alerts.filter(resolved_at__isnull=True)
+    rows = list(alerts.order_by('id').values(
+        'id', 'product__name', 'kind', 'threshold', 'stock', 'product__total_stock', 'created_at', 'resolved_at'
+    )[:page_size])
+
+    return JsonResponse({
+        "results": [{
+            "id": row["id"], "product": row["product__name"], "kind": row["kind"], "threshold": row["threshold"],
+            "stock_at_alert": row["stock"], "current_stock": row["product__total_stock"],
+            "created_at": row["created_at"], "resolved_at": row["resolved_at"],
+        } for row in rows],
+        "next_after": rows[-1]["id"] if rows else after,
+    }, status=200)
+
+
+MAX_PLAN_LINES = 5000
+
+
+@require_http_methods(["GET"])
+def replenishment_plan(request):
+    """
+    Líneas de compra en borrador por proveedor: ?window_days=&lead_time=&review_days=&supplier=<nombre>.
+    El cálculo cubre todo el catálogo; la respuesta trae como máximo MAX_PLAN_LINES líneas.
+    """
+
+    try:
+        window_days = int(request.GET.get("window_days", DEFAULT_WINDOW_DAYS))
+        lead_time = float(request.GET.get("lead_time", DEFAULT_LEAD_TIME_DAYS))
+        review_days = float(request.GET.get("review_days", DEFAULT_REVIEW_DAYS))
+        if window_days <= 0 or lead_time < 0 or review_days < 0:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest('Parametros: window_days:int > 0, lead_time:float, review_days:float, supplier:str')
+
+    arrays, quantities = plan_replenishment(window_days, lead_time, review_days)
+    supplier_filter = request.GET.get("supplier")
+    suppliers = dict(Supplier.objects.values_list("pk", "name"))
+
+    grouped, truncated, count = {}, False, 0
+    for supplier_id, product_id, warehouse_id, units, unit_cost in draft_lines(arrays, quantities):
+        name = suppliers.get(supplier_id)
+        if supplier_filter and name != supplier_filter: continue
+        if count >= MAX_PLAN_LINES:
+            truncated = True
+            break
+        group = grouped.setdefault(name, {"supplier": name, "lines": [], "units": 0, "cost": 0.0})
+        group["lines"].append({"product_id": product_id, "warehouse_id": warehouse_id, "units": units, "unit_cost": round(unit_cost, 2)})
+        group["units"] += units
+        group["cost"] += units * unit_cost
+        count += 1
+
+    # nombres solo de las filas devueltas
+    product_names = dict(Product.objects.filter(pk__in={l["product_id"] for g in grouped.values() for l in g["lines"]}).values_list("pk", "name"))
+    warehouse_names = dict(Warehouse.objects.values_list("pk", "name"))
+    for group in grouped.values():
+        group["cost"] = round(group["cost"], 2)
+        for line in group["lines"]:
+            line["product"] = product_names.get(line["product_id"])
+            line["warehouse"] = warehouse_names.get(line["warehouse_id"])
+
+    return JsonResponse({
+        "params": {"window_days": window_days, "lead_time": lead_time, "review_days": review_days},
+        "suppliers": list(grouped.values()),
+        "lines": count,
+        "truncated": truncated,
+    }, status=200)
+
+
+MAX_REBALANCE_MOVES = 5000
+
+
+@require_http_methods(["GET"])
+def rebalancing_plan(request):
+    """
+    Traslados propuestos entre bodegas: ?window_days=&min_units=.
+    El stock de cada producto se reparte según la demanda por zona y los traslados minimizan unidades × km.
+    """
+
+    try:
+        window_days = int(request.GET.get("window_days", REBALANCE_WINDOW_DAYS))
+        min_units = int(request.GET.get("min_units", DEFAULT_MIN_UNITS))
+        if window_days <= 0 or min_units < 0:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest('Parametros: window_days:int > 0, min_units:int >= 0')
+
+    plan = plan_rebalance(window_days, min_units)
+    shown = min(len(plan), MAX_REBALANCE_MOVES)
+    product_names = dict(Product.objects.filter(pk__in=set(plan.product_ids[:shown].tolist())).values_list("pk", "name"))
+    warehouse_names = dict(Warehouse.objects.values_list("pk", "name"))
+
+    moves = [
+        {"product": product_names.get(product_id), "from": warehouse_names.get(source), "to": warehouse_names.get(target),
+         "units": units, "km": round(km, 2)}
+        for (product_id, source, target, units), km in zip(plan.moves(), plan.km[:shown].tolist())
+    ]
+    return JsonResponse({
+        "params": {"window_days": window_days, "min_units": min_units},
+        "moves": moves,
+        "count": len(plan),
+        "units": int(plan.units.sum()),
+        "unit_km": round(plan.unit_km(), 2),
+        "truncated": len(plan) > shown,
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def rebalancing_apply(request):
+    """
+    Aplica traslados {"moves": [{"product":str,"from":str,"to":str,"units":int}, ...]} en una sola transaccion.
+    Un traslado sin stock libre suficiente en el origen se rechaza y los demas se aplican.
+    """
+
+    start_time = time.time()
+
+    try:
+        payload = json.loads(request.body.decode("utf-8")) if request.body else {}
+        lines = payload["moves"]
+        if not isinstance(lines, list) or not lines or len(lines) > MAX_REBALANCE_MOVES:
+            raise ValueError
+        lines = [(str(line["product"]), str(line["from"]), str(line["to"]), int(line["units"])) for line in lines]
+    except (KeyError, ValueError, TypeError, AttributeError, json.JSONDecodeError):
+        return HttpResponseBadRequest(
+            f'Payload: {{"moves": [{{"product":str,"from":str,"to":str,"units":int}}, ...]}} (máximo {MAX_REBALANCE_MOVES} traslados)'
+        )
+
+    products = dict(Product.objects.filter(name__in={line[0] for line in lines}).values_list("name", "pk"))
+    warehouses = dict(Warehouse.objects.filter(name__in={w for line in lines for w in line[1:3]}).values_list("name", "pk"))
+    unknown = sorted({line[0] for line in lines} - set(products)) + sorted({w for line in lines for w in line[1:3]} - set(warehouses))
+    if unknown:
+        return JsonResponse({"error": f"No existen: {', '.join(unknown)}"}, status=400)
+
+    results = apply_moves((products[p], warehouses[f], warehouses[t], units) for p, f, t, units in lines)
+    applied = sum(1 for r in results if r["applied"])
+
+    return JsonResponse({
+        "results": results,
+        "applied": applied,
+        "rejected": len(results) - applied,
+        "execution_time_seconds": round(time.time() - start_time, 3),
+    }, status=200)